@@ -1,12 +1,10 @@
 from flask import Flask, redirect, url_for # <-- 1. 在這裡新增 redirect 和 url_for
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 import os
 
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
 bcrypt = Bcrypt()
 
@@ -15,18 +13,38 @@ login_manager.login_message = '請先登入以存取此頁面。'
 login_manager.login_message_category = 'info'
 
 
-def create_app():
+def create_app(config_name=None):
+    """config_name 為 development / testing / production，未指定時依環境變數 APP_ENV"""
+    from app.config import engine_options, get_config
+
     app = Flask(__name__)
-    
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a_default_very_secret_key')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.from_object(get_config(config_name))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    if not app.config.get('SLOW_QUERY_LOG'):
+        app.config['SLOW_QUERY_LOG'] = os.path.join(app.instance_path, 'slow_queries.log')
+    # 由 flask 指令啟動 (flask db、flask petty-cash ...) 時 Flask 會設定此環境變數；web worker 不會
+    from_cli = os.environ.get('FLASK_RUN_FROM_CLI') == 'true'
+
+    from app.startup import init_template_cache, startup_cli, warm_templates
+    init_template_cache(app)
 
     db.init_app(app)
-    migrate.init_app(app, db)
+    if from_cli:
+        # 只有 flask db 指令需要 Flask-Migrate；它會載入整個 alembic，約佔 worker 冷啟動的兩成
+        from flask_migrate import Migrate
+        Migrate(app, db)
     login_manager.init_app(app)
     bcrypt.init_app(app)
 
+    from app.database import init_database
+    init_database(app, db)
+
+    from app.instrumentation import init_sql_instrumentation
+    init_sql_instrumentation(app)
+
+    from app.compression import init_compression
+    init_compression(app)
+
     # --- ▼▼▼ 2. 在這裡新增首頁路由 ▼▼▼ ---
     @app.route('/')
     def index():
@@ -37,8 +55,21 @@ def create_app():
     # 在工廠函式內部，延遲載入並註冊藍圖
     from app.modules.user.routes import user_bp
     from app.modules.petty_cash.routes import petty_cash_bp
-    
+    from app.modules.invoice.routes import invoice_bp
+    from app.health import health_bp
+    from app.assets import assets_bp
+    if from_cli:
+        from app.modules.petty_cash import commands  # 註冊 flask petty-cash 指令 (須在註冊藍圖之前)
+        from app.modules.invoice import commands as invoice_commands  # flask invoice ...
+
     app.register_blueprint(user_bp, url_prefix='/user')
     app.register_blueprint(petty_cash_bp, url_prefix='/petty_cash')
+    app.register_blueprint(invoice_bp)
+    app.register_blueprint(health_bp)
+    app.register_blueprint(assets_bp)
+    app.cli.add_command(startup_cli)
+
+    if app.config['TEMPLATE_WARMUP'] and not from_cli:
+        warm_templates(app)
 
     return app
\ No newline at end of file
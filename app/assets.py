@@ -0,0 +1,314 @@
+"""
+靜態檔案建置與提供
+
+分公司的電腦網路很慢，有些甚至無法連上網際網路，頁面不能依賴 CDN。
+
+    flask assets vendor   將 Bootstrap、Bootstrap Icons、Chart.js 下載到 static/vendor (只需在可上網的電腦執行一次並提交)
+    flask assets build    將 static 下的檔案複製到 static/dist，檔名加上內容雜湊，
+                          並預先壓縮 (gzip，有安裝 brotli 套件時另產生 .br)，
+                          盤點用的鈔票圖片另產生縮小的 WebP (需要 Pillow 套件)
+
+檔名含內容雜湊，內容改變時網址跟著改變，因此 /assets/ 下的檔案可以讓瀏覽器快取一年 (immutable)，
+回應時依 Accept-Encoding 直接送出預先壓縮的檔案。
+模板以 asset_url('路徑') 取得網址：尚未 build 時退回一般的 /static/ 網址，第三方檔案尚未下載時退回 CDN。
+manifest 在啟動時載入，build 之後需重新啟動 (或 kill -HUP) 才會使用新的檔案。
+"""
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import urllib.request
+from collections import namedtuple
+import click
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+assets_bp = Blueprint('assets', __name__, cli_group='assets')
+
+# 第三方檔案：static 下的路徑 -> 下載網址 (版本固定，升級時修改這裡後重新 vendor)
+VENDOR_ASSETS = {
+    'vendor/bootstrap/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons/bootstrap-icons.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.min.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/fonts/bootstrap-icons.woff',
+    'vendor/chart.js/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+}
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# 只壓縮文字檔；圖片與 woff/woff2 字型本身已經壓縮過
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt'}
+# 產生 WebP 縮圖的圖片 (static 下的目錄) 與寬度 (px，一般與高解析度螢幕各一)
+WEBP_DIRS = ('images/',)
+WEBP_WIDTHS = (160, 320)
+WEBP_QUALITY = 80
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# version 為 manifest 內容的雜湊 (尚未 build 時為空字串)，頁面的 ETag 以此判斷引用的檔名是否改變
+AssetManifest = namedtuple('AssetManifest', 'files webp missing_vendor version')
+# brotli_bytes 在未安裝 brotli 套件時為 None
+BuildResult = namedtuple('BuildResult', 'files original_bytes gzip_bytes brotli_bytes webp skipped')
+
+_CSS_URL = re.compile(r'''url\(\s*(?:"([^"]*)"|'([^']*)'|([^)'"\s]+))\s*\)''')
+
+
+# --- 建置 ---
+
+def _content_hash(content):
+    return hashlib.sha256(content).hexdigest()[:12]
+
+
+def _fingerprinted(path, content, suffix=''):
+    """images/500.jpg -> images/500.<雜湊>.jpg；suffix 加在原檔名之後 (WebP 縮圖的寬度)"""
+    stem, extension = posixpath.splitext(path)
+    return f'{stem}{suffix}.{_content_hash(content)}{extension}'
+
+
+def _source_files(static_folder):
+    paths = []
+    for root, dirs, files in os.walk(static_folder):
+        relative_root = os.path.relpath(root, static_folder)
+        if relative_root == '.':
+            dirs[:] = [name for name in dirs if name != DIST_DIR]
+        for name in files:
+            paths.append(posixpath.normpath(posixpath.join(relative_root.replace(os.sep, '/'), name)))
+    # CSS 最後處理：其中引用的字型、圖片要先有加上雜湊的檔名
+    return sorted(paths, key=lambda path: (path.endswith('.css'), path))
+
+
+def _rewrite_css_urls(content, path, files):
+    """把 CSS 中以相對路徑引用的檔案改成加上雜湊的檔名 (原本的 ?版本參數 不再需要)"""
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        reference = next(group for group in match.groups() if group is not None)
+        if reference.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        target, _, fragment = reference.partition('#')
+        target = target.split('?', 1)[0]
+        hashed = files.get(posixpath.normpath(posixpath.join(directory, target)))
+        if hashed is None:
+            return match.group(0)
+        relative = posixpath.relpath(hashed, directory or '.')
+        return f'url("{relative}{"#" + fragment if fragment else ""}")'
+
+    return _CSS_URL.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+def _load_brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _load_pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _write(dist, path, content):
+    target = os.path.join(dist, *path.split('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(content)
+    return target
+
+
+def _write_compressed(target, content, brotli):
+    """寫入預先壓縮的 .gz / .br (壓縮後沒有變小就不寫)，回傳 (gzip 位元組數, brotli 位元組數)"""
+    sizes = [len(content), len(content)]
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        with open(target + '.gz', 'wb') as f:
+            f.write(compressed)
+        sizes[0] = len(compressed)
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            with open(target + '.br', 'wb') as f:
+                f.write(compressed)
+            sizes[1] = len(compressed)
+    return sizes
+
+
+def _webp_variants(source, Image):
+    """依 WEBP_WIDTHS 產生 (寬度, WebP 內容)；原圖較窄時只產生原尺寸一張"""
+    with Image.open(source) as image:
+        image.load()
+        widths = sorted({min(width, image.width) for width in WEBP_WIDTHS})
+        for width in widths:
+            resized = image.copy()
+            resized.thumbnail((width, image.height))
+            buffer = io.BytesIO()
+            resized.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=6)
+            yield width, buffer.getvalue()
+
+
+def build_assets(static_folder):
+    """重新產生 static/dist 與 manifest.json，回傳 BuildResult"""
+    dist = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    brotli, Image = _load_brotli(), _load_pillow()
+    skipped = []
+    if brotli is None:
+        skipped.append('未安裝 brotli 套件，只產生 .gz')
+    if Image is None:
+        skipped.append('未安裝 Pillow 套件，未產生 WebP 縮圖')
+
+    files, webp = {}, {}
+    original_bytes = gzip_bytes = brotli_bytes = 0
+    for path in _source_files(static_folder):
+        with open(os.path.join(static_folder, *path.split('/')), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = _rewrite_css_urls(content, path, files)
+        files[path] = _fingerprinted(path, content)
+        target = _write(dist, files[path], content)
+        if posixpath.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+            gzip_size, brotli_size = _write_compressed(target, content, brotli)
+            original_bytes += len(content)
+            gzip_bytes += gzip_size
+            brotli_bytes += brotli_size
+
+        if Image is not None and path.startswith(WEBP_DIRS) and path.lower().endswith(('.jpg', '.jpeg', '.png')):
+            variants = []
+            for width, data in _webp_variants(os.path.join(static_folder, *path.split('/')), Image):
+                hashed = _fingerprinted(posixpath.splitext(path)[0] + '.webp', data, suffix=f'-{width}w')
+                _write(dist, hashed, data)
+                variants.append([hashed, width])
+            webp[path] = variants
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'files': files, 'webp': webp}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return BuildResult(
+        len(files), original_bytes, gzip_bytes, brotli_bytes if brotli is not None else None,
+        sum(len(variants) for variants in webp.values()), skipped
+    )
+
+
+def vendor_assets(static_folder, force=False, timeout=30):
+    """下載 VENDOR_ASSETS 中尚未存在 (或 force) 的檔案，回傳下載的路徑清單"""
+    downloaded = []
+    for path, url in VENDOR_ASSETS.items():
+        target = os.path.join(static_folder, *path.split('/'))
+        if os.path.exists(target) and not force:
+            continue
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            content = response.read()
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(target + '.tmp', target)
+        downloaded.append(path)
+    return downloaded
+
+
+# --- 執行期 ---
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME), 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        raw = b''
+    data = json.loads(raw) if raw else {}
+    missing_vendor = frozenset(
+        path for path in VENDOR_ASSETS if not os.path.exists(os.path.join(static_folder, *path.split('/')))
+    )
+    return AssetManifest(data.get('files', {}), data.get('webp', {}), missing_vendor, _content_hash(raw) if raw else '')
+
+
+def _manifest():
+    manifest = current_app.extensions.get('assets')
+    if manifest is None:
+        manifest = current_app.extensions.setdefault('assets', load_manifest(current_app.static_folder))
+    return manifest
+
+
+def asset_version():
+    return _manifest().version
+
+
+@assets_bp.app_template_global()
+def asset_url(path):
+    """static 下檔案的網址：已 build 時為加上雜湊的 /assets/ 網址"""
+    manifest = _manifest()
+    hashed = manifest.files.get(path)
+    if hashed is not None:
+        return url_for('assets.dist', filename=hashed)
+    if path in manifest.missing_vendor:
+        # 尚未執行 flask assets vendor 時暫時使用 CDN
+        return VENDOR_ASSETS[path]
+    return url_for('static', filename=path)
+
+
+@assets_bp.app_template_global()
+def asset_srcset(path):
+    """圖片的 WebP 縮圖 srcset ("網址 160w, 網址 320w")；沒有縮圖時為空字串"""
+    return ', '.join(
+        f"{url_for('assets.dist', filename=hashed)} {width}w" for hashed, width in _manifest().webp.get(path, ())
+    )
+
+
+@assets_bp.route('/assets/<path:filename>')
+def dist(filename):
+    """加上雜湊的檔案：依 Accept-Encoding 送出預先壓縮的版本，快取一年"""
+    folder = os.path.join(current_app.static_folder, DIST_DIR)
+    served, encoding = filename, None
+    for candidate, extension in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(folder, filename + extension)
+        if request.accept_encodings[candidate] and path is not None and os.path.isfile(path):
+            served, encoding = filename + extension, candidate
+            break
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(folder, served, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# --- 指令 ---
+
+@assets_bp.cli.command('vendor')
+@click.option('--force', is_flag=True, help='已存在的檔案也重新下載')
+def vendor_command(force):
+    """下載第三方 CSS/JS/字型到 static/vendor"""
+    try:
+        downloaded = vendor_assets(current_app.static_folder, force=force)
+    except OSError as e:
+        raise click.ClickException(f'下載失敗：{e}')
+    for path in downloaded:
+        click.echo(f'已下載 {path}')
+    click.echo(f'完成，下載 {len(downloaded)} 個檔案 (共 {len(VENDOR_ASSETS)} 個)。')
+
+
+@assets_bp.cli.command('build')
+def build_command():
+    """產生加上雜湊檔名、預先壓縮的靜態檔案 (static/dist)"""
+    missing = load_manifest(current_app.static_folder).missing_vendor
+    if missing:
+        click.echo(f'警告：尚未下載 {len(missing)} 個第三方檔案，頁面會繼續使用 CDN (請執行 flask assets vendor)。')
+    result = build_assets(current_app.static_folder)
+    click.echo(f'已產生 {result.files} 個檔案、{result.webp} 張 WebP 縮圖。')
+    if result.original_bytes:
+        sizes = f'gzip {result.gzip_bytes:,} bytes'
+        if result.brotli_bytes is not None:
+            sizes += f' / brotli {result.brotli_bytes:,} bytes'
+        click.echo(f'文字檔 {result.original_bytes:,} bytes -> {sizes}')
+    for message in result.skipped:
+        click.echo(f'略過：{message}')
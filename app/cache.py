@@ -0,0 +1,126 @@
+"""
+行程內快取與版本戳記
+
+很少變動的資料 (例如費用分類) 可以放在每個 worker 行程自己的記憶體裡，
+但多個 worker 之間不共享記憶體，某個 worker 修改資料後其他 worker 不會知道。
+因此在 cache_versions 表為每種快取保存一個版本號：修改資料時在同一個資料庫交易內把版本號加一，
+各 worker 讀取快取前先以主鍵查一次版本號 (一列、一個整數)，版本不同才重新載入整份資料 (VersionedCache)。
+可以容忍短暫延遲的資料則只設定存活時間，不查詢版本號 (TTLCache)。
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import insert, select, update
+from app import db
+
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String(50), primary_key=True, comment='快取名稱')
+    version = db.Column(db.Integer, nullable=False, default=0, comment='版本號，資料變動時加一')
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+
+_versions = CacheVersion.__table__
+
+
+def current_version(name, connection=None):
+    """目前的版本號；尚未有紀錄時為 0"""
+    connection = connection or db.session.connection()
+    return connection.scalar(select(_versions.c.version).where(_versions.c.name == name)) or 0
+
+
+def bump_version(name, connection=None):
+    """把版本號加一 (在呼叫端的資料庫交易內，commit 後其他 worker 才看得到)"""
+    connection = connection or db.session.connection()
+    result = connection.execute(
+        update(_versions).where(_versions.c.name == name).values(version=_versions.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(_versions).values(name=name, version=1))
+
+
+class VersionedCache:
+    """
+    以版本戳記判斷是否過期的行程內快取；loader 為重新載入資料的函式。
+
+    get(max_age) 時，若距離上次確認版本號不到 max_age 秒就直接使用記憶體中的資料，
+    否則以主鍵查一次版本號，版本不同才呼叫 loader。max_age=0 表示每次都確認版本號。
+    同一行程內修改資料並 commit 後呼叫 invalidate()，下次讀取就會重新載入。
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._checked_at = None
+
+    def get(self, max_age=0):
+        now = time.monotonic()
+        with self._lock:
+            value, version, checked_at = self._value, self._version, self._checked_at
+        if version is not None and max_age > 0 and now - checked_at < max_age:
+            return value
+
+        # 先讀版本號再載入資料：兩者之間若有修改，記下的是舊版本號，下次讀取會再重新載入
+        latest = current_version(self.name)
+        if version is None or latest != version:
+            value = self.loader()
+        with self._lock:
+            self._value, self._version, self._checked_at = value, latest, now
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = self._version = self._checked_at = None
+
+
+class TTLCache:
+    """
+    容量有限 (超過 maxsize 時淘汰最久未使用的項目) 且每個項目只保留 ttl 秒的行程內快取。
+    適合可以容忍短暫延遲、但無法在各 worker 之間同步失效的資料。
+    """
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        """有效的快取值；沒有或已過期時回傳 None"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= now:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + self.ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,135 @@
+"""
+回應壓縮 (gzip / brotli)
+
+列表與報表頁面是大量重複的 Bootstrap 標記，壓縮後約只剩十分之一，對分公司的慢速線路差異很大。
+after_request 依 Accept-Encoding 選擇壓縮方式 (有安裝 brotli 套件且瀏覽器支援時優先使用 br)：
+
+- 只壓縮 COMPRESS_MIMETYPES 中的文字類型；圖片、xlsx、字型等本身已經壓縮過的內容不處理
+- 小於 COMPRESS_MIN_SIZE 的回應不壓縮 (省下的位元組不值得花的 CPU)
+- 已經帶有 Content-Encoding (/assets/ 預先壓縮的檔案)、send_file 直接傳送檔案、
+  304/204/206 與 Cache-Control: no-transform 的回應不處理
+- 串流回應 (匯出) 事先不知道大小，一律邊產生邊壓縮，不會整份先放進記憶體；
+  每累積 STREAM_FLUSH_BYTES 就 flush 一次，瀏覽器仍可逐段收到資料，不會等到最後才一次送出
+
+壓縮後的內容與原本的位元組不同，強 ETag 改為弱 ETag (W/"...")。
+"""
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # 選用套件；未安裝時只提供 gzip
+    brotli = None
+
+_NOT_COMPRESSED_STATUS = (204, 206, 304)
+# 串流回應每累積這麼多未壓縮的位元組就送出一段 (太小會降低壓縮率)
+STREAM_FLUSH_BYTES = 16 * 1024
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encodings):
+    """依 Accept-Encoding 的權重選擇壓縮方式，權重相同時依 available_encodings 的順序；都不接受時為 None"""
+    best, best_quality = None, 0
+    for encoding in available_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class StreamCompressor:
+    """
+    逐段壓縮；compress() 回傳目前可以送出的位元組 (可能為空)，
+    flush() 回傳到目前為止所有輸入的壓縮結果 (之後仍可繼續壓縮)，finish() 回傳剩餘的部分
+    """
+
+    def __init__(self, encoding, level=6, quality=4):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=quality)
+        else:
+            # wbits=31：gzip 格式 (含標頭與 CRC)
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.finish() if self.encoding == 'br' else self._compressor.flush()
+
+
+def compress_body(data, encoding, level=6, quality=4):
+    compressor = StreamCompressor(encoding, level, quality)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _compressed_stream(iterable, compressor, charset='utf-8', flush_bytes=STREAM_FLUSH_BYTES):
+    try:
+        pending = 0
+        for chunk in iterable:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            # gzip / brotli 會在內部累積資料，不 flush 的話整份匯出會在最後才一次送出
+            if pending >= flush_bytes:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response):
+    """after_request：符合條件時就地壓縮回應"""
+    config = current_app.config
+    if not config['COMPRESS_RESPONSES'] or response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return response
+    # 同一個網址會依 Accept-Encoding 回應不同內容，不論這次是否壓縮都要告知快取
+    response.vary.add('Accept-Encoding')
+    if (
+        request.method == 'HEAD'
+        or response.status_code < 200
+        or response.status_code in _NOT_COMPRESSED_STATUS
+        or 'Content-Encoding' in response.headers
+        or response.direct_passthrough
+        or response.cache_control.no_transform
+    ):
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    level, quality = config['COMPRESS_LEVEL'], config['COMPRESS_BROTLI_QUALITY']
+    if response.is_streamed:
+        response.response = _compressed_stream(response.response, StreamCompressor(encoding, level, quality))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress_body(data, encoding, level, quality))
+    response.content_encoding = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
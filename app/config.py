@@ -0,0 +1,127 @@
+"""
+應用程式設定
+
+依環境變數 APP_ENV 選擇設定類別 (development / testing / production，預設 development)，
+個別設定仍可用環境變數覆寫。SQLite 的連線參數 (PRAGMA) 在每條新連線建立時套用，
+見 app.database。
+"""
+import os
+from sqlalchemy.engine import make_url
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'a_default_very_secret_key')
+    # 相對路徑的 SQLite 資料庫位於 instance 資料夾
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'connect_args': {
+            # Python sqlite3 驅動遇到鎖定時的等待秒數 (與 busy_timeout 一致)
+            'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 15000) / 1000,
+        },
+    }
+    # 連線池 (QueuePool) 參數：只有檔案或伺服器資料庫才加入 SQLALCHEMY_ENGINE_OPTIONS，
+    # 記憶體中的 SQLite (sqlite://) 使用 StaticPool，不接受這些參數
+    SQLALCHEMY_POOL_OPTIONS = {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': 30,
+    }
+    # 每條 SQLite 連線建立時執行的 PRAGMA
+    # WAL：讀取不會被寫入擋住；synchronous=NORMAL：WAL 模式下仍可保證一致性，只是斷電時可能遺失最後幾筆交易
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 15000),
+        'cache_size': -_env_int('SQLITE_CACHE_KB', 64000),  # 負數的單位為 KiB
+        'mmap_size': _env_int('SQLITE_MMAP_BYTES', 256 * 1024 * 1024),
+        'temp_store': 'MEMORY',
+    }
+
+    # SQL 統計：超過門檻 (毫秒) 的查詢寫入慢查詢紀錄；SQL_DEBUG_FOOTER=1 時主管可在頁尾看到統計
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')  # 未設定時為 instance/slow_queries.log
+    SQL_DEBUG_FOOTER = os.environ.get('SQL_DEBUG_FOOTER') == '1'
+    # 費用分類清單快取：距離上次確認版本號不到此秒數時直接使用記憶體中的清單 (送出表單時一律確認)
+    CATEGORY_CACHE_MAX_AGE = float(os.environ.get('CATEGORY_CACHE_MAX_AGE', 30))
+    # 登入使用者快取 (current_user)：最多保留的人數與秒數；修改使用者後其他 worker 最晚在此秒數後看到新的角色
+    USER_CACHE_SIZE = _env_int('USER_CACHE_SIZE', 256)
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))
+    # 密碼雜湊成本 (bcrypt log rounds，每加 1 計算時間加倍) 與每個行程同時進行的雜湊數上限
+    BCRYPT_LOG_ROUNDS = _env_int('BCRYPT_LOG_ROUNDS', 12)
+    PASSWORD_HASH_CONCURRENCY = _env_int('PASSWORD_HASH_CONCURRENCY', 2)
+    # 交易總覽與簽核儀表板輪詢交易異動的間隔 (秒)
+    CHANGE_FEED_POLL_SECONDS = float(os.environ.get('CHANGE_FEED_POLL_SECONDS', 15))
+    # 明細與報表頁的 ETag / 304；模板變更部署時調整 HTTP_CACHE_VERSION 讓瀏覽器中的舊頁面失效
+    HTTP_CONDITIONAL_CACHE = os.environ.get('HTTP_CONDITIONAL_CACHE', '1') == '1'
+    HTTP_CACHE_VERSION = os.environ.get('HTTP_CACHE_VERSION', '1')
+    # 回應壓縮 (app/compression.py)：gzip 等級 1-9、brotli 品質 0-11；已經壓縮過的類型 (圖片、xlsx、字型) 不要加入
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+    COMPRESS_MIN_SIZE = _env_int('COMPRESS_MIN_SIZE', 1024)
+    COMPRESS_LEVEL = _env_int('COMPRESS_LEVEL', 6)
+    COMPRESS_BROTLI_QUALITY = _env_int('COMPRESS_BROTLI_QUALITY', 4)
+    COMPRESS_MIMETYPES = (
+        'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript',
+        'application/json', 'application/x-ndjson', 'application/xml', 'image/svg+xml',
+    )
+    # worker 冷啟動 (app/startup.py)：模板 bytecode 快取目錄 (未設定時為 instance/jinja_cache，空字串表示不使用)、
+    # 啟動時預先載入所有模板、flask startup check 的冷啟動時間上限 (毫秒)
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get('JINJA_BYTECODE_CACHE_DIR')
+    TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', '0') == '1'
+    STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1500))
+    # 會計年度起始月份 (報表的「會計年度」期間使用)
+    FISCAL_YEAR_START_MONTH = _env_int('FISCAL_YEAR_START_MONTH', 1)
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite:///test.db')
+    SQLITE_PRAGMAS = dict(Config.SQLITE_PRAGMAS, mmap_size=0)
+    # bcrypt 允許的最低成本，測試時建立帳號與登入不必等待雜湊
+    BCRYPT_LOG_ROUNDS = 4
+
+
+class ProductionConfig(Config):
+    SESSION_COOKIE_HTTPONLY = True
+    REMEMBER_COOKIE_HTTPONLY = True
+    TEMPLATE_WARMUP = os.environ.get('TEMPLATE_WARMUP', '1') == '1'
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+
+def is_memory_database(uri):
+    """sqlite://、sqlite:///:memory: 或 mode=memory 的 URI 檔名"""
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        return False
+    return url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'
+
+
+def engine_options(config):
+    """依資料庫網址組合實際傳給 create_engine 的參數"""
+    options = dict(config['SQLALCHEMY_ENGINE_OPTIONS'])
+    if not is_memory_database(config['SQLALCHEMY_DATABASE_URI']):
+        options.update(config['SQLALCHEMY_POOL_OPTIONS'])
+    return options
+
+
+def get_config(name=None):
+    name = name or os.environ.get('APP_ENV', 'development')
+    try:
+        return CONFIGS[name]
+    except KeyError:
+        raise ValueError(f'未知的 APP_ENV：{name} (可用：{", ".join(CONFIGS)})')
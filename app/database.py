@@ -0,0 +1,37 @@
+"""
+SQLite 連線調校
+
+每條新的資料庫連線建立時套用 config.SQLITE_PRAGMAS (WAL、busy_timeout、快取、mmap 等)，
+讓多個寫入者 (盤點、簽核) 同時作業時改為等待鎖定而不是立刻出現 "database is locked"，
+讀取也不會被寫入擋住。
+"""
+from sqlalchemy import event
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+def install_sqlite_pragmas(engine, pragmas):
+    """在 engine 上註冊 connect 事件；非 SQLite 資料庫不做任何事"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+
+def read_sqlite_pragmas(connection, names):
+    """讀回目前連線的 PRAGMA 值 (檢查設定是否生效)"""
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in names}
+
+
+def init_database(app, db):
+    with app.app_context():
+        install_sqlite_pragmas(db.engine, app.config.get('SQLITE_PRAGMAS'))
@@ -0,0 +1,31 @@
+"""
+健康檢查端點 (不需登入)，供負載平衡器與程序管理工具使用
+
+/healthz  存活檢查：程序能回應請求即為正常
+/readyz   就緒檢查：另外確認資料庫可以連線，失敗時回傳 503，讓負載平衡器暫停轉送請求
+"""
+import time
+from flask import Blueprint, current_app, jsonify
+from sqlalchemy import text
+from app import db
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/healthz')
+def healthz():
+    return jsonify(status='ok')
+
+
+@health_bp.route('/readyz')
+def readyz():
+    started = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+    except Exception:
+        db.session.rollback()
+        # 不需登入的端點，錯誤內容 (資料庫路徑、驅動程式訊息) 只寫入紀錄檔，不回傳
+        current_app.logger.exception('就緒檢查：資料庫無法連線')
+        return jsonify(status='unavailable', database='error'), 503
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+    return jsonify(status='ok', database='ok', database_ms=elapsed_ms)
@@ -0,0 +1,73 @@
+"""
+HTTP 條件式快取 (ETag)
+
+內容很少變動的頁面 (已核准的交易明細、盤點紀錄、已結帳月份的報表) 先以一次小查詢取得
+相關資料的版本戳記，組成 ETag；瀏覽器帶著相同的 If-None-Match 回來時直接回應 304，
+不執行頁面本身的查詢，也不渲染模板。
+
+頁面內容會依登入者 (申請人 / 主管看到的按鈕不同、導覽列的名稱) 而不同，
+ETag 一律包含使用者 ID 與角色，並以 Cache-Control: private 限制只有瀏覽器本身可以快取。
+版面 (模板) 變更部署時調整 HTTP_CACHE_VERSION，讓既有的 ETag 全部失效；
+重新 flask assets build (CSS/JS 檔名改變) 時則自動失效。
+"""
+import hashlib
+from datetime import date
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from app.assets import asset_version
+
+
+class ConditionalPage:
+    """
+    單一頁面的條件式回應；parts 為頁面名稱、參數與資料的版本戳記。
+
+        page = ConditionalPage('transaction_detail', transaction_id, *versions)
+        not_modified = page.not_modified()
+        if not_modified:
+            return not_modified
+        ...
+        return page.respond(render_template(...))
+    """
+
+    def __init__(self, *parts, last_modified=None):
+        self.etag = self._make_etag(parts)
+        self.last_modified = last_modified
+        # 有待顯示的 flash 訊息時，頁面內容只會出現一次，不能快取也不能回應 304；
+        # SQL 統計頁尾每次內容都不同，同樣不使用
+        self.enabled = (
+            current_app.config['HTTP_CONDITIONAL_CACHE']
+            and not current_app.config.get('SQL_DEBUG_FOOTER')
+            and '_flashes' not in session
+        )
+
+    @staticmethod
+    def _make_etag(parts):
+        scope = (
+            current_app.config['HTTP_CACHE_VERSION'], asset_version(), date.today().isoformat(),
+            current_user.get_id(), current_user.role.name,
+        )
+        digest = hashlib.sha1(repr((scope, parts)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _set_headers(self, response):
+        response.set_etag(self.etag)
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified
+        # 每次使用前都必須向伺服器確認 (no-cache)，且只能存在瀏覽器 (private)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add('Cookie')
+        return response
+
+    def not_modified(self):
+        """If-None-Match 與目前的 ETag 相同時回傳 304 回應，否則回傳 None"""
+        # 壓縮後的回應帶的是弱 ETag (W/"...")，If-None-Match 本來就以弱比較判斷
+        if not self.enabled or not request.if_none_match.contains_weak(self.etag):
+            return None
+        return self._set_headers(current_app.response_class(status=304))
+
+    def respond(self, body):
+        response = make_response(body)
+        if self.enabled and response.status_code == 200:
+            self._set_headers(response)
+        return response
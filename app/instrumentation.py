@@ -0,0 +1,136 @@
+"""
+SQL 執行統計
+
+透過 SQLAlchemy 的 cursor 事件計算一段程式碼或一個請求實際送出多少 SQL 敘述、花了多少時間。
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from app import db
+
+
+class QueryCounter:
+    """在 with 區塊期間累計送到資料庫的 SQL 敘述"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine):
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._before_cursor_execute)
+
+
+# --- 每個請求的 SQL 統計 (Server-Timing 標頭、慢查詢紀錄、主管除錯頁尾) ---
+
+slow_query_logger = logging.getLogger('app.slow_query')
+
+
+class RequestSqlStats:
+    """單一請求內的 SQL 次數與耗時"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.started_at = time.perf_counter()
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started_at) * 1000
+
+
+def current_sql_stats():
+    """目前請求的 SQL 統計；不在請求中時回傳 None"""
+    if not has_request_context():
+        return None
+    return g.get('_sql_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 開始時間記在這次執行的 context 上 (每個敘述一個)；敘述失敗時 after 事件不會執行，
+    # 但 context 隨之丟棄，不會在連線池的連線上留下資料
+    started = time.perf_counter()
+    if context is not None:
+        context._query_started_at = started
+    else:
+        conn.info['_query_started_at'] = started
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        started = getattr(context, '_query_started_at', None)
+    else:
+        started = conn.info.pop('_query_started_at', None)
+    elapsed = time.perf_counter() - started if started is not None else 0.0
+    stats = current_sql_stats()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+
+    threshold = current_app.config.get('SLOW_QUERY_THRESHOLD_MS') if has_app_context() else None
+    if threshold is not None and elapsed * 1000 >= threshold:
+        endpoint = request.endpoint if has_request_context() else '-'
+        slow_query_logger.warning(
+            '%.1fms endpoint=%s %s', elapsed * 1000, endpoint, ' '.join(statement.split())
+        )
+
+
+def _configure_slow_query_log(path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    for handler in slow_query_logger.handlers:
+        if getattr(handler, 'baseFilename', None) == os.path.abspath(path):
+            return
+    handler = RotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.setLevel(logging.WARNING)
+
+
+def init_sql_instrumentation(app):
+    """掛上 SQLAlchemy cursor 事件並在回應加上 Server-Timing 標頭"""
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if app.config.get('SLOW_QUERY_LOG'):
+        _configure_slow_query_log(app.config['SLOW_QUERY_LOG'])
+
+    @app.before_request
+    def _start_sql_stats():
+        g._sql_stats = RequestSqlStats()
+
+    @app.after_request
+    def _add_server_timing(response):
+        stats = current_sql_stats()
+        if stats is not None:
+            response.headers.add(
+                'Server-Timing',
+                f'db;dur={stats.duration_ms:.1f};desc="{stats.count} queries", app;dur={stats.total_ms:.1f}'
+            )
+        return response
+
+    @app.context_processor
+    def _inject_sql_stats():
+        return {'sql_stats': current_sql_stats}
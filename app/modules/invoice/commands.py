@@ -0,0 +1,32 @@
+"""發票模組的 flask 指令 (flask invoice ...)"""
+import time
+import click
+from app import db
+from .routes import invoice_bp
+from .reconcile import DEFAULT_WINDOW_DAYS, MAX_ROUNDS, reconcile_invoices
+
+
+@invoice_bp.cli.command('reconcile')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='只處理此日期 (含) 之後的發票')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), help='只處理此日期 (含) 之前的發票')
+@click.option('--window-days', default=DEFAULT_WINDOW_DAYS, show_default=True, help='發票日期與交易日期最多相差的天數')
+@click.option('--max-rounds', default=MAX_ROUNDS, show_default=True, help='重複對應的輪數上限')
+@click.option('--dry-run', is_flag=True, help='只顯示結果，不寫入資料庫')
+def reconcile_command(since, until, window_days, max_rounds, dry_run):
+    """將未對應的發票批次對應到已核准的支出，無法確定的列入待確認清單"""
+    started = time.perf_counter()
+    try:
+        result = reconcile_invoices(
+            window_days, since.date() if since else None, until.date() if until else None, max_rounds
+        )
+    except Exception:
+        db.session.rollback()
+        raise
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    elapsed = time.perf_counter() - started
+    click.echo(f'{"(試算，未寫入) " if dry_run else ""}未對應發票 {result.invoices} 張：'
+               f'自動對應 {result.linked}、待確認 {result.queued}、找不到候選 {result.unmatched}'
+               f' ({result.rounds} 輪，{elapsed:.2f} 秒)')
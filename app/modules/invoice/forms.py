@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, DateField, SelectField, DecimalField, SubmitField
-from wtforms.validators import DataRequired, Optional, Length
+from wtforms import StringField, DateField, SelectField, DecimalField, SubmitField, IntegerField, HiddenField
+from wtforms.validators import DataRequired, InputRequired, Optional, Length, NumberRange
 from .models import InvoiceType
 
 class InvoiceForm(FlaskForm):
@@ -17,4 +17,15 @@ class InvoiceForm(FlaskForm):
     business_number = StringField('統一編號', validators=[Optional(), Length(max=20)])
     sales_amount = DecimalField('銷售額(未稅)', validators=[DataRequired()])
     tax_amount = DecimalField('稅額', validators=[DataRequired()])
-    submit = SubmitField('儲存發票')
\ No newline at end of file
+    submit = SubmitField('儲存發票')
+
+class ReconcileForm(FlaskForm):
+    """發票對帳表單：依發票日期限定範圍 (可留空)；容許天數 0 表示只對應同一天的交易"""
+    since = DateField('發票日期起', validators=[Optional()], format='%Y-%m-%d')
+    until = DateField('發票日期迄', validators=[Optional()], format='%Y-%m-%d')
+    window_days = IntegerField('日期容許天數', default=7, validators=[InputRequired(), NumberRange(min=0, max=60)])
+    submit = SubmitField('執行對帳')
+
+class InvoiceLinkForm(FlaskForm):
+    """人工確認對應的交易"""
+    transaction_id = HiddenField('交易', validators=[DataRequired()])
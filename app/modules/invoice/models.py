@@ -12,6 +12,12 @@ class InvoiceType(enum.Enum):
 
 class Invoice(db.Model):
     __tablename__ = 'invoices'
+    __table_args__ = (
+        # 發票報表：WHERE invoice_date 區間
+        db.Index('ix_invoices_invoice_date', 'invoice_date'),
+        # 對帳：WHERE transaction_id IS NULL (未對應的發票)、某筆交易是否已有發票
+        db.Index('ix_invoices_transaction_id_date', 'transaction_id', 'invoice_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     invoice_type = db.Column(db.Enum(InvoiceType), nullable=False, default=InvoiceType.CASH_REGISTER, comment='發票類型')
@@ -35,4 +41,22 @@ class Invoice(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
-        return f'<Invoice {self.track}-{self.number}>'
\ No newline at end of file
+        return f'<Invoice {self.track}-{self.number}>'
+
+
+class InvoiceMatchReview(db.Model):
+    """自動對帳無法確定的發票與候選支出，待人工確認 (每次對帳重新產生)"""
+    __tablename__ = 'invoice_match_reviews'
+
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id', ondelete='CASCADE'), nullable=False, index=True, comment='發票ID')
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id', ondelete='CASCADE'), nullable=False, index=True, comment='候選支出交易ID')
+    vendor_match = db.Column(db.Boolean, nullable=False, default=False, comment='摘要是否包含發票的廠商名稱')
+    day_difference = db.Column(db.Integer, nullable=False, comment='發票日期與交易日期相差天數')
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    invoice = db.relationship('Invoice', backref=db.backref('match_reviews', passive_deletes=True))
+    transaction = db.relationship('Transaction')
+
+    def __repr__(self):
+        return f'<InvoiceMatchReview invoice={self.invoice_id} transaction={self.transaction_id}>'
\ No newline at end of file
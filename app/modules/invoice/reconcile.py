@@ -0,0 +1,178 @@
+"""
+發票對帳
+
+將尚未對應的發票批次對應到已核准的支出交易。每張發票的候選交易由一個 JOIN 一次找出：
+
+- 交易為已核准的支出，金額 (支出以負數儲存) 與發票總金額相同
+- 交易日期在發票日期前後 window_days 天內
+- 交易尚未對應到其他發票
+
+候選依「摘要包含發票的廠商名稱」優先、日期相差天數越少越好排序 (視窗函式，在資料庫中計算)。
+發票與交易互為對方唯一的最佳候選時直接對應；廠商名稱不符時，只有雙方都只有這一個候選才對應。
+其餘有候選的發票寫入 invoice_match_reviews 待人工確認。
+
+對應完成後，被對應掉的交易可能讓其他發票只剩一個候選，因此重複數輪，直到沒有新的對應為止。
+每一輪只有一個 UPDATE ... FROM，不論發票數量多少，不會逐筆查詢。
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import Integer, and_, case, cast, delete, exists, func, insert, literal, or_, select, update
+from sqlalchemy.orm import aliased
+from app import db
+from app.modules.petty_cash.models import Transaction, TransactionType, ApprovalStatus
+from .models import Invoice, InvoiceMatchReview
+
+# 發票日期與交易日期最多相差的天數
+DEFAULT_WINDOW_DAYS = 7
+# 重複對應的輪數上限 (通常兩三輪後就不會再有新的對應)
+MAX_ROUNDS = 5
+
+ReconcileResult = namedtuple('ReconcileResult', 'invoices linked queued unmatched rounds')
+
+_invoices = Invoice.__table__
+_transactions = Transaction.__table__
+_reviews = InvoiceMatchReview.__table__
+
+
+def _scope(since=None, until=None):
+    """對帳範圍 (依發票日期)；未指定時為全部"""
+    conditions = []
+    if since is not None:
+        conditions.append(_invoices.c.invoice_date >= since)
+    if until is not None:
+        conditions.append(_invoices.c.invoice_date <= until)
+    return and_(True, *conditions)
+
+
+def candidate_query(window_days=DEFAULT_WINDOW_DAYS, since=None, until=None):
+    """未對應的發票與其候選交易 (invoice_id, transaction_id, vendor_match, day_difference)"""
+    linked = _invoices.alias('linked')
+    vendor = _invoices.c.vendor_name
+    return (
+        select(
+            _invoices.c.id.label('invoice_id'),
+            _transactions.c.id.label('transaction_id'),
+            case(
+                (and_(vendor.is_not(None), vendor != '', func.instr(_transactions.c.description, vendor) > 0), 1),
+                else_=0,
+            ).label('vendor_match'),
+            func.abs(cast(
+                func.julianday(_transactions.c.transaction_date) - func.julianday(_invoices.c.invoice_date), Integer
+            )).label('day_difference'),
+        )
+        .select_from(_invoices.join(_transactions, and_(
+            # 與 ix_transactions_type_status_amount_date 的欄位順序一致
+            _transactions.c.transaction_type == TransactionType.EXPENDITURE,
+            _transactions.c.status == ApprovalStatus.APPROVED,
+            _transactions.c.total_amount == -_invoices.c.total_amount,
+            _transactions.c.transaction_date.between(
+                func.date(_invoices.c.invoice_date, f'-{window_days} days'),
+                func.date(_invoices.c.invoice_date, f'+{window_days} days'),
+            ),
+        )))
+        .where(
+            _invoices.c.transaction_id.is_(None),
+            _scope(since, until),
+            ~exists().where(linked.c.transaction_id == _transactions.c.id),
+        )
+    )
+
+
+def _confident_pairs(candidates):
+    """候選中可以直接對應的 (invoice_id, transaction_id)"""
+    c = candidates.subquery('candidates')
+    ranking = (c.c.vendor_match.desc(), c.c.day_difference)
+    ranked = select(
+        c.c.invoice_id, c.c.transaction_id, c.c.vendor_match,
+        func.rank().over(partition_by=c.c.invoice_id, order_by=ranking).label('invoice_rank'),
+        func.count().over(partition_by=(c.c.invoice_id, c.c.vendor_match, c.c.day_difference)).label('invoice_ties'),
+        func.count().over(partition_by=c.c.invoice_id).label('invoice_candidates'),
+        func.rank().over(partition_by=c.c.transaction_id, order_by=ranking).label('transaction_rank'),
+        func.count().over(partition_by=(c.c.transaction_id, c.c.vendor_match, c.c.day_difference)).label('transaction_ties'),
+        func.count().over(partition_by=c.c.transaction_id).label('transaction_candidates'),
+    ).subquery('ranked')
+    return select(ranked.c.invoice_id, ranked.c.transaction_id).where(
+        ranked.c.invoice_rank == 1, ranked.c.invoice_ties == 1,
+        ranked.c.transaction_rank == 1, ranked.c.transaction_ties == 1,
+        or_(
+            ranked.c.vendor_match == 1,
+            and_(ranked.c.invoice_candidates == 1, ranked.c.transaction_candidates == 1),
+        ),
+    ).subquery('confident')
+
+
+def reconcile_invoices(window_days=DEFAULT_WINDOW_DAYS, since=None, until=None, max_rounds=MAX_ROUNDS):
+    """
+    對應範圍內未對應的發票，並重新產生待確認清單，回傳 ReconcileResult。
+    由呼叫端 commit (或 rollback 只看結果)。
+    """
+    connection = db.session.connection()
+    scope = _scope(since, until)
+    unlinked_before = connection.scalar(
+        select(func.count()).select_from(_invoices).where(_invoices.c.transaction_id.is_(None), scope)
+    )
+
+    linked = rounds = 0
+    while rounds < max_rounds:
+        rounds += 1
+        confident = _confident_pairs(candidate_query(window_days, since, until))
+        # transaction_id IS NULL：同一時間有人手動對應的發票不會被覆蓋
+        count = connection.execute(
+            update(_invoices)
+            .where(_invoices.c.id == confident.c.invoice_id, _invoices.c.transaction_id.is_(None))
+            .values(transaction_id=confident.c.transaction_id)
+        ).rowcount
+        linked += count
+        if not count:
+            break
+
+    # 待確認清單：範圍內的發票先全部清除，再寫入剩下的候選
+    connection.execute(delete(_reviews).where(
+        _reviews.c.invoice_id.in_(select(_invoices.c.id).where(scope))
+    ))
+    remaining = candidate_query(window_days, since, until).subquery('remaining')
+    queued_rows = connection.execute(insert(_reviews).from_select(
+        ['invoice_id', 'transaction_id', 'vendor_match', 'day_difference', 'created_at'],
+        select(
+            remaining.c.invoice_id, remaining.c.transaction_id, remaining.c.vendor_match,
+            remaining.c.day_difference, literal(datetime.utcnow()),
+        ),
+    )).rowcount
+    queued = connection.scalar(
+        select(func.count(func.distinct(_reviews.c.invoice_id)))
+        .where(_reviews.c.invoice_id.in_(select(_invoices.c.id).where(scope)))
+    ) if queued_rows else 0
+
+    # session 中已載入的發票物件需重新讀取
+    db.session.expire_all()
+    return ReconcileResult(
+        invoices=unlinked_before, linked=linked, queued=queued,
+        unmatched=unlinked_before - linked - queued, rounds=rounds,
+    )
+
+
+def link_invoice(invoice_id, transaction_id):
+    """
+    人工確認：將發票對應到指定交易。發票已對應、交易已被其他發票使用或不是已核准的支出時回傳 False。
+    成功時清除這張發票的待確認項目，以及其他發票指向這筆交易的待確認項目。由呼叫端 commit。
+    """
+    connection = db.session.connection()
+    other = aliased(Invoice)
+    transaction_ok = exists().where(
+        _transactions.c.id == transaction_id,
+        _transactions.c.transaction_type == TransactionType.EXPENDITURE,
+        _transactions.c.status == ApprovalStatus.APPROVED,
+    )
+    already_used = exists().where(other.transaction_id == transaction_id)
+    count = connection.execute(
+        update(_invoices)
+        .where(_invoices.c.id == invoice_id, _invoices.c.transaction_id.is_(None), transaction_ok, ~already_used)
+        .values(transaction_id=transaction_id)
+    ).rowcount
+    if not count:
+        return False
+    connection.execute(delete(_reviews).where(or_(
+        _reviews.c.invoice_id == invoice_id, _reviews.c.transaction_id == transaction_id,
+    )))
+    db.session.expire_all()
+    return True
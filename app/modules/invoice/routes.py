@@ -1,9 +1,16 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
 from app import db
-from .models import Invoice, InvoiceType
-from .forms import InvoiceForm
+from .models import Invoice, InvoiceType, InvoiceMatchReview
+from .forms import InvoiceForm, ReconcileForm, InvoiceLinkForm
+from .reconcile import reconcile_invoices, link_invoice
 from decimal import Decimal
+from datetime import date, datetime
+from sqlalchemy import exists
+from sqlalchemy.orm import selectinload, joinedload
+from app.modules.user.routes import manager_required
+from app.periods import Period
+from app.pagination import keyset_paginate_request
 
 invoice_bp = Blueprint('invoice', __name__, url_prefix='/invoice')
 
@@ -34,14 +41,16 @@ def add_invoice():
 @invoice_bp.route('/report')
 @login_required
 def report():
-    # 接收查詢參數，例如 ?year=2025&month=5
-    year = request.args.get('year', type=int, default=datetime.now().year)
-    month = request.args.get('month', type=int, default=datetime.now().month)
+    # 接收查詢參數，例如 ?year=2025&month=5，或 ?period=vat&year=2025&vat=3
+    try:
+        period = Period.from_args(request.args)
+    except (ValueError, TypeError, KeyError):
+        period = Period.month(date.today().year, date.today().month)
+        flash('日期參數格式錯誤，已顯示當前月份報表。', 'warning')
 
-    # 查詢指定月份的發票，並按類型和日期排序
+    # 以日期區間查詢指定期間的發票 (可使用索引)，並按類型和日期排序
     invoices = Invoice.query.filter(
-        db.extract('year', Invoice.invoice_date) == year,
-        db.extract('month', Invoice.invoice_date) == month
+        period.predicate(Invoice.invoice_date)
     ).order_by(Invoice.invoice_type, Invoice.invoice_date).all()
 
     # 將發票按類型分組
@@ -51,4 +60,75 @@ def report():
             grouped_invoices[inv.invoice_type.value] = []
         grouped_invoices[inv.invoice_type.value].append(inv)
         
-    return render_template('invoice_report.html', grouped_invoices=grouped_invoices, year=year, month=month)
\ No newline at end of file
+    return render_template('invoice_report.html', grouped_invoices=grouped_invoices,
+                           period=period, year=period.start.year, month=period.start.month)
+
+
+def _pending_review_query():
+    """有待確認候選的未對應發票"""
+    return Invoice.query.filter(
+        Invoice.transaction_id.is_(None),
+        exists().where(InvoiceMatchReview.invoice_id == Invoice.id),
+    ).options(
+        selectinload(Invoice.match_reviews).joinedload(InvoiceMatchReview.transaction)
+    )
+
+
+@invoice_bp.route('/reconcile', methods=['GET'])
+@login_required
+@manager_required
+def reconcile():
+    """發票對帳：執行自動對帳，並逐張確認有多個候選的發票"""
+    invoices = keyset_paginate_request(
+        _pending_review_query(), [Invoice.invoice_date, Invoice.id], per_page=20,
+        descending=False, with_total=True
+    )
+    return render_template('invoice_reconcile.html', invoices=invoices,
+                           form=ReconcileForm(), link_form=InvoiceLinkForm())
+
+
+@invoice_bp.route('/reconcile', methods=['POST'])
+@login_required
+@manager_required
+def run_reconcile():
+    """批次對帳 (set-based，一次處理範圍內所有未對應的發票)"""
+    form = ReconcileForm()
+    if not form.validate_on_submit():
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f'欄位 "{getattr(form, field).label.text}" 發生錯誤: {error}', 'danger')
+        return redirect(url_for('invoice.reconcile'))
+    try:
+        result = reconcile_invoices(form.window_days.data, form.since.data, form.until.data)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'對帳時發生錯誤：{e}', 'danger')
+        return redirect(url_for('invoice.reconcile'))
+    flash(f'未對應發票 {result.invoices} 張：自動對應 {result.linked} 張、待確認 {result.queued} 張、'
+          f'找不到候選交易 {result.unmatched} 張。', 'success')
+    return redirect(url_for('invoice.reconcile'))
+
+
+@invoice_bp.route('/<int:invoice_id>/link', methods=['POST'])
+@login_required
+@manager_required
+def link(invoice_id):
+    """人工確認發票對應的交易"""
+    form = InvoiceLinkForm()
+    if not form.validate_on_submit() or not form.transaction_id.data.isdigit():
+        flash('請選擇要對應的交易。', 'danger')
+        return redirect(request.referrer or url_for('invoice.reconcile'))
+    transaction_id = int(form.transaction_id.data)
+    try:
+        linked = link_invoice(invoice_id, transaction_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'對應時發生錯誤：{e}', 'danger')
+        return redirect(request.referrer or url_for('invoice.reconcile'))
+    if linked:
+        flash(f'發票已對應到交易 #{transaction_id}。', 'success')
+    else:
+        flash('無法對應：發票已對應，或該筆交易已被其他發票使用 (可能已由其他主管處理)。', 'warning')
+    return redirect(request.referrer or url_for('invoice.reconcile'))
@@ -0,0 +1,70 @@
+"""
+批次簽核
+
+一次核准或駁回多筆待簽核交易，只執行一個有條件的
+UPDATE ... WHERE status = 'PENDING' AND id IN (...)。
+其他主管已經處理過的交易不會符合條件，因此不會被覆蓋，會列為略過。
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import update
+from app import db
+from .models import Transaction, ApprovalStatus, ChangeAction
+from . import changes, rollup
+
+# 一次最多處理的筆數
+BULK_APPROVAL_LIMIT = 500
+
+BulkResult = namedtuple('BulkResult', 'changed skipped')
+
+_transactions = Transaction.__table__
+
+
+def bulk_set_status(transaction_ids, status, approver_id, rejection_reason=None, today=None):
+    """
+    將 transaction_ids 中仍為待簽核的交易改為 status (APPROVED 或 REJECTED)，
+    回傳 BulkResult(實際變更的 ID, 已非待簽核或不存在而略過的 ID)，皆已排序。
+    由呼叫端 commit；每月分類彙總表與異動紀錄在同一個交易內一併更新 (簽核狀態不影響餘額)。
+    """
+    if status not in (ApprovalStatus.APPROVED, ApprovalStatus.REJECTED):
+        raise ValueError(f'不支援的簽核結果：{status}')
+    requested = sorted(set(transaction_ids))
+    if not requested:
+        return BulkResult([], [])
+    if len(requested) > BULK_APPROVAL_LIMIT:
+        raise ValueError(f'一次最多只能處理 {BULK_APPROVAL_LIMIT} 筆')
+
+    values = {
+        'status': status,
+        'approver_id': approver_id,
+        'approval_date': today or datetime.utcnow().date(),
+    }
+    if status == ApprovalStatus.REJECTED:
+        values['rejection_reason'] = rejection_reason
+
+    connection = db.session.connection()
+    changed_rows = connection.execute(
+        update(_transactions)
+        .where(_transactions.c.status == ApprovalStatus.PENDING, _transactions.c.id.in_(requested))
+        .values(**values)
+        .returning(
+            _transactions.c.id, _transactions.c.transaction_date, _transactions.c.category_id,
+            _transactions.c.transaction_type, _transactions.c.total_amount
+        )
+    ).all()
+
+    # Core UPDATE 不會觸發 mapper 事件，彙總表的金額由待簽核搬到新狀態，異動紀錄也由這裡寫入
+    moved = [dict(row._mapping, status=ApprovalStatus.PENDING) for row in changed_rows]
+    rollup.apply_bulk_rows(connection, moved, sign=-1)
+    rollup.apply_bulk_rows(connection, [dict(row, status=status) for row in moved])
+    action = ChangeAction.APPROVED if status == ApprovalStatus.APPROVED else ChangeAction.REJECTED
+    changes.record_changes(connection, [
+        {'transaction_id': row.id, 'action': action, 'status': status} for row in changed_rows
+    ])
+
+    # session 中已載入的交易物件需重新讀取
+    db.session.expire_all()
+
+    changed = sorted(row.id for row in changed_rows)
+    changed_set = set(changed)
+    return BulkResult(changed, [transaction_id for transaction_id in requested if transaction_id not in changed_set])
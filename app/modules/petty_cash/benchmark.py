@@ -0,0 +1,492 @@
+"""
+效能測試用的模擬資料產生器與基準測試
+
+seed_data() 以批次 executemany 產生指定規模的使用者、分類、交易、明細、盤點與發票資料；
+run_benchmark() 以 Flask test client 重複請求主要頁面，記錄 p50/p95 延遲與查詢次數，
+結果可存成 JSON 基準檔，之後的執行再拿來比較。
+run_login_benchmark() 量測大量同時登入時的登入吞吐量，以及同一行程其他頁面的延遲。
+"""
+import random
+import statistics
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask import current_app, url_for
+from sqlalchemy import func, inspect, insert, select
+from app import db
+from app.compression import available_encodings, compress_body
+from app.instrumentation import count_queries
+from app.modules.user.models import User, UserRole
+from app.modules.user.passwords import hash_password
+from .models import (
+    Transaction, TransactionItem, TransactionType, TaxType, TaxCalculationMethod, ApprovalStatus,
+    CashCountSession, CashCountDetail, Category, PeriodClose
+)
+from .categories import invalidate_categories
+from .ledger import rebuild_balance
+from .rollup import rebuild_rollup
+
+SEED_PASSWORD = 'password'
+
+_CATEGORY_NAMES = ['文具用品', '交通費', '郵電費', '交際費', '雜項購置', '修繕費', '清潔用品', '餐費', '書報雜誌', '水電瓦斯']
+_ITEM_NAMES = [
+    ('原子筆', '支'), ('影印紙', '包'), ('計程車資', '趟'), ('高鐵票', '張'), ('郵資', '件'), ('便當', '個'),
+    ('礦泉水', '箱'), ('清潔劑', '瓶'), ('電池', '組'), ('延長線', '條'), ('報紙', '份'), ('停車費', '次'),
+]
+_VENDORS = ['全聯福利中心', '統一超商', '全家便利商店', '家樂福', '燦坤', '台灣大車隊', '中華郵政', '誠品書店']
+_DENOMINATIONS = [1000, 500, 100, 50, 10, 5, 1]
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _insert(table, rows, chunk_size):
+    for chunk in _chunks(rows, chunk_size):
+        db.session.execute(insert(table), chunk)
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _seed_users(count, rng):
+    password_hash = hash_password(SEED_PASSWORD)
+    start = _next_id(User)
+    rows = [{
+        'id': start + i,
+        'account_id': f'S{start + i:05d}',
+        'display_name': f'測試員{start + i}',
+        'email': f'seed{start + i}@example.com',
+        'password_hash': password_hash,
+        'role': UserRole.MANAGER if rng.random() < 0.05 else UserRole.USER,
+    } for i in range(count)]
+    _insert(User.__table__, rows, 1000)
+    return [row['id'] for row in rows]
+
+
+def _seed_categories(count):
+    existing = set(db.session.scalars(select(Category.name)))
+    names = [name for name in _CATEGORY_NAMES if name not in existing]
+    serial = 1
+    while len(names) < count:
+        name = f'分類{serial:03d}'
+        if name not in existing:
+            names.append(name)
+        serial += 1
+    rows = [{'name': name} for name in names[:count]]
+    if rows:
+        _insert(Category.__table__, rows, 1000)
+        invalidate_categories(db.session.connection())
+    return list(db.session.scalars(select(Category.id)))
+
+
+def _random_date(rng, start, days):
+    return start + timedelta(days=rng.randrange(days))
+
+
+def _seed_transactions(count, items_per_transaction, user_ids, manager_ids, category_ids, start, days, rng, chunk_size):
+    next_id = _next_id(Transaction)
+    next_item_id = _next_id(TransactionItem)
+    statuses = [ApprovalStatus.APPROVED] * 7 + [ApprovalStatus.PENDING] * 2 + [ApprovalStatus.DRAFT, ApprovalStatus.REJECTED]
+    item_total = 0
+
+    for chunk_start in range(0, count, chunk_size):
+        transactions, items = [], []
+        for offset in range(min(chunk_size, count - chunk_start)):
+            transaction_id = next_id + chunk_start + offset
+            transaction_date = _random_date(rng, start, days)
+            application_date = transaction_date + timedelta(days=rng.randrange(4))
+            # 約每 20 筆有一筆主管撥補的收入
+            if rng.random() < 0.05:
+                amount = Decimal(rng.choice([100000, 150000, 200000]))
+                transactions.append({
+                    'id': transaction_id, 'transaction_type': TransactionType.INCOME, 'tax_type': TaxType.TAX_EXEMPT,
+                    'tax_calculation_method': None, 'transaction_date': transaction_date,
+                    'application_date': application_date, 'applicant_id': rng.choice(manager_ids),
+                    'description': '零用金撥補', 'subtotal': amount, 'tax': Decimal('0'), 'total_amount': amount,
+                    'erp_document_number': None, 'status': ApprovalStatus.APPROVED, 'approver_id': None,
+                    'approval_date': None, 'rejection_reason': None, 'category_id': None,
+                })
+                continue
+
+            subtotal = Decimal('0')
+            for _ in range(max(1, int(rng.expovariate(1 / items_per_transaction)) + 1)):
+                name, unit = rng.choice(_ITEM_NAMES)
+                quantity = Decimal(rng.randint(1, 10))
+                unit_price = Decimal(rng.randint(10, 500))
+                subtotal += quantity * unit_price
+                items.append({
+                    'id': next_item_id, 'transaction_id': transaction_id, 'item_name': name, 'unit': unit,
+                    'quantity': quantity, 'unit_price': unit_price, 'line_total': quantity * unit_price,
+                })
+                next_item_id += 1
+            tax = (subtotal * Decimal('0.05')).quantize(Decimal('1'))
+            status = rng.choice(statuses)
+            decided = status in (ApprovalStatus.APPROVED, ApprovalStatus.REJECTED)
+            transactions.append({
+                'id': transaction_id, 'transaction_type': TransactionType.EXPENDITURE, 'tax_type': TaxType.TAXABLE,
+                'tax_calculation_method': TaxCalculationMethod.EXCLUSIVE, 'transaction_date': transaction_date,
+                'application_date': application_date, 'applicant_id': rng.choice(user_ids),
+                'description': f'{rng.choice(_VENDORS)} 採購', 'subtotal': subtotal, 'tax': tax,
+                'total_amount': -(subtotal + tax), 'erp_document_number': None, 'status': status,
+                'approver_id': rng.choice(manager_ids) if decided else None,
+                'approval_date': application_date + timedelta(days=1) if decided else None,
+                'rejection_reason': '單據不齊全' if status == ApprovalStatus.REJECTED else None,
+                'category_id': rng.choice(category_ids),
+            })
+
+        db.session.execute(insert(Transaction.__table__), transactions)
+        _insert(TransactionItem.__table__, items, chunk_size)
+        item_total += len(items)
+    return item_total
+
+
+def _seed_cash_counts(count, user_ids, start, days, rng, chunk_size):
+    next_id = _next_id(CashCountSession)
+    sessions, details = [], []
+    for i in range(count):
+        counted = Decimal('0')
+        session_id = next_id + i
+        for denomination in _DENOMINATIONS:
+            quantity = rng.randint(0, 20)
+            if quantity:
+                counted += denomination * quantity
+                details.append({
+                    'session_id': session_id, 'denomination': denomination,
+                    'quantity': quantity, 'subtotal': Decimal(denomination * quantity),
+                })
+        system_balance = counted + rng.choice([0, 0, 0, 0, -100, 50])
+        sessions.append({
+            'id': session_id,
+            'count_date': datetime.combine(_random_date(rng, start, days), datetime.min.time()) + timedelta(hours=rng.randint(8, 18)),
+            'counted_total': counted, 'system_balance': system_balance,
+            'difference': counted - system_balance, 'user_id': rng.choice(user_ids),
+        })
+    _insert(CashCountSession.__table__, sessions, chunk_size)
+    _insert(CashCountDetail.__table__, details, chunk_size)
+
+
+def _seed_invoices(count, user_ids, start, days, rng, chunk_size):
+    """約一半的發票取自已核准的支出 (金額相同、日期相差 0-2 天、同一廠商)，供發票對帳使用，其餘為隨機資料"""
+    from app.modules.invoice.models import Invoice, InvoiceType
+    next_id = _next_id(Invoice)
+    expenditures = db.session.execute(
+        select(Transaction.transaction_date, Transaction.description, Transaction.subtotal, Transaction.tax)
+        .where(Transaction.transaction_type == TransactionType.EXPENDITURE, Transaction.status == ApprovalStatus.APPROVED)
+    ).all()
+    matched = rng.sample(expenditures, min(len(expenditures), count // 2))
+    rows = []
+    for i in range(count):
+        if i < len(matched):
+            transaction_date, description, sales, tax = matched[i]
+            invoice_date = transaction_date - timedelta(days=rng.randrange(3))
+            vendor = description.split(' ')[0]
+        else:
+            sales = Decimal(rng.randint(50, 20000))
+            tax = (sales * Decimal('0.05')).quantize(Decimal('1'))
+            invoice_date = _random_date(rng, start, days)
+            vendor = rng.choice(_VENDORS)
+        rows.append({
+            'id': next_id + i, 'invoice_type': rng.choice(list(InvoiceType)),
+            'track': ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ') for _ in range(2)),
+            'number': f'{next_id + i:08d}', 'invoice_date': invoice_date,
+            'vendor_name': vendor, 'business_number': f'{rng.randint(10000000, 99999999)}',
+            'sales_amount': sales, 'tax_amount': tax, 'total_amount': sales + tax,
+            'uploader_id': rng.choice(user_ids), 'transaction_id': None, 'created_at': datetime.utcnow(),
+        })
+    _insert(Invoice.__table__, rows, chunk_size)
+
+
+def seed_data(transactions, items_per_transaction, users, categories, cash_counts, invoices, years, seed=None, chunk_size=5000):
+    """產生模擬資料並提交，回傳各資料表新增的筆數"""
+    rng = random.Random(seed)
+    end = date.today()
+    start = end - timedelta(days=365 * years)
+    days = (end - start).days
+
+    user_ids = _seed_users(users, rng)
+    manager_ids = list(db.session.scalars(select(User.id).where(User.role == UserRole.MANAGER))) or user_ids[:1]
+    category_ids = _seed_categories(categories)
+    item_count = _seed_transactions(
+        transactions, items_per_transaction, user_ids, manager_ids, category_ids, start, days, rng, chunk_size
+    )
+    _seed_cash_counts(cash_counts, user_ids, start, days, rng, chunk_size)
+
+    invoice_count = 0
+    if invoices and inspect(db.session.connection()).has_table('invoices'):
+        _seed_invoices(invoices, user_ids, start, days, rng, chunk_size)
+        invoice_count = invoices
+
+    # 批次寫入不會觸發 ORM 事件，最後重建餘額快照與每月分類彙總
+    rebuild_balance()
+    rebuild_rollup()
+    db.session.commit()
+    return {
+        'users': len(user_ids), 'categories': len(category_ids), 'transactions': transactions,
+        'transaction_items': item_count, 'cash_count_sessions': cash_counts, 'invoices': invoice_count,
+    }
+
+
+# --- 基準測試 ---
+
+def manager_client():
+    """回傳以第一位主管身分登入的 test client；沒有主管時回傳 None"""
+    manager = User.query.filter_by(role=UserRole.MANAGER).order_by(User.id).first()
+    if manager is None:
+        return None
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(manager.id)
+        session['_fresh'] = True
+    return client
+
+
+def timed_request(client, method, url, **kwargs):
+    """在全新的 app context 中送出請求，回傳 (回應, 毫秒, 查詢次數)"""
+    with current_app.app_context(), count_queries(db.engine) as counter:
+        started = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+    return response, elapsed, counter.count
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _summarize(samples, queries, statuses):
+    return {
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(_percentile(samples, 95), 2),
+        'queries': max(queries),
+        'statuses': sorted(set(statuses)),
+        'rounds': len(samples),
+    }
+
+
+def _benchmark_cases():
+    """(名稱, HTTP 方法, 網址, 表單資料) 清單；invoice 模組未註冊時略過"""
+    latest_id = db.session.query(func.max(Transaction.id)).scalar()
+    today = date.today()
+    last_month = today.replace(day=1) - timedelta(days=1)
+    cases = [
+        ('petty_cash.index', 'GET', url_for('petty_cash.index'), None),
+        ('petty_cash.report_expense_by_category', 'GET',
+         url_for('petty_cash.report_expense_by_category', year=last_month.year, month=last_month.month), None),
+        ('petty_cash.cash_count_tool', 'GET', url_for('petty_cash.cash_count_tool'), None),
+        ('petty_cash.settle_month_end', 'POST', url_for('petty_cash.settle_month_end'),
+         {'year': str(last_month.year), 'month': str(last_month.month)}),
+    ]
+    if latest_id:
+        cases.insert(1, ('petty_cash.transaction_detail', 'GET',
+                         url_for('petty_cash.transaction_detail', transaction_id=latest_id), None))
+    if 'invoice.report' in current_app.view_functions:
+        cases.append(('invoice.report', 'GET', url_for('invoice.report', year=last_month.year, month=last_month.month), None))
+    return cases
+
+
+def run_benchmark(rounds, warmup=2):
+    """以主管身分重複請求各頁面，回傳 {名稱: 統計}；月結產生的紀錄會在結束後刪除"""
+    client = manager_client()
+    if client is None:
+        raise RuntimeError('找不到主管帳號，請先執行 flask petty-cash seed。')
+
+    with current_app.test_request_context():
+        cases = _benchmark_cases()
+    last_id_before = db.session.query(func.max(Transaction.id)).scalar() or 0
+    last_close_before = db.session.query(func.max(PeriodClose.id)).scalar() or 0
+
+    csrf_enabled = current_app.config.get('WTF_CSRF_ENABLED', True)
+    current_app.config['WTF_CSRF_ENABLED'] = False
+    results = {}
+    try:
+        for name, method, url, data in cases:
+            samples, queries, statuses = [], [], []
+            for round_number in range(warmup + rounds):
+                if name == 'petty_cash.settle_month_end':
+                    _discard_settlements_after(last_id_before, last_close_before)
+                response, elapsed, query_count = timed_request(client, method, url, data=data)
+                if round_number >= warmup:
+                    samples.append(elapsed)
+                    queries.append(query_count)
+                    statuses.append(response.status_code)
+            results[name] = _summarize(samples, queries, statuses)
+    finally:
+        current_app.config['WTF_CSRF_ENABLED'] = csrf_enabled
+        _discard_settlements_after(last_id_before, last_close_before)
+    return results
+
+
+def _compression_cases():
+    """(名稱, 網址)：標記較多的列表、報表頁面與串流匯出"""
+    latest_id = db.session.query(func.max(Transaction.id)).scalar()
+    today = date.today()
+    cases = [
+        ('petty_cash.index', url_for('petty_cash.index')),
+        ('petty_cash.approval_dashboard', url_for('petty_cash.approval_dashboard')),
+        ('petty_cash.cash_count_history', url_for('petty_cash.cash_count_history')),
+        ('petty_cash.report_expense_by_category',
+         url_for('petty_cash.report_expense_by_category', period='year', year=today.year, compare='monthly')),
+        ('petty_cash.export_transactions (csv)', url_for('petty_cash.export_transactions', format='csv')),
+    ]
+    if latest_id:
+        cases.insert(1, ('petty_cash.transaction_detail', url_for('petty_cash.transaction_detail', transaction_id=latest_id)))
+    return cases
+
+
+def run_compression_benchmark(rounds=20):
+    """
+    以主管身分請求各頁面，回傳 {名稱: 統計}：未壓縮與各壓縮方式實際傳送的位元組數，
+    以及以目前設定壓縮一次所需的 CPU 時間 (rounds 次平均，毫秒)
+    """
+    client = manager_client()
+    if client is None:
+        raise RuntimeError('找不到主管帳號，請先執行 flask petty-cash seed。')
+
+    with current_app.test_request_context():
+        cases = _compression_cases()
+    level, quality = current_app.config['COMPRESS_LEVEL'], current_app.config['COMPRESS_BROTLI_QUALITY']
+    results = {}
+    for name, url in cases:
+        response = client.get(url, headers={'Accept-Encoding': 'identity'})
+        body = response.get_data()
+        stats = {'status': response.status_code, 'identity_bytes': len(body), 'encodings': {}}
+        for encoding in available_encodings():
+            compressed = client.get(url, headers={'Accept-Encoding': encoding})
+            cpu_ms = 0.0
+            if compressed.content_encoding == encoding:
+                started = time.process_time()
+                for _ in range(rounds):
+                    compress_body(body, encoding, level, quality)
+                cpu_ms = round((time.process_time() - started) * 1000 / rounds, 3)
+            stats['encodings'][encoding] = {
+                'bytes': len(compressed.get_data()), 'encoded': compressed.content_encoding == encoding, 'cpu_ms': cpu_ms,
+            }
+        results[name] = stats
+    return results
+
+
+def _discard_settlements_after(last_id, last_close_id):
+    for close in PeriodClose.query.filter(PeriodClose.id > last_close_id).all():
+        db.session.delete(close)
+    for transaction in Transaction.query.filter(Transaction.id > last_id).all():
+        db.session.delete(transaction)
+    db.session.commit()
+
+
+LOGIN_BENCHMARK_ACCOUNT = 'BENCH-LOGIN'
+
+
+def _probe_latencies(app, client, url, stop=None, count=None):
+    """重複請求 url 直到 stop 被設定 (或滿 count 次)，回傳每次的毫秒數"""
+    samples = []
+    while (stop is None or not stop.is_set()) and (count is None or len(samples) < count):
+        with app.app_context():
+            started = time.perf_counter()
+            client.get(url)
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def _login_worker(app, url, remaining, lock, latencies, statuses):
+    client = app.test_client()
+    while True:
+        with lock:
+            if remaining[0] <= 0:
+                return
+            remaining[0] -= 1
+        with app.app_context():
+            started = time.perf_counter()
+            response = client.post(url, data={'account_id': LOGIN_BENCHMARK_ACCOUNT, 'password': SEED_PASSWORD})
+            elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses.append(response.status_code)
+        # 清除登入狀態，下一次 POST 才會再驗證一次密碼
+        client.delete_cookie('session')
+
+
+def run_login_benchmark(costs, logins=40, concurrency=4, probes=30):
+    """
+    對每個 bcrypt 成本：先量測閒置時頁面 (盤點工具) 的延遲，再以 concurrency 個執行緒
+    同時登入 logins 次，期間持續請求同一頁面。回傳 {成本: 統計}。
+    量測用帳號在結束後刪除，BCRYPT_LOG_ROUNDS 與 CSRF 設定也會還原。
+    """
+    client = manager_client()
+    if client is None:
+        raise RuntimeError('找不到主管帳號，請先執行 flask petty-cash seed。')
+    app = current_app._get_current_object()
+    with app.test_request_context():
+        login_url = url_for('user.login')
+        probe_url = url_for('petty_cash.cash_count_tool')
+
+    original_rounds = app.config['BCRYPT_LOG_ROUNDS']
+    csrf_enabled = app.config.get('WTF_CSRF_ENABLED', True)
+    app.config['WTF_CSRF_ENABLED'] = False
+    results = {}
+    try:
+        for cost in costs:
+            # 帳號的雜湊成本與設定相同，量測期間不會觸發重新雜湊
+            app.config['BCRYPT_LOG_ROUNDS'] = cost
+            User.query.filter_by(account_id=LOGIN_BENCHMARK_ACCOUNT).delete()
+            db.session.add(User(account_id=LOGIN_BENCHMARK_ACCOUNT, display_name='登入量測',
+                                email='bench-login@example.com', password_hash=hash_password(SEED_PASSWORD, cost)))
+            db.session.commit()
+
+            _probe_latencies(app, client, probe_url, count=3)
+            idle = _probe_latencies(app, client, probe_url, count=probes)
+
+            lock, stop = threading.Lock(), threading.Event()
+            remaining, latencies, statuses = [logins], [], []
+            busy = []
+            prober = threading.Thread(target=lambda: busy.extend(_probe_latencies(app, client, probe_url, stop)))
+            workers = [
+                threading.Thread(target=_login_worker, args=(app, login_url, remaining, lock, latencies, statuses))
+                for _ in range(concurrency)
+            ]
+            started = time.perf_counter()
+            prober.start()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - started
+            stop.set()
+            prober.join()
+
+            results[cost] = {
+                'logins_per_sec': round(len(latencies) / elapsed, 2),
+                'login_p50_ms': round(statistics.median(latencies), 2),
+                'login_p95_ms': round(_percentile(latencies, 95), 2),
+                'login_statuses': sorted(set(statuses)),
+                'idle_p50_ms': round(statistics.median(idle), 2),
+                'idle_p95_ms': round(_percentile(idle, 95), 2),
+                'busy_p50_ms': round(statistics.median(busy), 2),
+                'busy_p95_ms': round(_percentile(busy, 95), 2),
+            }
+    finally:
+        app.config['BCRYPT_LOG_ROUNDS'] = original_rounds
+        app.config['WTF_CSRF_ENABLED'] = csrf_enabled
+        db.session.rollback()
+        User.query.filter_by(account_id=LOGIN_BENCHMARK_ACCOUNT).delete()
+        db.session.commit()
+    return results
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """回傳 p95 延遲超過基準 tolerance 倍、或查詢次數增加的項目說明"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * tolerance:
+            regressions.append(f'{name}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+        if current['queries'] > previous['queries']:
+            regressions.append(f'{name}: 查詢次數 {previous["queries"]} -> {current["queries"]}')
+    return regressions
@@ -0,0 +1,86 @@
+"""
+費用分類清單的行程內快取
+
+每次建立 ExpenditureForm 都要列出所有分類，但分類一季才變動一次。
+分類清單放在各 worker 的記憶體中 (每個 app 各自一份，存放在 app.extensions)，以 cache_versions 的版本號判斷是否過期：
+Category 經由 ORM 新增、修改、刪除時，mapper 事件在同一個 flush 內把版本號加一，
+commit 後本行程立即失效，其他 worker 則在下次確認版本號時重新載入。
+"""
+from collections import namedtuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from app import db
+from app.cache import VersionedCache, bump_version
+from .models import Category
+
+CATEGORY_CACHE = 'categories'
+
+# choices：依名稱排序的 (id, 名稱)；names：id -> 名稱
+CategoryChoices = namedtuple('CategoryChoices', 'choices names')
+
+
+def _load_categories():
+    rows = db.session.execute(select(Category.id, Category.name).order_by(Category.name)).all()
+    choices = tuple((row.id, row.name) for row in rows)
+    return CategoryChoices(choices, dict(choices))
+
+
+def _category_cache():
+    cache = current_app.extensions.get('category_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('category_cache', VersionedCache(CATEGORY_CACHE, _load_categories))
+    return cache
+
+
+def _invalidate_cache():
+    # 尚未建立快取 (或不在 app context 中) 時沒有需要失效的資料
+    cache = current_app.extensions.get('category_cache') if has_app_context() else None
+    if cache is not None:
+        cache.invalidate()
+
+
+def category_choices(max_age=None):
+    """
+    目前的分類清單 (CategoryChoices)。
+    max_age 秒內確認過版本號時不查詢資料庫；未指定時使用 CATEGORY_CACHE_MAX_AGE 設定。
+    """
+    if max_age is None:
+        max_age = current_app.config['CATEGORY_CACHE_MAX_AGE']
+    return _category_cache().get(max_age)
+
+
+def category_name(category_id, max_age=None):
+    """分類名稱；不存在時回傳 None"""
+    return category_choices(max_age).names.get(category_id)
+
+
+def invalidate_categories(connection=None):
+    """
+    以 Core 直接寫入 categories 表 (不經過 ORM) 時由呼叫端使用：
+    在同一個交易內把版本號加一，並讓本行程的快取失效。
+    """
+    bump_version(CATEGORY_CACHE, connection)
+    _invalidate_cache()
+
+
+def _mark_changed(mapper, connection, target):
+    bump_version(CATEGORY_CACHE, connection)
+    session = object_session(target)
+    if session is not None:
+        session.info['categories_changed'] = True
+
+
+for _event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Category, _event, _mark_changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('categories_changed', False):
+        _invalidate_cache()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('categories_changed', None)
@@ -0,0 +1,98 @@
+"""
+交易異動紀錄 (change feed)
+
+交易新增、送出簽核、核准、駁回、修改或刪除時，在同一個 flush 內於 transaction_changes
+附加一筆紀錄。頁面記下載入當時的最後一筆紀錄 ID (游標)，之後以 changes?since=<游標>
+輪詢，只取回更新的異動並就地更新列、待簽核筆數與餘額；沒有異動時只需一次以主鍵範圍查詢。
+
+Core 批次寫入 (匯入、批次簽核) 不會觸發 mapper 事件，由呼叫端以 record_changes 一併寫入。
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import delete, event, func, inspect, insert, select
+from app import db
+from .models import Transaction, TransactionChange, ChangeAction, ApprovalStatus
+
+# 一次回應最多的異動筆數，超過時 more 為 True，用戶端以新的游標繼續取
+CHANGE_FEED_LIMIT = 200
+
+# 狀態改變時的異動類型；改回草稿等其他狀態視為一般修改
+_STATUS_ACTIONS = {
+    ApprovalStatus.PENDING: ChangeAction.SUBMITTED,
+    ApprovalStatus.APPROVED: ChangeAction.APPROVED,
+    ApprovalStatus.REJECTED: ChangeAction.REJECTED,
+}
+
+ChangeFeed = namedtuple('ChangeFeed', 'changes cursor more reset')
+
+_changes = TransactionChange.__table__
+
+
+def record_changes(connection, rows):
+    """寫入異動紀錄；rows 為含 transaction_id、action、status 的 dict"""
+    if not rows:
+        return
+    now = datetime.utcnow()
+    connection.execute(insert(_changes), [dict(row, changed_at=now) for row in rows])
+
+
+def latest_cursor():
+    """目前最後一筆異動的 ID；沒有任何異動時為 0"""
+    return db.session.scalar(select(func.max(_changes.c.id))) or 0
+
+
+def changes_since(cursor, limit=CHANGE_FEED_LIMIT):
+    """
+    回傳游標之後的異動 (ChangeFeed)。
+    游標本身那一筆會一起查出來以確認仍然存在；已被清除 (或資料庫重建) 時 reset 為 True，
+    用戶端應重新載入整頁，cursor 則為目前最新的游標。
+    """
+    rows = db.session.execute(
+        select(_changes).where(_changes.c.id >= cursor).order_by(_changes.c.id).limit(limit + 2)
+    ).all()
+    if cursor > 0:
+        if not rows or rows[0].id != cursor:
+            return ChangeFeed([], latest_cursor(), False, True)
+        rows = rows[1:]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return ChangeFeed(rows, rows[-1].id if rows else cursor, more, False)
+
+
+def prune_changes(before):
+    """刪除 before (datetime) 之前的異動，最新的一筆一律保留 (游標仍可延續)，回傳刪除筆數"""
+    latest = latest_cursor()
+    result = db.session.execute(
+        delete(_changes).where(_changes.c.changed_at < before, _changes.c.id < latest)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+# --- mapper 事件 ---
+
+def _has_column_changes(state):
+    return any(state.attrs[attribute.key].history.has_changes() for attribute in state.mapper.column_attrs)
+
+
+@event.listens_for(Transaction, 'after_insert')
+def _changes_after_insert(mapper, connection, target):
+    record_changes(connection, [{'transaction_id': target.id, 'action': ChangeAction.CREATED, 'status': target.status}])
+
+
+@event.listens_for(Transaction, 'after_update')
+def _changes_after_update(mapper, connection, target):
+    state = inspect(target)
+    # after_update 對所有被標記為 dirty 的物件都會觸發，沒有實際變動的不記錄
+    if state.attrs.status.history.has_changes():
+        action = _STATUS_ACTIONS.get(target.status, ChangeAction.UPDATED)
+    elif _has_column_changes(state):
+        action = ChangeAction.UPDATED
+    else:
+        return
+    record_changes(connection, [{'transaction_id': target.id, 'action': action, 'status': target.status}])
+
+
+@event.listens_for(Transaction, 'after_delete')
+def _changes_after_delete(mapper, connection, target):
+    record_changes(connection, [{'transaction_id': target.id, 'action': ChangeAction.DELETED, 'status': target.status}])
@@ -0,0 +1,167 @@
+"""
+月結檢查點
+
+原本的月結要把「開帳以來到月底」的所有收支加總一次，成本隨著歷史資料無限成長。
+這裡在每次結轉時把期初、收入、支出、期末餘額與筆數存進 period_closes，
+下一次結轉只需讀取前一個檢查點，再加總檢查點之後到本月底的交易即可。
+"""
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import case, func, select, tuple_
+from app import db
+from app.periods import Period
+from .models import Transaction, TransactionType, TaxType, ApprovalStatus, EntryKind, PeriodClose
+
+class PeriodCloseError(ValueError):
+    """無法結轉 (已結轉、較晚月份已結轉或期末餘額為負)"""
+
+
+def settlement_description(user, year, month):
+    return f"[{user.display_name}] 執行 {year}年{month}月 結餘結轉"
+
+
+def _movement_columns():
+    amount = Transaction.total_amount
+    return (
+        func.coalesce(func.sum(case((Transaction.transaction_type == TransactionType.INCOME, amount), else_=0)), 0),
+        func.coalesce(func.sum(case((Transaction.transaction_type == TransactionType.EXPENDITURE, amount), else_=0)), 0),
+        func.count(Transaction.id),
+    )
+
+
+def _movement_filter(start, end):
+    # 月結產生的期初收入紀錄不計入任何月份的收支
+    conditions = [Transaction.entry_kind != EntryKind.CARRY_FORWARD, Transaction.transaction_date < end]
+    if start is not None:
+        conditions.append(Transaction.transaction_date >= start)
+    return conditions
+
+
+def previous_close(year, month):
+    """(year, month) 之前最近的一個檢查點；沒有時回傳 None"""
+    return PeriodClose.query.filter(
+        tuple_(PeriodClose.year, PeriodClose.month) < (year, month)
+    ).order_by(PeriodClose.year.desc(), PeriodClose.month.desc()).first()
+
+
+def opening_balance(period):
+    """
+    period 的期初餘額：前一個檢查點的期末餘額，加上檢查點之後到 period 開始前的交易。
+    中間的月份都已結轉時，第二段查詢的範圍是空的。
+    """
+    previous = previous_close(period.start.year, period.start.month)
+    balance, gap_start = Decimal('0.0'), None
+    if previous is not None:
+        balance = previous.closing_balance
+        gap_start = Period.month(previous.year, previous.month).end
+    if gap_start is None or gap_start < period.start:
+        income, expenditure, _ = db.session.execute(
+            select(*_movement_columns()).where(*_movement_filter(gap_start, period.start))
+        ).one()
+        balance += Decimal(income) + Decimal(expenditure)
+    return balance
+
+
+def monthly_movements(period):
+    """period 內逐月的 (收入, 支出, 筆數)，以 {(year, month): (...)} 回傳；一次查詢"""
+    year = db.extract('year', Transaction.transaction_date)
+    month = db.extract('month', Transaction.transaction_date)
+    rows = db.session.execute(
+        select(year, month, *_movement_columns())
+        .where(*_movement_filter(period.start, period.end))
+        .group_by(year, month)
+    ).all()
+    return {(int(y), int(m)): (Decimal(income), Decimal(expenditure), count) for y, m, income, expenditure, count in rows}
+
+
+def close_months(first, last, user, today=None):
+    """
+    依序結轉 first 到 last (皆為整月 Period) 之間的每個月，回傳建立的 PeriodClose。
+
+    每個月建立一個檢查點與一筆次月一日的期初收入紀錄。任何一個月無法結轉時丟出
+    PeriodCloseError，例外的 closed 屬性為已加入 session、尚未 commit 的檢查點，
+    呼叫端可決定要保留或 rollback。
+    """
+    today = today or date.today()
+    period = Period(first.start, last.end, '')
+    months = period.split_months()
+
+    later = PeriodClose.query.filter(
+        tuple_(PeriodClose.year, PeriodClose.month) >= (first.start.year, first.start.month)
+    ).order_by(PeriodClose.year, PeriodClose.month).first()
+    if later is not None:
+        if (later.year, later.month) <= (last.start.year, last.start.month):
+            raise PeriodCloseError(f'{later.year}年{later.month}月的結轉紀錄已存在，無法重複執行。')
+        raise PeriodCloseError(f'{later.year}年{later.month}月已經結轉，不能再結轉更早的月份。')
+
+    balance = opening_balance(period)
+    movements = monthly_movements(period)
+    closed = []
+    for month in months:
+        year_month = (month.start.year, month.start.month)
+        income, expenditure, count = movements.get(year_month, (Decimal('0.0'), Decimal('0.0'), 0))
+        closing_balance = balance + income + expenditure
+        if closing_balance < 0:
+            error = PeriodCloseError(f'{year_month[0]}年{year_month[1]}月結餘為負 (${closing_balance})，無法進行結轉。請檢查帳目。')
+            error.closed = closed
+            raise error
+
+        settlement = Transaction(
+            transaction_type=TransactionType.INCOME,
+            application_date=today,
+            transaction_date=month.end,
+            applicant_id=user.id,
+            description=settlement_description(user, *year_month),
+            total_amount=closing_balance,
+            subtotal=closing_balance,
+            tax=0,
+            tax_type=TaxType.TAX_EXEMPT,
+            status=ApprovalStatus.APPROVED,
+            entry_kind=EntryKind.CARRY_FORWARD
+        )
+        checkpoint = PeriodClose(
+            year=year_month[0], month=year_month[1],
+            opening_balance=balance, total_income=income, total_expenditure=expenditure,
+            closing_balance=closing_balance, transaction_count=count,
+            settlement_transaction=settlement, closed_by_id=user.id
+        )
+        db.session.add_all([settlement, checkpoint])
+        closed.append(checkpoint)
+        balance = closing_balance
+    return closed
+
+
+def close_month(year, month, user, today=None):
+    """結轉單一月份"""
+    period = Period.month(year, month)
+    return close_months(period, period, user, today)[0]
+
+
+def verify_period_closes():
+    """
+    從交易資料重新計算每個檢查點，回傳不一致的 [(PeriodClose, 重算的期末餘額)]。
+    結轉後才補登或修改已結轉月份的交易，就會在這裡出現差異。
+    """
+    closes = PeriodClose.query.order_by(PeriodClose.year, PeriodClose.month).all()
+    if not closes:
+        return []
+    first, last = closes[0], closes[-1]
+    period = Period(Period.month(first.year, first.month).start, Period.month(last.year, last.month).end, '')
+
+    # 第一個檢查點之前沒有檢查點，從開帳累計
+    income, expenditure, _ = db.session.execute(
+        select(*_movement_columns()).where(*_movement_filter(None, period.start))
+    ).one()
+    balance = Decimal(income) + Decimal(expenditure)
+    movements = monthly_movements(period)
+
+    mismatches = []
+    by_month = {(close.year, close.month): close for close in closes}
+    for month in period.split_months():
+        year_month = (month.start.year, month.start.month)
+        income, expenditure, _ = movements.get(year_month, (Decimal('0.0'), Decimal('0.0'), 0))
+        balance += income + expenditure
+        close = by_month.get(year_month)
+        if close is not None and close.closing_balance != balance:
+            mismatches.append((close, balance))
+    return mismatches
@@ -0,0 +1,403 @@
+"""零用金模組的 flask 指令 (flask petty-cash ...)"""
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+import click
+from sqlalchemy import func
+from flask import current_app, url_for
+from app import db
+from app.periods import Period, PERIOD_KINDS
+from .models import Transaction, TransactionItem, TransactionChange, CashCountSession, EntryKind, ApprovalStatus
+from .routes import (
+    petty_cash_bp, _transaction_list_query, _pending_approval_query,
+    _cash_count_history_query, _expense_by_category_query
+)
+from .ledger import rebuild_balance, verify_balance
+from .rollup import rebuild_rollup, verify_rollup
+from .closing import verify_period_closes
+from .changes import CHANGE_FEED_LIMIT, prune_changes
+from .importer import DEFAULT_CHUNK_SIZE, ImportFileError, import_expenditures
+from .exporter import EXPORT_FORMATS, export_query, generate_export, parse_filters
+from .concurrency import run_concurrency_check
+from app.modules.user.models import User
+from app.modules.invoice.models import Invoice
+from app.modules.invoice.reconcile import candidate_query
+from .benchmark import (
+    SEED_PASSWORD, seed_data, manager_client, timed_request, run_benchmark, run_login_benchmark, run_compression_benchmark,
+    compare_with_baseline
+)
+
+# 資料量會持續成長的資料表，出現在執行計畫中時不允許全表掃描
+LARGE_TABLES = (
+    'transactions', 'transaction_items', 'cash_count_sessions', 'cash_count_details', 'transaction_changes',
+    'invoices', 'invoice_match_reviews',
+)
+_FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+# 每個頁面一次請求最多允許的 SQL 敘述數 (登入者由使用者快取提供，不計入)，與資料筆數無關
+QUERY_BUDGETS = {
+    'petty_cash.index': 3,  # 含交易異動的游標
+    'petty_cash.approval_dashboard': 3,
+    'petty_cash.cash_count_history': 1,
+    'petty_cash.transaction_detail': 3,  # 含 ETag 的版本戳記
+    'petty_cash.cash_count_session_detail': 3,
+    'petty_cash.report_expense_by_category': 2,
+    'invoice.reconcile': 3,  # 筆數、待確認的發票、候選交易 (selectinload)
+}
+# 帶 If-None-Match 重新驗證 (回應 304) 時只允許查詢版本戳記
+REVALIDATION_BUDGET = 1
+
+
+@petty_cash_bp.cli.command('rebuild-balance')
+def rebuild_balance_command():
+    """從交易資料重新計算系統餘額快照"""
+    balance = rebuild_balance()
+    db.session.commit()
+    click.echo(f'餘額快照已重建：{balance}')
+
+
+@petty_cash_bp.cli.command('verify-balance')
+def verify_balance_command():
+    """檢查餘額快照是否與交易資料一致"""
+    stored, actual = verify_balance()
+    if stored is None:
+        click.echo(f'尚未建立餘額快照，實際餘額為 {actual}。請執行 flask petty-cash rebuild-balance。')
+        raise SystemExit(1)
+    if stored != actual:
+        click.echo(f'餘額快照不一致：快照 {stored}，實際 {actual}，差額 {actual - stored}')
+        raise SystemExit(1)
+    click.echo(f'餘額快照一致：{stored}')
+
+
+def _hot_queries():
+    """各頁面實際使用的查詢 (與路由中的分頁大小一致)"""
+    return {
+        'index': _transaction_list_query().limit(10),
+        'approval_dashboard': _pending_approval_query().limit(15),
+        'cash_count_history': _cash_count_history_query().limit(15),
+        'transaction_detail.items': TransactionItem.query.filter_by(transaction_id=1),
+        'report_expense_by_category': _expense_by_category_query([Period.month(2025, 1)]),
+        'report_expense_by_category.yoy': _expense_by_category_query([Period.quarter(2024, 1), Period.quarter(2025, 1)]),
+        'report_expense_by_category.range': _expense_by_category_query([Period.between(date(2025, 1, 10), date(2025, 2, 9))]),
+        'latest_settlement': Transaction.query.filter(Transaction.entry_kind == EntryKind.CARRY_FORWARD)
+                                              .order_by(Transaction.transaction_date.desc()).limit(1),
+        'changes_since': TransactionChange.query.filter(TransactionChange.id >= 1)
+                                                .order_by(TransactionChange.id).limit(CHANGE_FEED_LIMIT + 2),
+        'invoice_report': Invoice.query.filter(Period.month(2025, 1).predicate(Invoice.invoice_date)),
+        'invoice_reconcile.candidates': candidate_query(),
+        'invoice_reconcile.candidates.range': candidate_query(since=date(2025, 1, 1), until=date(2025, 1, 31)),
+    }
+
+
+def explain_query_plan(query):
+    """回傳 SQLite EXPLAIN QUERY PLAN 的 detail 欄位清單 (query 為 ORM 查詢或 Core select)"""
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+    return [row[-1] for row in rows]
+
+
+def full_table_scans(plan):
+    """從執行計畫中找出對大型資料表的全表掃描"""
+    scans = []
+    for detail in plan:
+        match = _FULL_SCAN.match(detail)
+        if match and match.group(1) in LARGE_TABLES:
+            scans.append(detail)
+    return scans
+
+
+@petty_cash_bp.cli.command('rebuild-rollup')
+def rebuild_rollup_command():
+    """從交易資料重新產生每月分類彙總表"""
+    count = rebuild_rollup()
+    db.session.commit()
+    click.echo(f'每月分類彙總表已重建：{count} 列')
+
+
+@petty_cash_bp.cli.command('verify-rollup')
+def verify_rollup_command():
+    """檢查每月分類彙總表是否與交易資料一致"""
+    mismatches = verify_rollup()
+    for key, stored, actual in mismatches:
+        click.echo(f'{key.year}-{key.month:02d} 分類 {key.category_id} {key.status.name} {key.transaction_type.name}：'
+                   f'彙總表 {stored}，實際 {actual}')
+    if mismatches:
+        click.echo(f'共 {len(mismatches)} 列不一致。請執行 flask petty-cash rebuild-rollup。')
+        raise SystemExit(1)
+    click.echo('每月分類彙總表一致。')
+
+
+@petty_cash_bp.cli.command('verify-period-closes')
+def verify_period_closes_command():
+    """檢查月結檢查點的期末餘額是否與交易資料一致"""
+    mismatches = verify_period_closes()
+    for close, actual in mismatches:
+        click.echo(f'{close.year}-{close.month:02d}：檢查點 {close.closing_balance}，實際 {actual}')
+    if mismatches:
+        click.echo(f'共 {len(mismatches)} 個月份不一致，結轉後可能補登或修改了已結轉月份的交易。')
+        raise SystemExit(1)
+    click.echo('月結檢查點一致。')
+
+
+@petty_cash_bp.cli.command('prune-changes')
+@click.option('--days', default=30, show_default=True, help='保留最近幾天的交易異動紀錄')
+def prune_changes_command(days):
+    """刪除較舊的交易異動紀錄 (游標早於保留範圍的頁面會提示重新整理)"""
+    deleted = prune_changes(datetime.utcnow() - timedelta(days=days))
+    click.echo(f'已刪除 {deleted} 筆 {days} 天前的交易異動紀錄。')
+
+
+@petty_cash_bp.cli.command('check-query-plans')
+def check_query_plans_command():
+    """檢查各頁面查詢的執行計畫，出現全表掃描時以非零狀態結束"""
+    failed = False
+    for name, query in _hot_queries().items():
+        plan = explain_query_plan(query)
+        scans = full_table_scans(plan)
+        status = '全表掃描' if scans else 'OK'
+        click.echo(f'[{status}] {name}')
+        for detail in plan:
+            click.echo(f'    {detail}')
+        failed = failed or bool(scans)
+    if failed:
+        raise SystemExit(1)
+
+
+def _budget_urls():
+    """要檢查的頁面網址；詳情頁面取最新一筆資料"""
+    urls = {endpoint: url_for(endpoint) for endpoint in QUERY_BUDGETS if not endpoint.endswith('_detail')}
+    latest_transaction = db.session.query(func.max(Transaction.id)).scalar()
+    if latest_transaction:
+        urls['petty_cash.transaction_detail'] = url_for('petty_cash.transaction_detail', transaction_id=latest_transaction)
+    latest_session = db.session.query(func.max(CashCountSession.id)).scalar()
+    if latest_session:
+        urls['petty_cash.cash_count_session_detail'] = url_for('petty_cash.cash_count_session_detail', session_id=latest_session)
+    return urls
+
+
+@petty_cash_bp.cli.command('check-query-budgets')
+def check_query_budgets_command():
+    """以主管身分請求各頁面，SQL 敘述數超出預算時以非零狀態結束"""
+    client = manager_client()
+    if client is None:
+        click.echo('找不到主管帳號，無法檢查需要權限的頁面。')
+        raise SystemExit(1)
+
+    with current_app.test_request_context():
+        urls = _budget_urls()
+    # 先請求一次，讓餘額快照等一次性初始化不計入預算
+    client.get(urls['petty_cash.index'])
+
+    failed = False
+    for endpoint, url in urls.items():
+        response, _, query_count = timed_request(client, 'GET', url)
+        budget = QUERY_BUDGETS[endpoint]
+        over = response.status_code != 200 or query_count > budget
+        click.echo(f'[{"超出預算" if over else "OK"}] {endpoint}: {query_count}/{budget} 次查詢 (HTTP {response.status_code})')
+        failed = failed or over
+
+        if response.headers.get('ETag'):
+            response, _, query_count = timed_request(client, 'GET', url, headers={'If-None-Match': response.headers['ETag']})
+            over = response.status_code != 304 or query_count > REVALIDATION_BUDGET
+            click.echo(f'[{"超出預算" if over else "OK"}] {endpoint} (304): {query_count}/{REVALIDATION_BUDGET} 次查詢 (HTTP {response.status_code})')
+            failed = failed or over
+    if failed:
+        raise SystemExit(1)
+
+
+@petty_cash_bp.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--applicant', required=True, help='檔案未填申請人帳號時使用的帳號')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='每個資料庫交易寫入的支出單數')
+@click.option('--dry-run', is_flag=True, help='只驗證不寫入')
+def import_command(path, applicant, chunk_size, dry_run):
+    """從 CSV/XLSX 批次匯入支出單"""
+    user = User.query.filter_by(account_id=applicant).first()
+    if user is None:
+        raise click.BadParameter(f'找不到帳號 {applicant}', param_hint='--applicant')
+
+    def report(result):
+        click.echo(f'\r已處理 {result.transactions} 張支出單、{result.items} 筆明細', nl=False)
+
+    started = time.perf_counter()
+    try:
+        with open(path, 'rb') as stream:
+            result = import_expenditures(stream, path, user.id, chunk_size=chunk_size, dry_run=dry_run, progress=report)
+    except ImportFileError as e:
+        raise click.ClickException(str(e))
+    click.echo()
+
+    for error in result.errors:
+        click.echo(f'第 {error.line} 列 (單號 {error.ref})：{error.message}')
+    verb = '驗證通過' if dry_run else '匯入'
+    click.echo(f'{verb} {result.transactions} 張支出單、{result.items} 筆明細，略過 {len(result.errors)} 張，'
+               f'耗時 {time.perf_counter() - started:.1f} 秒。')
+    if result.errors:
+        raise SystemExit(1)
+
+
+@petty_cash_bp.cli.command('export')
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), help='輸出檔案 (預設輸出到標準輸出)')
+@click.option('--period', type=click.Choice(list(PERIOD_KINDS)), help='期間類型，未指定時匯出全部期間')
+@click.option('--year', type=int)
+@click.option('--month', type=int)
+@click.option('--quarter', type=int)
+@click.option('--vat', type=int, help='營業稅期別 (1-6)')
+@click.option('--start', help='自訂區間開始日 (YYYY-MM-DD)')
+@click.option('--end', help='自訂區間結束日 (YYYY-MM-DD，含當天)')
+@click.option('--status', type=click.Choice([status.name for status in ApprovalStatus]))
+@click.option('--category', type=int, help='費用分類ID')
+def export_command(fmt, output, **options):
+    """串流匯出交易與明細 (含申請人、簽核主管與分類名稱)"""
+    args = {key: str(value) for key, value in options.items() if value is not None}
+    if 'period' not in args:
+        # 只給年份時匯出整個會計年度
+        if 'start' in args:
+            args['period'] = 'range'
+        elif 'year' in args and 'month' not in args:
+            args['period'] = 'fiscal'
+    try:
+        filters = parse_filters(args, fiscal_start_month=current_app.config['FISCAL_YEAR_START_MONTH'])
+    except (ValueError, TypeError, KeyError) as e:
+        raise click.ClickException(f'匯出條件格式錯誤：{e}')
+
+    chunks = generate_export(fmt, export_query(**filters))
+    if output is None:
+        for chunk in chunks:
+            click.echo(chunk, nl=False)
+        return
+    with open(output, 'w', encoding='utf-8', newline='') as stream:
+        for chunk in chunks:
+            stream.write(chunk)
+    click.echo(f'已匯出至 {output}', err=True)
+
+
+@petty_cash_bp.cli.command('check-concurrency')
+@click.option('--writers', default=8, show_default=True, help='寫入執行緒數')
+@click.option('--readers', default=8, show_default=True, help='讀取執行緒數')
+@click.option('--seconds', default=5.0, show_default=True, help='執行秒數')
+@click.option('--no-pragmas', is_flag=True, help='不套用 SQLITE_PRAGMAS，與調校後的結果比較')
+def check_concurrency_command(writers, readers, seconds, no_pragmas):
+    """以多個寫入/讀取執行緒同時存取一個暫存的 SQLite 檔案資料庫，檢查是否出現鎖定錯誤"""
+    # 暫存的檔案資料庫一律使用連線池，不論目前設定的是否為記憶體資料庫
+    engine_options = dict(current_app.config['SQLALCHEMY_ENGINE_OPTIONS'], **current_app.config['SQLALCHEMY_POOL_OPTIONS'])
+    pragmas = None if no_pragmas else current_app.config['SQLITE_PRAGMAS']
+    if no_pragmas:
+        engine_options.pop('connect_args', None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        stats, effective, (stored, actual) = run_concurrency_check(
+            os.path.join(directory, 'concurrency.db'), engine_options, pragmas, writers, readers, seconds
+        )
+
+    click.echo(f'PRAGMA：{", ".join(f"{name}={value}" for name, value in effective.items())}')
+    click.echo(f'{writers} 個寫入 / {readers} 個讀取執行緒，{seconds:g} 秒：'
+               f'寫入 {stats.writes} 次 (最久 {stats.max_write_ms:.0f}ms)，讀取 {stats.reads} 次，錯誤 {len(stats.errors)} 次')
+    for message in sorted(set(stats.errors)):
+        click.echo(f'  {message}')
+    consistent = stored == actual
+    click.echo(f'餘額快照 {stored}，實際 {actual}：{"一致" if consistent else "不一致"}')
+    if stats.errors or not consistent:
+        raise SystemExit(1)
+
+
+@petty_cash_bp.cli.command('seed')
+@click.option('--transactions', default=200_000, show_default=True, help='交易筆數')
+@click.option('--items-per-transaction', default=5, show_default=True, help='每筆支出平均明細數')
+@click.option('--users', default=300, show_default=True, help='使用者人數')
+@click.option('--categories', default=30, show_default=True, help='費用分類數')
+@click.option('--cash-counts', default=2_000, show_default=True, help='盤點紀錄筆數')
+@click.option('--invoices', default=50_000, show_default=True, help='發票張數 (invoices 資料表存在時)')
+@click.option('--years', default=3, show_default=True, help='資料涵蓋的年數 (到今天為止)')
+@click.option('--seed', type=int, default=None, help='亂數種子，指定後每次產生相同資料')
+def seed_command(transactions, items_per_transaction, users, categories, cash_counts, invoices, years, seed):
+    """產生效能測試用的模擬資料 (會寫入目前設定的資料庫)"""
+    started = time.perf_counter()
+    counts = seed_data(transactions, items_per_transaction, users, categories, cash_counts, invoices, years, seed)
+    for table, count in counts.items():
+        click.echo(f'{table}: {count}')
+    click.echo(f'完成，耗時 {time.perf_counter() - started:.1f} 秒。模擬使用者密碼為 {SEED_PASSWORD}')
+
+
+@petty_cash_bp.cli.command('benchmark')
+@click.option('--rounds', default=20, show_default=True, help='每個頁面量測次數')
+@click.option('--output', type=click.Path(dir_okay=False), help='將結果寫入 JSON 基準檔')
+@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False), help='與既有的 JSON 基準檔比較')
+@click.option('--tolerance', default=1.2, show_default=True, help='p95 可接受的倍數')
+def benchmark_command(rounds, output, baseline_path, tolerance):
+    """量測主要頁面的 p50/p95 延遲與查詢次數"""
+    try:
+        results = run_benchmark(rounds)
+    except RuntimeError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+
+    for name, stats in results.items():
+        click.echo(f'{name:45} p50 {stats["p50_ms"]:>9.2f}ms  p95 {stats["p95_ms"]:>9.2f}ms  '
+                   f'{stats["queries"]:>3} 次查詢  HTTP {stats["statuses"]}')
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        click.echo(f'結果已寫入 {output}')
+
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            regressions = compare_with_baseline(results, json.load(f), tolerance)
+        for regression in regressions:
+            click.echo(f'[退步] {regression}')
+        if regressions:
+            raise SystemExit(1)
+        click.echo('與基準相比沒有退步。')
+
+
+@petty_cash_bp.cli.command('benchmark-compression')
+@click.option('--rounds', default=20, show_default=True, help='量測壓縮 CPU 時間的次數')
+def benchmark_compression_command(rounds):
+    """比較各頁面壓縮前後實際傳送的位元組數與壓縮增加的 CPU 時間"""
+    try:
+        results = run_compression_benchmark(rounds)
+    except RuntimeError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+
+    config = current_app.config
+    click.echo(f'門檻 {config["COMPRESS_MIN_SIZE"]} bytes、gzip 等級 {config["COMPRESS_LEVEL"]}、'
+               f'brotli 品質 {config["COMPRESS_BROTLI_QUALITY"]}')
+    for name, stats in results.items():
+        click.echo(f'{name:45} HTTP {stats["status"]}  未壓縮 {stats["identity_bytes"]:>10,} bytes')
+        for encoding, encoded in stats['encodings'].items():
+            if not encoded['encoded']:
+                click.echo(f'{"":45}   {encoding:>4}: 未壓縮 (低於門檻或類型不適用)')
+                continue
+            ratio = stats['identity_bytes'] / encoded['bytes'] if encoded['bytes'] else 0
+            click.echo(f'{"":45}   {encoding:>4}: {encoded["bytes"]:>10,} bytes  ({ratio:.1f}x)  '
+                       f'CPU +{encoded["cpu_ms"]:.2f}ms')
+
+
+@petty_cash_bp.cli.command('benchmark-login')
+@click.option('--cost', 'costs', type=click.IntRange(4, 31), multiple=True, help='要比較的 bcrypt 成本，可重複指定 (預設為目前設定)')
+@click.option('--logins', default=40, show_default=True, help='每個成本的登入次數')
+@click.option('--concurrency', default=4, show_default=True, help='同時登入的執行緒數')
+@click.option('--probes', default=30, show_default=True, help='閒置時量測頁面延遲的次數')
+def benchmark_login_command(costs, logins, concurrency, probes):
+    """量測同時登入的吞吐量，以及登入尖峰時其他頁面 (盤點工具) 的延遲"""
+    costs = costs or (current_app.config['BCRYPT_LOG_ROUNDS'],)
+    try:
+        results = run_login_benchmark(costs, logins, concurrency, probes)
+    except RuntimeError as e:
+        click.echo(str(e))
+        raise SystemExit(1)
+
+    click.echo(f'同時登入 {concurrency} 個執行緒、每個成本 {logins} 次；'
+               f'每個行程同時雜湊上限 {current_app.config["PASSWORD_HASH_CONCURRENCY"]}')
+    for cost, stats in results.items():
+        click.echo(f'成本 {cost:>2}：登入 {stats["logins_per_sec"]:>7.2f} 次/秒  '
+                   f'p50 {stats["login_p50_ms"]:>8.2f}ms  p95 {stats["login_p95_ms"]:>8.2f}ms  HTTP {stats["login_statuses"]}')
+        click.echo(f'        其他頁面 閒置 p50 {stats["idle_p50_ms"]:>7.2f}ms  p95 {stats["idle_p95_ms"]:>7.2f}ms  '
+                   f'尖峰 p50 {stats["busy_p50_ms"]:>7.2f}ms  p95 {stats["busy_p95_ms"]:>7.2f}ms')
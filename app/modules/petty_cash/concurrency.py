@@ -0,0 +1,161 @@
+"""
+SQLite 同時寫入/讀取檢查 (flask petty-cash check-concurrency)
+
+以目前設定的 engine 參數與 PRAGMA 建立一個獨立的檔案資料庫，
+同時啟動多個寫入執行緒 (新增支出、簽核、盤點) 與讀取執行緒 (餘額、待簽核筆數)，
+統計各自完成的次數與 "database is locked" 等錯誤，最後確認餘額快照仍與交易資料一致。
+"""
+import os
+import random
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from app import db
+from app.database import install_sqlite_pragmas, read_sqlite_pragmas
+from app.modules.user.models import User, UserRole
+from .models import (
+    Transaction, TransactionItem, TransactionType, TaxType, ApprovalStatus, CashCountSession, CashCountDetail,
+    Category, LedgerBalance
+)
+from . import ledger
+
+
+class ConcurrencyStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.reads = 0
+        self.errors = []
+        self.max_write_ms = 0.0
+
+    def record_write(self, elapsed):
+        with self.lock:
+            self.writes += 1
+            self.max_write_ms = max(self.max_write_ms, elapsed * 1000)
+
+    def record_read(self):
+        with self.lock:
+            self.reads += 1
+
+    def record_error(self, error):
+        with self.lock:
+            self.errors.append(str(error).splitlines()[0])
+
+
+def _setup(engine):
+    db.metadata.create_all(engine)
+    with Session(engine) as session:
+        user = User(account_id='C0001', display_name='並行測試', email='concurrency@example.com',
+                    password_hash='x' * 60, role=UserRole.MANAGER)
+        category = Category(name='並行測試')
+        session.add_all([user, category])
+        session.flush()
+        session.add(Transaction(
+            transaction_type=TransactionType.INCOME, transaction_date=date.today(), application_date=date.today(),
+            applicant_id=user.id, description='零用金撥補', total_amount=Decimal('100000'), subtotal=Decimal('100000'),
+            tax=0, tax_type=TaxType.TAX_EXEMPT, status=ApprovalStatus.APPROVED
+        ))
+        session.flush()
+        ledger.rebuild_balance(session.connection())
+        session.commit()
+        return user.id, category.id
+
+
+def _add_expenditure(session, user_id, category_id, rng):
+    amount = Decimal(rng.randint(10, 500))
+    transaction = Transaction(
+        transaction_type=TransactionType.EXPENDITURE, transaction_date=date.today(), application_date=date.today(),
+        applicant_id=user_id, category_id=category_id, description='並行測試支出',
+        subtotal=amount, tax=0, total_amount=-amount, tax_type=TaxType.TAX_EXEMPT, status=ApprovalStatus.PENDING
+    )
+    transaction.items.append(TransactionItem(item_name='測試品', quantity=1, unit_price=amount, line_total=amount))
+    session.add(transaction)
+
+
+def _approve_one(session, user_id):
+    transaction = session.scalars(
+        select(Transaction).where(Transaction.status == ApprovalStatus.PENDING).limit(1)
+    ).first()
+    if transaction is not None:
+        transaction.status = ApprovalStatus.APPROVED
+        transaction.approver_id = user_id
+        transaction.approval_date = date.today()
+
+
+def _add_cash_count(session, user_id, rng):
+    balance = session.scalar(select(LedgerBalance.balance).where(LedgerBalance.id == ledger.LEDGER_ID))
+    count_session = CashCountSession(
+        count_date=datetime.utcnow(), counted_total=balance, system_balance=balance, difference=0, user_id=user_id
+    )
+    for denomination in (1000, 500, 100):
+        quantity = rng.randint(0, 20)
+        count_session.details.append(CashCountDetail(
+            denomination=denomination, quantity=quantity, subtotal=denomination * quantity
+        ))
+    session.add(count_session)
+
+
+def _writer(engine, stop, stats, user_id, category_id, seed):
+    rng = random.Random(seed)
+    actions = (
+        lambda session: _add_expenditure(session, user_id, category_id, rng),
+        lambda session: _approve_one(session, user_id),
+        lambda session: _add_cash_count(session, user_id, rng),
+    )
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with Session(engine) as session:
+                rng.choice(actions)(session)
+                session.commit()
+            stats.record_write(time.perf_counter() - started)
+        except OperationalError as e:
+            stats.record_error(e)
+
+
+def _reader(engine, stop, stats):
+    while not stop.is_set():
+        try:
+            with Session(engine) as session:
+                session.scalar(select(LedgerBalance.balance).where(LedgerBalance.id == ledger.LEDGER_ID))
+                session.scalar(select(func.count(Transaction.id)).where(Transaction.status == ApprovalStatus.PENDING))
+                session.scalar(select(func.count(CashCountSession.id)))
+            stats.record_read()
+        except OperationalError as e:
+            stats.record_error(e)
+
+
+def run_concurrency_check(path, engine_options, pragmas, writers=8, readers=8, seconds=5.0):
+    """
+    在 path (不存在的新檔案) 上執行檢查，回傳 (ConcurrencyStats, 實際使用的 PRAGMA, (快照餘額, 實際餘額))。
+    pragmas 為 None 時不套用任何 PRAGMA，可與調校後的結果比較。
+    """
+    engine = create_engine(f'sqlite:///{os.path.abspath(path)}', **engine_options)
+    install_sqlite_pragmas(engine, pragmas)
+    try:
+        user_id, category_id = _setup(engine)
+        with engine.connect() as connection:
+            effective = read_sqlite_pragmas(connection, ['journal_mode', 'synchronous', 'busy_timeout', 'mmap_size'])
+
+        stats, stop = ConcurrencyStats(), threading.Event()
+        threads = [
+            threading.Thread(target=_writer, args=(engine, stop, stats, user_id, category_id, index))
+            for index in range(writers)
+        ] + [threading.Thread(target=_reader, args=(engine, stop, stats)) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        with engine.connect() as connection:
+            stored = connection.scalar(select(LedgerBalance.balance).where(LedgerBalance.id == ledger.LEDGER_ID))
+            actual, _ = ledger.compute_balance(connection)
+        return stats, effective, (stored, actual)
+    finally:
+        engine.dispose()
@@ -1,19 +1,50 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, DateField, DecimalField, FieldList, FormField, RadioField, SelectField, SubmitField, TextAreaField
-from wtforms_sqlalchemy.fields import QuerySelectField
-from wtforms.validators import DataRequired, Optional, Length
-from .models import Category
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import HiddenField, StringField, DateField, DecimalField, FieldList, FormField, RadioField, SelectField, SelectMultipleField, SubmitField, TextAreaField
+from wtforms.validators import DataRequired, Optional, Length, ValidationError
+from .categories import category_choices, category_name
 
-def category_query():
-    """查詢所有費用分類，並依名稱排序"""
-    return Category.query.order_by(Category.name).all()
+def _optional_int(value):
+    if value in (None, ''):
+        return None
+    return int(value)
+
+def _category_options():
+    """費用分類選項 (依名稱排序)，取自行程內快取"""
+    return [('', '-- 請選擇分類 --')] + list(category_choices().choices)
+
+class CategorySelectField(SelectField):
+    """
+    費用分類下拉選單，資料為分類 ID (int)。
+    驗證時只確認分類版本號，以快取中的 id -> 名稱對照表檢查，不重新載入整張分類表。
+    """
+    def __init__(self, label=None, validators=None, **kwargs):
+        super().__init__(label, validators, coerce=_optional_int, choices=_category_options, **kwargs)
+
+    def pre_validate(self, form):
+        # 未選擇時交給 DataRequired 顯示訊息
+        if self.data is not None and category_name(self.data, max_age=0) is None:
+            raise ValidationError('所選的費用分類不存在，請重新選擇。')
+
+def check_item_amount(value, label):
+    """明細的數量與單價必須是大於 0 的有限數字 (表單與批次匯入共用)；不符合時丟出 ValueError"""
+    if not value.is_finite() or value <= 0:
+        raise ValueError(f'{label}必須是大於 0 的數字：{value}')
+
+def _item_amount(form, field):
+    if field.data is not None:
+        try:
+            check_item_amount(field.data, field.label.text)
+        except ValueError as e:
+            raise ValidationError(str(e))
 
 class ItemForm(FlaskForm):
     """支出申請中的單一項目子表單"""
+    id = HiddenField()  # 編輯時對應既有明細；新增的列為空白
     item_name = StringField('品名', validators=[DataRequired(message="請填寫品名")])
-    quantity = DecimalField('數量', validators=[DataRequired(message="請填寫數量")], places=2)
+    quantity = DecimalField('數量', validators=[DataRequired(message="請填寫數量"), _item_amount], places=2)
     unit = StringField('單位')
-    unit_price = DecimalField('單價', validators=[DataRequired(message="請填寫單價")], places=2)
+    unit_price = DecimalField('單價', validators=[DataRequired(message="請填寫單價"), _item_amount], places=2)
 
 class ExpenditureForm(FlaskForm):
     """支出申請主表單"""
@@ -22,12 +53,8 @@ class ExpenditureForm(FlaskForm):
     erp_document_number = StringField('ERP對應單號', validators=[Optional()])
     applicant_name = StringField('申請人')
     description = StringField('摘要說明', validators=[DataRequired(message="請填寫摘要說明")])
-    category_id = QuerySelectField(
+    category_id = CategorySelectField(
         '費用分類',
-        query_factory=category_query,
-        get_label='name',
-        allow_blank=True,
-        blank_text='-- 請選擇分類 --',
         validators=[DataRequired(message="請選擇一個費用分類")]
     )
     tax_type = SelectField(
@@ -57,11 +84,30 @@ class MonthEndSettlementForm(FlaskForm):
     month = StringField('月份', validators=[DataRequired()])
     submit = SubmitField('執行月結')
 
+class SettleRangeForm(FlaskForm):
+    """批次月結表單：一次結轉連續數個月份"""
+    start_year = StringField('起始年份', validators=[DataRequired()])
+    start_month = StringField('起始月份', validators=[DataRequired()])
+    end_year = StringField('結束年份', validators=[DataRequired()])
+    end_month = StringField('結束月份', validators=[DataRequired()])
+    submit = SubmitField('批次結轉')
+
+class ImportForm(FlaskForm):
+    """支出批次匯入表單"""
+    file = FileField('匯入檔案', validators=[FileRequired(message="請選擇檔案"), FileAllowed(['csv', 'xlsx'], '只接受 CSV 或 XLSX 檔')])
+    submit = SubmitField('開始匯入')
+
 class RejectionForm(FlaskForm):
     """駁回理由表單"""
     rejection_reason = TextAreaField('駁回理由', validators=[DataRequired(message="請填寫駁回理由")])
     submit = SubmitField('確認駁回')
 
+class BulkApprovalForm(FlaskForm):
+    """批次簽核表單：勾選的交易 ID 與動作 (核准/駁回)，駁回時共用一個理由"""
+    transaction_ids = SelectMultipleField('交易', coerce=int, validate_choice=False, validators=[DataRequired(message="請至少勾選一筆交易")])
+    action = SelectField('動作', choices=[('approve', '核准'), ('reject', '駁回')], validators=[DataRequired()])
+    rejection_reason = TextAreaField('駁回理由', validators=[Optional()])
+
 class CategoryForm(FlaskForm):
     """費用分類表單"""
     name = StringField('分類名稱', validators=[DataRequired(), Length(min=1, max=100)])
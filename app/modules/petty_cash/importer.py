@@ -0,0 +1,316 @@
+"""
+支出批次匯入 (CSV / XLSX)
+
+檔案每一列是一筆明細，「單號」相同且相鄰的列屬於同一張支出單。
+檔案以串流方式逐列讀取，每累積 chunk_size 張支出單就驗證並以 executemany
+一次寫入 (每個 chunk 一個資料庫交易)，不必逐張經過 ExpenditureForm 與 commit。
+Core 批次寫入不會觸發 mapper 事件，因此餘額快照、每月彙總表與異動紀錄在同一個交易內一併更新。
+"""
+import csv
+import io
+import os
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert, select
+from app import db
+from app.modules.user.models import User
+from .models import (
+    Transaction, TransactionItem, TransactionType, TaxType, TaxCalculationMethod, ApprovalStatus, EntryKind, Category,
+    ChangeAction
+)
+from .tax import calculate_tax_and_total
+from .forms import check_item_amount
+from . import changes, ledger, rollup
+
+# 欄位代號 -> 檔案標題 (標題可用中文或欄位代號)
+COLUMNS = {
+    'ref': '單號',
+    'transaction_date': '交易日期',
+    'application_date': '申請日期',
+    'description': '摘要說明',
+    'category': '費用分類',
+    'tax_type': '稅別',
+    'tax_calculation_method': '計稅方式',
+    'erp_document_number': 'ERP對應單號',
+    'applicant': '申請人帳號',
+    'status': '簽核狀態',
+    'item_name': '品名',
+    'quantity': '數量',
+    'unit': '單位',
+    'unit_price': '單價',
+}
+REQUIRED_COLUMNS = ('ref', 'transaction_date', 'description', 'category', 'tax_type', 'item_name', 'quantity', 'unit_price')
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx')
+DEFAULT_CHUNK_SIZE = 1000
+# 匯入的支出單仍須經過簽核流程，不能直接匯入為已核准或已駁回
+IMPORTABLE_STATUSES = (ApprovalStatus.DRAFT, ApprovalStatus.PENDING)
+
+RowError = namedtuple('RowError', 'line ref message')
+
+
+class ImportFileError(ValueError):
+    """整個檔案無法匯入 (格式不支援、缺少必要欄位等)"""
+
+
+class ImportResult:
+    """匯入結果統計；errors 為逐列的 RowError"""
+
+    def __init__(self):
+        self.transactions = 0
+        self.items = 0
+        self.chunks = 0
+        self.errors = []
+
+
+# --- 讀取 ---
+
+def _normalize_header(header):
+    header = (str(header) if header is not None else '').strip()
+    for key, label in COLUMNS.items():
+        if header in (key, label):
+            return key
+    return None
+
+
+def _iter_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    yield from csv.reader(text)
+
+
+def _iter_xlsx(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError as e:
+        raise ImportFileError('匯入 XLSX 需要安裝 openpyxl 套件，或改用 CSV 檔。') from e
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def read_rows(stream, filename):
+    """逐列產生 (檔案列號, {欄位代號: 值})，第一列為標題"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise ImportFileError(f'不支援的檔案格式：{extension or filename}，請上傳 CSV 或 XLSX。')
+    rows = _iter_csv(stream) if extension == '.csv' else _iter_xlsx(stream)
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('檔案是空的。')
+    keys = [_normalize_header(cell) for cell in header]
+    missing = [COLUMNS[key] for key in REQUIRED_COLUMNS if key not in keys]
+    if missing:
+        raise ImportFileError(f'缺少必要欄位：{"、".join(missing)}')
+
+    for line, row in enumerate(rows, start=2):
+        values = {key: value for key, value in zip(keys, row) if key}
+        if not any(value not in (None, '') for value in values.values()):
+            continue
+        yield line, values
+
+
+def group_transactions(rows):
+    """把相鄰、單號相同的明細列合併成 (單號, [(列號, 值), ...])"""
+    current_ref, lines = None, []
+    for line, values in rows:
+        ref = str(values.get('ref') or '').strip()
+        if lines and ref != current_ref:
+            yield current_ref, lines
+            lines = []
+        current_ref = ref
+        lines.append((line, values))
+    if lines:
+        yield current_ref, lines
+
+
+# --- 驗證 ---
+
+def _text(value):
+    return str(value).strip() if value is not None else ''
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _text(value).replace('/', '-')
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f'日期格式錯誤：{value}')
+
+
+def _parse_decimal(value, label):
+    try:
+        return Decimal(_text(value).replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f'{label}不是數字：{value}')
+
+
+def _parse_enum(enum, value, label, default=None):
+    """可填寫代號 (TAXABLE) 或中文 (應稅)"""
+    text = _text(value)
+    if not text:
+        if default is not None:
+            return default
+        raise ValueError(f'請填寫{label}')
+    for member in enum:
+        if text in (member.name, member.value):
+            return member
+    raise ValueError(f'{label}不正確：{text}')
+
+
+class _Lookups:
+    """分類與申請人的對照表，整個匯入過程只查詢一次"""
+
+    def __init__(self, default_applicant_id):
+        self.categories = dict(db.session.execute(select(Category.name, Category.id)).all())
+        self.users = dict(db.session.execute(select(User.account_id, User.id)).all())
+        self.default_applicant_id = default_applicant_id
+
+    def category_id(self, name):
+        name = _text(name)
+        if name not in self.categories:
+            raise ValueError(f'找不到費用分類：{name}')
+        return self.categories[name]
+
+    def applicant_id(self, account_id):
+        account_id = _text(account_id)
+        if not account_id:
+            return self.default_applicant_id
+        if account_id not in self.users:
+            raise ValueError(f'找不到申請人帳號：{account_id}')
+        return self.users[account_id]
+
+
+def build_transaction(ref, lines, lookups, today=None):
+    """
+    驗證一張支出單，回傳 (交易資料列, [明細資料列])；金額計算與 add_expenditure 相同。
+    第一列提供表頭欄位，後續列只需要明細欄位。驗證失敗時丟出 ValueError。
+    """
+    if not ref:
+        raise ValueError('請填寫單號')
+    header = lines[0][1]
+    tax_type = _parse_enum(TaxType, header.get('tax_type'), '稅別')
+    method = _text(header.get('tax_calculation_method'))
+    tax_calculation_method = _parse_enum(TaxCalculationMethod, method, '計稅方式') if method else None
+    description = _text(header.get('description'))
+    if not description:
+        raise ValueError('請填寫摘要說明')
+
+    items = []
+    for line, values in lines:
+        item_name = _text(values.get('item_name'))
+        if not item_name:
+            raise ValueError(f'第 {line} 列請填寫品名')
+        quantity = _parse_decimal(values.get('quantity'), '數量')
+        unit_price = _parse_decimal(values.get('unit_price'), '單價')
+        # 與 ExpenditureForm 相同的規則
+        check_item_amount(quantity, f'第 {line} 列數量')
+        check_item_amount(unit_price, f'第 {line} 列單價')
+        items.append({
+            'item_name': item_name, 'quantity': quantity, 'unit': _text(values.get('unit')) or None,
+            'unit_price': unit_price, 'line_total': quantity * unit_price,
+        })
+
+    base_amount = sum(item['line_total'] for item in items)
+    subtotal, tax, total_amount = calculate_tax_and_total(
+        base_amount, tax_type.name, tax_calculation_method.name if tax_calculation_method else None
+    )
+    transaction_date = _parse_date(header.get('transaction_date'))
+    application_date = header.get('application_date')
+    status = _parse_enum(ApprovalStatus, header.get('status'), '簽核狀態', default=ApprovalStatus.DRAFT)
+    if status not in IMPORTABLE_STATUSES:
+        raise ValueError(f'簽核狀態只能是草稿或待簽核：{status.value}')
+    transaction = {
+        'transaction_type': TransactionType.EXPENDITURE,
+        'application_date': _parse_date(application_date) if _text(application_date) else (today or date.today()),
+        'transaction_date': transaction_date,
+        'erp_document_number': _text(header.get('erp_document_number')) or None,
+        'status': status,
+        'applicant_id': lookups.applicant_id(header.get('applicant')),
+        'description': description[:200],
+        'category_id': lookups.category_id(header.get('category')),
+        'tax_type': tax_type,
+        'tax_calculation_method': tax_calculation_method,
+        'subtotal': subtotal, 'tax': tax, 'total_amount': -total_amount,
+        'entry_kind': EntryKind.NORMAL,
+    }
+    return transaction, items
+
+
+# --- 寫入 ---
+
+def _write_chunk(transactions, items_per_transaction):
+    """一個 chunk 一個資料庫交易：executemany 寫入交易與明細，並更新餘額快照、彙總表與異動紀錄"""
+    connection = db.session.connection()
+    ids = connection.execute(
+        insert(Transaction.__table__).returning(Transaction.__table__.c.id, sort_by_parameter_order=True),
+        transactions
+    ).scalars().all()
+    item_rows = [
+        dict(item, transaction_id=transaction_id)
+        for transaction_id, items in zip(ids, items_per_transaction)
+        for item in items
+    ]
+    if item_rows:
+        connection.execute(insert(TransactionItem.__table__), item_rows)
+    ledger.apply_bulk_rows(connection, transactions)
+    rollup.apply_bulk_rows(connection, transactions)
+    changes.record_changes(connection, [
+        {'transaction_id': transaction_id, 'action': ChangeAction.CREATED, 'status': transaction['status']}
+        for transaction_id, transaction in zip(ids, transactions)
+    ])
+    db.session.commit()
+    return len(item_rows)
+
+
+def import_expenditures(stream, filename, applicant_id, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, progress=None):
+    """
+    從檔案串流匯入支出單，回傳 ImportResult。
+    驗證失敗的支出單整張略過並記錄錯誤，其他支出單照常匯入；dry_run 時只驗證不寫入。
+    progress 為每寫完一個 chunk 後呼叫的函式 (參數為 ImportResult)。
+    """
+    result = ImportResult()
+    lookups = _Lookups(applicant_id)
+    seen_refs = set()
+    transactions, items_per_transaction = [], []
+
+    def flush():
+        if transactions and not dry_run:
+            try:
+                result.items += _write_chunk(transactions, items_per_transaction)
+            except Exception:
+                db.session.rollback()
+                raise
+            result.chunks += 1
+        elif transactions:
+            result.items += sum(len(items) for items in items_per_transaction)
+        result.transactions += len(transactions)
+        transactions.clear()
+        items_per_transaction.clear()
+        if progress:
+            progress(result)
+
+    for ref, lines in group_transactions(read_rows(stream, filename)):
+        first_line = lines[0][0]
+        if ref in seen_refs:
+            result.errors.append(RowError(first_line, ref, '單號重複，同一張支出單的明細必須相鄰'))
+            continue
+        seen_refs.add(ref)
+        try:
+            transaction, items = build_transaction(ref, lines, lookups)
+        except ValueError as e:
+            result.errors.append(RowError(first_line, ref, str(e)))
+            continue
+        transactions.append(transaction)
+        items_per_transaction.append(items)
+        if len(transactions) >= chunk_size:
+            flush()
+    flush()
+    return result
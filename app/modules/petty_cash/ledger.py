@@ -0,0 +1,195 @@
+"""
+系統餘額的實體化維護
+
+原本每次顯示餘額都要掃描整個 transactions 資料表 (找最近一次結轉 + 兩次 SUM)。
+這裡改成把餘額存放在 ledger_balances 的單一資料列中，並在 Transaction 寫入的同一個
+資料庫交易 (flush) 內以差額更新，讀取時只需一次主鍵查詢。
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import event, func, inspect, select, update, insert
+from app import db
+from .models import Transaction, LedgerBalance, EntryKind
+
+LEDGER_ID = 1
+
+_transactions = Transaction.__table__
+_ledger = LedgerBalance.__table__
+
+
+def is_settlement(entry_kind):
+    """判斷一筆交易是否為餘額結轉紀錄"""
+    return entry_kind == EntryKind.CARRY_FORWARD
+
+
+def _settlement_clause():
+    return _transactions.c.entry_kind == EntryKind.CARRY_FORWARD
+
+
+def compute_balance(connection):
+    """
+    從頭重新計算餘額，回傳 (餘額, 最近一次結轉日期)。
+    結轉紀錄的金額是結轉日前一天的期末餘額，因此結轉日當天 (含) 以後的一般交易都要計入。
+    """
+    # 以 ix_transactions_entry_kind_date 直接定位最近一次結轉
+    latest_settlement = connection.execute(
+        select(_transactions.c.total_amount, _transactions.c.transaction_date)
+        .where(_settlement_clause())
+        .order_by(_transactions.c.transaction_date.desc())
+        .limit(1)
+    ).first()
+
+    balance = Decimal('0.0')
+    anchor_date = None
+    start_date = date(1900, 1, 1)
+    if latest_settlement:
+        balance = latest_settlement.total_amount
+        anchor_date = start_date = latest_settlement.transaction_date
+
+    movement = connection.execute(
+        select(func.sum(_transactions.c.total_amount)).where(
+            _transactions.c.transaction_date >= start_date,
+            ~_settlement_clause()
+        )
+    ).scalar() or Decimal('0.0')
+
+    return balance + movement, anchor_date
+
+
+def _store_balance(connection, balance, anchor_date):
+    values = {'balance': balance, 'anchor_date': anchor_date, 'updated_at': datetime.utcnow()}
+    result = connection.execute(update(_ledger).where(_ledger.c.id == LEDGER_ID).values(**values))
+    if result.rowcount == 0:
+        connection.execute(insert(_ledger).values(id=LEDGER_ID, **values))
+
+
+def rebuild_balance(connection=None):
+    """重新計算並寫回餘額快照，回傳新的餘額"""
+    connection = connection or db.session.connection()
+    balance, anchor_date = compute_balance(connection)
+    _store_balance(connection, balance, anchor_date)
+    return balance
+
+
+def verify_balance():
+    """比對快照與重新計算的結果，回傳 (快照餘額, 實際餘額)；尚未建立快照時快照餘額為 None"""
+    connection = db.session.connection()
+    stored = connection.execute(select(_ledger.c.balance).where(_ledger.c.id == LEDGER_ID)).scalar()
+    actual, _ = compute_balance(connection)
+    return stored, actual
+
+
+def get_current_balance():
+    """取得目前系統餘額 (主鍵查詢)；首次使用時自動建立快照"""
+    balance = db.session.execute(
+        select(LedgerBalance.balance).where(LedgerBalance.id == LEDGER_ID)
+    ).scalar()
+    if balance is None:
+        balance = rebuild_balance()
+        db.session.commit()
+    return balance
+
+
+# --- 在 Transaction 寫入的同一個 flush 內維護快照 ---
+
+def _contribution(amount, transaction_date, entry_kind, anchor_date):
+    """一筆交易對目前餘額的貢獻：結轉日 (含) 之後的非結轉交易才計入"""
+    if amount is None or is_settlement(entry_kind):
+        return Decimal('0.0')
+    if anchor_date is not None and transaction_date < anchor_date:
+        return Decimal('0.0')
+    return Decimal(amount)
+
+
+def old_value(state, key):
+    """flush 期間取得欄位修改前的值 (欄位需先以 track_previous_values 註冊)"""
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return state.attrs[key].value
+
+
+def _apply_delta(connection, delta):
+    if delta:
+        connection.execute(
+            update(_ledger).where(_ledger.c.id == LEDGER_ID).values(
+                balance=_ledger.c.balance + delta, updated_at=datetime.utcnow()
+            )
+        )
+
+
+def apply_bulk_rows(connection, rows):
+    """以 Core 批次新增交易時不會觸發 mapper 事件，由呼叫端傳入新增的資料列 (dict) 一次更新快照"""
+    rows = list(rows)
+    if any(is_settlement(row.get('entry_kind')) for row in rows):
+        rebuild_balance(connection)
+        return
+    anchor_date = _anchor_date(connection)
+    _apply_delta(connection, sum(
+        (_contribution(row['total_amount'], row['transaction_date'], row.get('entry_kind'), anchor_date) for row in rows),
+        Decimal('0.0')
+    ))
+
+
+def _anchor_date(connection):
+    return connection.execute(select(_ledger.c.anchor_date).where(_ledger.c.id == LEDGER_ID)).scalar()
+
+
+def _load_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def track_previous_values(*attributes):
+    """讓這些欄位被修改時先載入舊值，flush 時才能算出差額"""
+    for attribute in attributes:
+        if not event.contains(attribute, 'set', _load_previous_value):
+            event.listen(attribute, 'set', _load_previous_value, active_history=True, retval=True)
+
+
+track_previous_values(Transaction.total_amount, Transaction.transaction_date, Transaction.entry_kind)
+
+
+@event.listens_for(Transaction, 'after_insert')
+def _ledger_after_insert(mapper, connection, target):
+    if is_settlement(target.entry_kind):
+        rebuild_balance(connection)
+        return
+    _apply_delta(connection, _contribution(
+        target.total_amount, target.transaction_date, target.entry_kind, _anchor_date(connection)
+    ))
+
+
+@event.listens_for(Transaction, 'after_update')
+def _ledger_after_update(mapper, connection, target):
+    state = inspect(target)
+    keys = ('total_amount', 'transaction_date', 'entry_kind')
+    if not any(state.attrs[key].history.has_changes() for key in keys):
+        return
+
+    old_entry_kind = old_value(state, 'entry_kind')
+    if is_settlement(old_entry_kind) or is_settlement(target.entry_kind):
+        rebuild_balance(connection)
+        return
+
+    anchor_date = _anchor_date(connection)
+    old = _contribution(
+        old_value(state, 'total_amount'), old_value(state, 'transaction_date'), old_entry_kind, anchor_date
+    )
+    new = _contribution(target.total_amount, target.transaction_date, target.entry_kind, anchor_date)
+    _apply_delta(connection, new - old)
+
+
+@event.listens_for(Transaction, 'before_delete')
+def _ledger_before_delete(mapper, connection, target):
+    # 資料列還在，先扣除它的貢獻；結轉紀錄則等刪除後再整體重算
+    if is_settlement(target.entry_kind):
+        return
+    _apply_delta(connection, -_contribution(
+        target.total_amount, target.transaction_date, target.entry_kind, _anchor_date(connection)
+    ))
+
+
+@event.listens_for(Transaction, 'after_delete')
+def _ledger_after_delete(mapper, connection, target):
+    if is_settlement(target.entry_kind):
+        rebuild_balance(connection)
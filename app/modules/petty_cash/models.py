@@ -23,8 +23,35 @@ class ApprovalStatus(Enum):
     APPROVED = '已核准'
     REJECTED = '已駁回'
 
+class EntryKind(Enum):
+    NORMAL = '一般'
+    CARRY_FORWARD = '餘額結轉'
+    ADJUSTMENT = '調整'
+
+class ChangeAction(Enum):
+    CREATED = '新增'
+    UPDATED = '修改'
+    SUBMITTED = '送出簽核'
+    APPROVED = '核准'
+    REJECTED = '駁回'
+    DELETED = '刪除'
+
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # 交易總覽：ORDER BY transaction_date DESC, id DESC
+        db.Index('ix_transactions_date_id', 'transaction_date', 'id'),
+        # 簽核儀表板：WHERE status = ? ORDER BY application_date
+        db.Index('ix_transactions_status_application_date', 'status', 'application_date', 'id'),
+        # 費用分類報表：WHERE transaction_type = ? AND status = ? AND 日期區間，含分類與金額 (覆蓋索引)
+        db.Index('ix_transactions_type_status_date', 'transaction_type', 'status', 'transaction_date', 'category_id', 'total_amount'),
+        # 月結：WHERE transaction_type = ? AND transaction_date <= ?，含金額 (覆蓋索引)
+        db.Index('ix_transactions_type_date', 'transaction_type', 'transaction_date', 'total_amount'),
+        # 最近一次結轉：WHERE entry_kind = 'CARRY_FORWARD' ORDER BY transaction_date DESC LIMIT 1
+        db.Index('ix_transactions_entry_kind_date', 'entry_kind', 'transaction_date'),
+        # 發票對帳：WHERE transaction_type = ? AND status = ? AND total_amount = ? AND 日期區間
+        db.Index('ix_transactions_type_status_amount_date', 'transaction_type', 'status', 'total_amount', 'transaction_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     transaction_type = db.Column(db.Enum(TransactionType), nullable=False)
@@ -42,6 +69,9 @@ class Transaction(db.Model):
     approver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, comment='簽核主管ID')
     approval_date = db.Column(db.Date, nullable=True, comment='簽核日期')
     rejection_reason = db.Column(db.Text, nullable=True, comment='駁回理由')
+    entry_kind = db.Column(db.Enum(EntryKind), nullable=False, default=EntryKind.NORMAL, server_default=EntryKind.NORMAL.name, comment='分錄類型')
+    # 任何欄位 (含 Core 批次 UPDATE) 或明細變動時更新，作為明細頁 ETag 的版本戳記；既有資料為 NULL
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow, comment='最後修改時間')
 
     # --- ▼▼▼ 修改點 1：將 category_id 搬到這裡 ▼▼▼ ---
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True, comment='費用分類ID')
@@ -50,6 +80,11 @@ class Transaction(db.Model):
     approver = db.relationship('User', backref='approved_transactions', foreign_keys=[approver_id])
     applicant = db.relationship('User', backref='applied_transactions', foreign_keys=[applicant_id])
 
+    @property
+    def is_carry_forward(self):
+        """月結產生的餘額結轉紀錄 (不可編輯、刪除或送審)"""
+        return self.entry_kind == EntryKind.CARRY_FORWARD
+
     def __repr__(self):
         return f"<Transaction {self.id}: {self.description}>"
 
@@ -61,7 +96,7 @@ class TransactionItem(db.Model):
     unit = db.Column(db.String(20), nullable=True)
     unit_price = db.Column(db.Numeric(precision=10, scale=2), nullable=False)
     line_total = db.Column(db.Numeric(precision=10, scale=2), nullable=False)
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False, index=True)
     
     # --- ▼▼▼ 修改點 2：將 category_id 從這裡移除 ▼▼▼ ---
     # category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=True, comment='費用分類ID')
@@ -72,7 +107,7 @@ class TransactionItem(db.Model):
 class CashCountSession(db.Model):
     __tablename__ = 'cash_count_sessions'
     id = db.Column(db.Integer, primary_key=True)
-    count_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, comment='盤點日期')
+    count_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True, comment='盤點日期')
     counted_total = db.Column(db.Numeric(precision=10, scale=2), nullable=False, comment='盤點總額')
     system_balance = db.Column(db.Numeric(precision=10, scale=2), nullable=False, comment='系統帳上餘額')
     difference = db.Column(db.Numeric(precision=10, scale=2), nullable=False, comment='差額')
@@ -90,7 +125,7 @@ class CashCountDetail(db.Model):
     denomination = db.Column(db.Integer, nullable=False, comment='面額 (例如: 1000, 500)')
     quantity = db.Column(db.Integer, nullable=False, comment='張數/個數')
     subtotal = db.Column(db.Numeric(precision=10, scale=2), nullable=False, comment='該面額小計')
-    session_id = db.Column(db.Integer, db.ForeignKey('cash_count_sessions.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('cash_count_sessions.id'), nullable=False, index=True)
 
     def __repr__(self):
         return f'<CashCountDetail {self.denomination} x {self.quantity}>'
@@ -104,4 +139,70 @@ class Category(db.Model):
     transactions = db.relationship('Transaction', backref='category', lazy=True)
 
     def __repr__(self):
-        return f'<Category {self.name}>'
\ No newline at end of file
+        return f'<Category {self.name}>'
+
+class LedgerBalance(db.Model):
+    """系統帳上餘額的實體化快照 (單列資料表，由 ledger 模組維護)"""
+    __tablename__ = 'ledger_balances'
+    id = db.Column(db.Integer, primary_key=True)
+    balance = db.Column(db.Numeric(precision=12, scale=2), nullable=False, default=0, comment='目前系統餘額')
+    anchor_date = db.Column(db.Date, nullable=True, comment='最近一次餘額結轉的交易日期')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, comment='最後更新時間')
+
+    def __repr__(self):
+        return f'<LedgerBalance {self.balance} since {self.anchor_date}>'
+
+
+class MonthlyCategoryRollup(db.Model):
+    """每月、每個費用分類、簽核狀態與收支類型的交易加總 (由 rollup 模組維護)"""
+    __tablename__ = 'monthly_category_rollups'
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    month = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # 未分類的交易以 0 表示，因此不設外鍵
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False, comment='費用分類ID (0 表示未分類)')
+    status = db.Column(db.Enum(ApprovalStatus), primary_key=True)
+    transaction_type = db.Column(db.Enum(TransactionType), primary_key=True)
+    total_amount = db.Column(db.Numeric(precision=14, scale=2), nullable=False, default=0, comment='金額加總')
+    transaction_count = db.Column(db.Integer, nullable=False, default=0, comment='交易筆數')
+
+    def __repr__(self):
+        return f'<MonthlyCategoryRollup {self.year}-{self.month} category={self.category_id} {self.total_amount}>'
+
+
+class PeriodClose(db.Model):
+    """每月結轉的期末檢查點 (由 closing 模組建立)；下個月結轉時從這裡接續計算"""
+    __tablename__ = 'period_closes'
+    __table_args__ = (
+        db.UniqueConstraint('year', 'month', name='uq_period_closes_year_month'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False, comment='結轉年度')
+    month = db.Column(db.Integer, nullable=False, comment='結轉月份')
+    opening_balance = db.Column(db.Numeric(precision=14, scale=2), nullable=False, default=0, comment='期初餘額')
+    total_income = db.Column(db.Numeric(precision=14, scale=2), nullable=False, default=0, comment='當月收入合計')
+    total_expenditure = db.Column(db.Numeric(precision=14, scale=2), nullable=False, default=0, comment='當月支出合計 (負數)')
+    closing_balance = db.Column(db.Numeric(precision=14, scale=2), nullable=False, default=0, comment='期末餘額')
+    transaction_count = db.Column(db.Integer, nullable=False, default=0, comment='當月交易筆數')
+    settlement_transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id', ondelete='SET NULL'), nullable=True, comment='對應的結轉收入紀錄')
+    closed_by_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, comment='執行人ID')
+    closed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, comment='執行時間')
+
+    settlement_transaction = relationship('Transaction', foreign_keys=[settlement_transaction_id])
+    closed_by = relationship('User', foreign_keys=[closed_by_id])
+
+    def __repr__(self):
+        return f'<PeriodClose {self.year}-{self.month:02d} {self.closing_balance}>'
+
+
+class TransactionChange(db.Model):
+    """交易異動紀錄 (只新增不修改，由 changes 模組寫入)；id 即為 changes?since= 使用的游標"""
+    __tablename__ = 'transaction_changes'
+    id = db.Column(db.Integer, primary_key=True)
+    # 交易刪除後紀錄仍保留，因此不設外鍵
+    transaction_id = db.Column(db.Integer, nullable=False, index=True, comment='交易ID')
+    action = db.Column(db.Enum(ChangeAction), nullable=False, comment='異動類型')
+    status = db.Column(db.Enum(ApprovalStatus), nullable=True, comment='異動後的簽核狀態 (刪除時為刪除前)')
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, comment='異動時間')
+
+    def __repr__(self):
+        return f'<TransactionChange {self.id} {self.action.name} transaction={self.transaction_id}>'
@@ -0,0 +1,186 @@
+"""
+每月分類加總 (monthly_category_rollups) 的維護
+
+費用報表原本每次都要對 transactions 做 extract(year/month) 再 JOIN、GROUP BY 整本帳。
+這裡在 Transaction 寫入的同一個 flush 內，把金額與筆數的差額累加到
+(年, 月, 分類, 簽核狀態, 收支類型) 的彙總列上，報表只需讀取彙總表。
+"""
+from collections import defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal
+from sqlalchemy import and_, case, delete, event, extract, func, insert, inspect, or_, select, tuple_, update
+from app import db
+from app.cache import bump_version
+from .models import Transaction, MonthlyCategoryRollup, Category
+from .ledger import old_value, track_previous_values
+
+UNCATEGORIZED = 0
+# 彙總表重建 (rebuild_rollup) 的版本號
+ROLLUP_VERSION = 'rollups'
+ROLLUP_KEYS = ('transaction_date', 'category_id', 'status', 'transaction_type')
+
+RollupKey = namedtuple('RollupKey', 'year month category_id status transaction_type')
+
+_transactions = Transaction.__table__
+_rollups = MonthlyCategoryRollup.__table__
+
+
+def _rollup_key(transaction_date, category_id, status, transaction_type):
+    return RollupKey(
+        transaction_date.year, transaction_date.month,
+        category_id or UNCATEGORIZED, status, transaction_type
+    )
+
+
+def _apply(connection, key, amount, count):
+    if amount is None:
+        amount = Decimal('0')
+    condition = [_rollups.c[name] == value for name, value in key._asdict().items()]
+    result = connection.execute(
+        update(_rollups).where(*condition).values(
+            total_amount=_rollups.c.total_amount + amount,
+            transaction_count=_rollups.c.transaction_count + count,
+        )
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(_rollups).values(total_amount=amount, transaction_count=count, **key._asdict()))
+
+
+def apply_bulk_rows(connection, rows, sign=1):
+    """
+    以 Core 批次寫入/更新交易時不會觸發 mapper 事件，由呼叫端把資料列 (dict)
+    一次累加到彙總表，每個 (年, 月, 分類, 狀態, 類型) 只需一次 UPDATE；sign=-1 表示移除這些資料列。
+    """
+    totals = defaultdict(lambda: [Decimal('0'), 0])
+    for row in rows:
+        key = _rollup_key(row['transaction_date'], row.get('category_id'), row['status'], row['transaction_type'])
+        totals[key][0] += sign * Decimal(row['total_amount'] or 0)
+        totals[key][1] += sign
+    for key, (amount, count) in totals.items():
+        _apply(connection, key, amount, count)
+
+
+def category_totals_query(periods, status, transaction_type):
+    """
+    多個期間各分類金額加總的單一查詢，每列為 (分類名稱, 期間序號, 金額)。
+    期間都是整月時只讀取彙總表 (每列為 (分類名稱, 年, 月, 金額)，再由 category_totals_by_period 歸入期間)；
+    含非整月期間時改以交易日期區間查詢 transactions，此時期間不應重疊。
+    """
+    if all(period.is_month_aligned for period in periods):
+        year_month = tuple_(MonthlyCategoryRollup.year, MonthlyCategoryRollup.month)
+        total = func.sum(MonthlyCategoryRollup.total_amount)
+        return db.session.query(
+            Category.name, MonthlyCategoryRollup.year, MonthlyCategoryRollup.month, total.label('total_spent')
+        ).join(Category, Category.id == MonthlyCategoryRollup.category_id).filter(
+            or_(*[and_(
+                year_month >= tuple_(period.start.year, period.start.month),
+                year_month < tuple_(period.end.year, period.end.month)
+            ) for period in periods]),
+            MonthlyCategoryRollup.status == status,
+            MonthlyCategoryRollup.transaction_type == transaction_type
+        ).group_by(Category.name, MonthlyCategoryRollup.year, MonthlyCategoryRollup.month)
+
+    bucket = case(*[(period.predicate(Transaction.transaction_date), index) for index, period in enumerate(periods)])
+    return db.session.query(
+        Category.name, bucket.label('period_index'), func.sum(Transaction.total_amount).label('total_spent')
+    ).join(Transaction.category).filter(
+        or_(*[period.predicate(Transaction.transaction_date) for period in periods]),
+        Transaction.status == status,
+        Transaction.transaction_type == transaction_type
+    ).group_by(Category.name, bucket)
+
+
+def category_totals_by_period(periods, status, transaction_type):
+    """
+    回傳 [(分類名稱, [各期間金額...]), ...]，金額維持資料庫中的正負號，
+    依所有期間合計的絕對值由大到小排序。
+    """
+    totals = defaultdict(lambda: [Decimal('0')] * len(periods))
+    rows = category_totals_query(periods, status, transaction_type).all()
+    if all(period.is_month_aligned for period in periods):
+        for name, year, month, amount in rows:
+            first_day = date(year, month, 1)
+            for index, period in enumerate(periods):
+                if period.contains(first_day):
+                    totals[name][index] += amount
+    else:
+        for name, index, amount in rows:
+            totals[name][index] += amount
+    return sorted(totals.items(), key=lambda item: abs(sum(item[1])), reverse=True)
+
+
+def _aggregate_select():
+    """直接從 transactions 計算的彙總結果 (重建與一致性檢查使用)"""
+    year = extract('year', _transactions.c.transaction_date)
+    month = extract('month', _transactions.c.transaction_date)
+    category_id = func.coalesce(_transactions.c.category_id, UNCATEGORIZED)
+    return select(
+        year.label('year'), month.label('month'), category_id.label('category_id'),
+        _transactions.c.status, _transactions.c.transaction_type,
+        func.sum(_transactions.c.total_amount).label('total_amount'),
+        func.count().label('transaction_count'),
+    ).group_by(year, month, category_id, _transactions.c.status, _transactions.c.transaction_type)
+
+
+def rebuild_rollup(connection=None):
+    """清空並從 transactions 重新產生彙總表，回傳彙總列數"""
+    connection = connection or db.session.connection()
+    # 重建不會留下交易異動紀錄，另以版本號讓報表頁的 ETag 失效
+    bump_version(ROLLUP_VERSION, connection)
+    connection.execute(delete(_rollups))
+    aggregate = _aggregate_select().subquery()
+    columns = ['year', 'month', 'category_id', 'status', 'transaction_type', 'total_amount', 'transaction_count']
+    connection.execute(insert(_rollups).from_select(columns, select(*[aggregate.c[name] for name in columns])))
+    return connection.execute(select(func.count()).select_from(_rollups)).scalar()
+
+
+def verify_rollup():
+    """比對彙總表與重新計算的結果，回傳不一致的 (key, 彙總表, 實際) 清單"""
+    connection = db.session.connection()
+
+    def as_map(rows):
+        return {
+            RollupKey(row.year, row.month, row.category_id, row.status, row.transaction_type):
+                (Decimal(row.total_amount or 0), row.transaction_count)
+            for row in rows
+        }
+
+    stored = {key: value for key, value in as_map(connection.execute(select(_rollups))).items() if value[1]}
+    actual = as_map(connection.execute(_aggregate_select()))
+    mismatches = []
+    for key in sorted(stored.keys() | actual.keys(), key=lambda k: (k.year, k.month, k.category_id, k.status.name, k.transaction_type.name)):
+        if stored.get(key) != actual.get(key):
+            mismatches.append((key, stored.get(key), actual.get(key)))
+    return mismatches
+
+
+# --- 在 Transaction 寫入的同一個 flush 內維護彙總表 ---
+
+track_previous_values(
+    Transaction.total_amount, Transaction.transaction_date, Transaction.category_id,
+    Transaction.status, Transaction.transaction_type
+)
+
+
+def _current_key(target):
+    return _rollup_key(target.transaction_date, target.category_id, target.status, target.transaction_type)
+
+
+@event.listens_for(Transaction, 'after_insert')
+def _rollup_after_insert(mapper, connection, target):
+    _apply(connection, _current_key(target), target.total_amount, 1)
+
+
+@event.listens_for(Transaction, 'after_update')
+def _rollup_after_update(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[key].history.has_changes() for key in ROLLUP_KEYS + ('total_amount',)):
+        return
+    old_key = _rollup_key(*(old_value(state, key) for key in ROLLUP_KEYS))
+    _apply(connection, old_key, -Decimal(old_value(state, 'total_amount') or 0), -1)
+    _apply(connection, _current_key(target), target.total_amount, 1)
+
+
+@event.listens_for(Transaction, 'before_delete')
+def _rollup_before_delete(mapper, connection, target):
+    _apply(connection, _current_key(target), -Decimal(target.total_amount or 0), -1)
@@ -1,69 +1,133 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
-from decimal import Decimal, ROUND_HALF_UP
+from flask import Blueprint, Response, abort, render_template, redirect, url_for, flash, request, jsonify, current_app, stream_with_context
+from decimal import Decimal
 from flask_login import login_required, current_user
 from app import db
-from .models import Transaction, TransactionItem, TransactionType, TaxType, TaxCalculationMethod, ApprovalStatus, CashCountSession, CashCountDetail, Category
-from .forms import ExpenditureForm, IncomeForm, MonthEndSettlementForm, RejectionForm, CategoryForm, ItemForm
+from .models import Transaction, TransactionItem, TransactionType, TaxType, TaxCalculationMethod, ApprovalStatus, CashCountSession, CashCountDetail, Category, PeriodClose, TransactionChange
+from .forms import ExpenditureForm, IncomeForm, MonthEndSettlementForm, SettleRangeForm, ImportForm, RejectionForm, BulkApprovalForm, CategoryForm, ItemForm
 from datetime import date, datetime, timedelta
-from sqlalchemy import func, extract
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from app.modules.user.routes import manager_required
+from app.modules.user.models import USER_VERSION
+from app.cache import CacheVersion
+from app.http_cache import ConditionalPage
+from .ledger import get_current_balance
+from .rollup import ROLLUP_VERSION, category_totals_query, category_totals_by_period
+from .categories import CATEGORY_CACHE
+from .closing import PeriodCloseError, close_month, close_months
+from .approvals import bulk_set_status
+from .tax import calculate_tax_and_total
+from .changes import changes_since, latest_cursor
+from .exporter import EXPORT_FORMATS, export_query, generate_export, parse_filters
+from .importer import COLUMNS, REQUIRED_COLUMNS, ImportFileError, import_expenditures
+from app.periods import Period, PERIOD_KINDS
+from app.pagination import keyset_paginate_request
 import json
-import calendar
 
-petty_cash_bp = Blueprint('petty_cash', __name__)
+petty_cash_bp = Blueprint('petty_cash', __name__, cli_group='petty-cash')
 
 # --- ▼▼▼ 新增：輔助函式 ▼▼▼ ---
 
-def _calculate_current_balance():
-    """計算當前的系統總餘額"""
-    latest_settlement = Transaction.query.filter(
-        Transaction.description.like('%餘額結轉%')
-    ).order_by(Transaction.transaction_date.desc()).first()
-
-    balance = Decimal('0.0')
-    start_date = date(1900, 1, 1)
-    if latest_settlement:
-        balance = latest_settlement.total_amount
-        start_date = latest_settlement.transaction_date
-
-    income_since_start = db.session.query(func.sum(Transaction.total_amount)).filter(
-        Transaction.transaction_type == TransactionType.INCOME,
-        Transaction.transaction_date > start_date,
-        ~Transaction.description.like('%餘額結轉%')
-    ).scalar() or Decimal('0.0')
-
-    expenditure_since_start = db.session.query(func.sum(Transaction.total_amount)).filter(
-        Transaction.transaction_type == TransactionType.EXPENDITURE,
-        Transaction.transaction_date > start_date
-    ).scalar() or Decimal('0.0')
-
-    return balance + income_since_start + expenditure_since_start
-
-def _calculate_tax_and_total(base_amount, tax_type_str, tax_calc_method_str):
-    """根據稅別和計稅方式計算稅後金額"""
-    tax_rate = Decimal('0.05')
-    subtotal, tax, total_amount = Decimal('0.0'), Decimal('0.0'), Decimal('0.0')
-
-    if tax_type_str == TaxType.TAXABLE.name:
-        if tax_calc_method_str == TaxCalculationMethod.EXCLUSIVE.name:
-            subtotal = base_amount
-            tax = (subtotal * tax_rate).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
-            total_amount = subtotal + tax
-        elif tax_calc_method_str == TaxCalculationMethod.INCLUSIVE.name:
-            total_amount = base_amount
-            # 修正：內含稅的未稅額計算應該用 total_amount 來除
-            subtotal = (total_amount / (1 + tax_rate)).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
-            tax = total_amount - subtotal
-        else: # 如果沒有選擇計稅方式，預設為稅外加
-            subtotal = base_amount
-            tax = (subtotal * tax_rate).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
-            total_amount = subtotal + tax
-    else: # 免稅或零稅率
-        subtotal = base_amount
-        tax = Decimal('0.0')
-        total_amount = base_amount
-        
-    return subtotal, tax, total_amount
+def _item_values(item_data):
+    """表單明細 -> TransactionItem 欄位值"""
+    quantity, unit_price = Decimal(item_data['quantity']), Decimal(item_data['unit_price'])
+    return {
+        'item_name': item_data['item_name'],
+        'quantity': quantity,
+        'unit': item_data['unit'],
+        'unit_price': unit_price,
+        'line_total': quantity * unit_price,
+    }
+
+def _sync_transaction_items(transaction, items_data):
+    """
+    依明細 ID 比對表單與資料庫中的明細：只更新有變動的列，新增的列以一次 INSERT 寫入，
+    被移除的列以一次 DELETE 刪除，未變動的列不會產生任何 SQL。
+    不是這筆交易的明細 ID 一律視為新增的列。回傳金額 (數量、單價或列數) 是否有變動。
+    """
+    existing = {item.id: item for item in transaction.items}
+    updates, inserts, kept = [], [], set()
+    amounts_changed = False
+
+    for item_data in items_data:
+        values = _item_values(item_data)
+        item_id = int(item_data['id']) if str(item_data.get('id') or '').isdigit() else None
+        item = existing.get(item_id) if item_id not in kept else None
+        if item is None:
+            inserts.append(dict(values, transaction_id=transaction.id))
+            amounts_changed = True
+            continue
+        kept.add(item_id)
+        if (item.quantity, item.unit_price) != (values['quantity'], values['unit_price']):
+            amounts_changed = True
+        elif item.item_name == values['item_name'] and (item.unit or '') == (values['unit'] or ''):
+            continue
+        updates.append(dict(values, id=item_id))
+
+    removed = [item_id for item_id in existing if item_id not in kept]
+    if updates:
+        db.session.execute(update(TransactionItem), updates)
+    if inserts:
+        db.session.execute(insert(TransactionItem), inserts)
+    if removed:
+        db.session.execute(delete(TransactionItem).where(TransactionItem.id.in_(removed)))
+        amounts_changed = True
+    if updates or inserts or removed:
+        db.session.expire(transaction, ['items'])
+        # 只改明細時交易本身沒有欄位變動，仍要更新版本戳記 (明細頁的 ETag、異動紀錄)
+        transaction.updated_at = datetime.utcnow()
+    return amounts_changed
+
+# 各列表與報表頁面使用的查詢；集中定義以便 flask petty-cash check-query-plans 檢查執行計畫
+
+# 列表每一列都會顯示申請人等關聯資料，一律預先載入，避免每列再各發一次 SELECT
+_TRANSACTION_ROW_OPTIONS = (
+    joinedload(Transaction.applicant),
+    joinedload(Transaction.approver),
+    joinedload(Transaction.category),
+)
+
+def _transaction_list_query():
+    """交易總覽：依交易日、ID 由新到舊"""
+    return Transaction.query.options(*_TRANSACTION_ROW_OPTIONS).order_by(Transaction.transaction_date.desc(), Transaction.id.desc())
+
+def _pending_approval_query():
+    """簽核儀表板：待簽核的交易，依申請日排序"""
+    return Transaction.query.options(*_TRANSACTION_ROW_OPTIONS).filter_by(
+        status=ApprovalStatus.PENDING
+    ).order_by(Transaction.application_date.asc(), Transaction.id.asc())
+
+def _cash_count_history_query():
+    """盤點歷史：依盤點日期由新到舊"""
+    return CashCountSession.query.options(joinedload(CashCountSession.user)).order_by(CashCountSession.count_date.desc(), CashCountSession.id.desc())
+
+def _expense_by_category_query(periods):
+    """費用分類報表：各期間已核准支出依分類加總 (整月期間讀取每月分類彙總表)"""
+    return category_totals_query(periods, ApprovalStatus.APPROVED, TransactionType.EXPENDITURE)
+
+def _cache_version(name):
+    return select(CacheVersion.version).where(CacheVersion.name == name).scalar_subquery()
+
+def _transaction_versions(transaction_id):
+    """明細頁的版本戳記 (交易、分類名稱、使用者姓名) 一次查出；交易不存在時回傳 None"""
+    return db.session.execute(
+        select(Transaction.updated_at, _cache_version(CATEGORY_CACHE), _cache_version(USER_VERSION))
+        .where(Transaction.id == transaction_id)
+    ).first()
+
+def _cash_count_versions(session_id):
+    """盤點紀錄建立後不會再修改，只需確認仍然存在與盤點人姓名；不存在時回傳 None"""
+    return db.session.execute(
+        select(CashCountSession.count_date, _cache_version(USER_VERSION)).where(CashCountSession.id == session_id)
+    ).first()
+
+def _report_versions():
+    """報表的版本戳記：最後一筆交易異動、彙總表重建與分類名稱"""
+    return db.session.execute(select(
+        select(func.max(TransactionChange.id)).scalar_subquery(),
+        _cache_version(ROLLUP_VERSION), _cache_version(CATEGORY_CACHE),
+    )).one()
 
 # --- ▲▲▲ 輔助函式結束 ▲▲▲ ---
 
@@ -71,24 +135,44 @@ def _calculate_tax_and_total(base_amount, tax_type_str, tax_calc_method_str):
 @petty_cash_bp.route('/')
 @login_required
 def index():
-    page = request.args.get('page', 1, type=int)
-    transactions = Transaction.query.order_by(Transaction.transaction_date.desc(), Transaction.id.desc()).paginate(page=page, per_page=10, error_out=False)
-    current_balance = _calculate_current_balance()
-    return render_template('petty_cash_index.html', transactions=transactions, balance=current_balance, TransactionType=TransactionType, ApprovalStatus=ApprovalStatus)
+    # 游標在列表查詢之前取得：期間的異動頂多重複套用一次，不會漏掉
+    change_cursor = latest_cursor()
+    transactions = keyset_paginate_request(
+        _transaction_list_query(), [Transaction.transaction_date, Transaction.id], per_page=10
+    )
+    current_balance = get_current_balance()
+    # 只有第一頁 (最新的交易) 會把新增的交易插入表格最上方
+    change_feed = _change_feed_context('index', change_cursor, 'none' if transactions.has_prev else 'prepend')
+    return render_template('petty_cash_index.html', transactions=transactions, balance=current_balance, change_feed=change_feed, TransactionType=TransactionType, ApprovalStatus=ApprovalStatus)
+
+def _change_feed_context(view, cursor, insert):
+    """頁面上 change_feed.js 需要的設定 (見 _change_feed.html)"""
+    return {'url': url_for('petty_cash.changes', view=view), 'cursor': cursor, 'insert': insert}
 
 @petty_cash_bp.route('/transaction/<int:transaction_id>')
 @login_required
 def transaction_detail(transaction_id):
-    transaction = db.session.get(Transaction, transaction_id)
-    if not transaction:
+    versions = _transaction_versions(transaction_id)
+    page = None
+    if versions is not None:
+        page = ConditionalPage('transaction_detail', transaction_id, *versions, last_modified=versions[0])
+        not_modified = page.not_modified()
+        if not_modified:
+            return not_modified
+
+    transaction = db.session.get(
+        Transaction, transaction_id,
+        options=[*_TRANSACTION_ROW_OPTIONS, selectinload(Transaction.items)]
+    )
+    if not transaction or page is None:
         flash('找不到該筆交易。', 'danger')
         return redirect(url_for('petty_cash.index'))
-    return render_template(
+    return page.respond(render_template(
         'transaction_detail.html', 
         transaction=transaction, 
         TransactionType=TransactionType, 
         ApprovalStatus=ApprovalStatus
-    )
+    ))
 
 @petty_cash_bp.route('/expenditure/add', methods=['GET', 'POST'])
 @login_required
@@ -109,7 +193,7 @@ def add_expenditure():
                 return render_template('add_expenditure.html', form=form)
             try:
                 base_amount = sum(Decimal(item['quantity'] or 0) * Decimal(item['unit_price'] or 0) for item in valid_items_data)
-                subtotal, tax, total_amount = _calculate_tax_and_total(base_amount, form.tax_type.data, form.tax_calculation_method.data)
+                subtotal, tax, total_amount = calculate_tax_and_total(base_amount, form.tax_type.data, form.tax_calculation_method.data)
                 
                 new_transaction = Transaction(
                     transaction_type=TransactionType.EXPENDITURE,
@@ -119,7 +203,7 @@ def add_expenditure():
                     transaction_date=form.transaction_date.data,
                     applicant_id=current_user.id,
                     description=form.description.data,
-                    category_id=form.category_id.data.id,
+                    category_id=form.category_id.data,
                     tax_type=TaxType[form.tax_type.data],
                     tax_calculation_method=TaxCalculationMethod[form.tax_calculation_method.data] if form.tax_calculation_method.data else None,
                     subtotal=subtotal, tax=tax, total_amount=-total_amount,
@@ -168,8 +252,11 @@ def edit_transaction(transaction_id):
 
     if form.validate_on_submit():
         try:
-            base_amount = sum(Decimal(item['quantity'] or 0) * Decimal(item['unit_price'] or 0) for item in form.items.data)
-            subtotal, tax, total_amount = _calculate_tax_and_total(base_amount, form.tax_type.data, form.tax_calculation_method.data)
+            tax_type = TaxType[form.tax_type.data]
+            tax_calculation_method = TaxCalculationMethod[form.tax_calculation_method.data] if form.tax_calculation_method.data else None
+            tax_changed = (tax_type, tax_calculation_method) != (transaction.tax_type, transaction.tax_calculation_method)
+            # 先同步明細 (主表尚未修改，autoflush 不會提前送出 UPDATE)；數量、單價、列數與稅別都沒變時，金額不必重算
+            amounts_changed = _sync_transaction_items(transaction, form.items.data)
 
             # 更新主表資料
             transaction.application_date = form.application_date.data
@@ -177,27 +264,14 @@ def edit_transaction(transaction_id):
             transaction.transaction_date = form.transaction_date.data
             transaction.description = form.description.data
             # --- ▼▼▼ 修改點 3：更新 Transaction 主檔的 category_id ▼▼▼ ---
-            transaction.category_id = form.category_id.data.id
-            transaction.tax_type = TaxType[form.tax_type.data]
-            transaction.tax_calculation_method = TaxCalculationMethod[form.tax_calculation_method.data] if form.tax_calculation_method.data else None
-            transaction.subtotal, transaction.tax, transaction.total_amount = subtotal, tax, -total_amount
-            
-            # 清空舊明細，建立新明細
-            for item in transaction.items:
-                db.session.delete(item)
-            db.session.flush()
-
-            for item_data in form.items.data:
-                new_item = TransactionItem(
-                    item_name=item_data['item_name'],
-                    quantity=Decimal(item_data['quantity']),
-                    unit=item_data['unit'],
-                    unit_price=Decimal(item_data['unit_price']),
-                    line_total=Decimal(item_data['quantity']) * Decimal(item_data['unit_price']),
-                    transaction_id=transaction.id
-                )
-                db.session.add(new_item)
-            
+            transaction.category_id = form.category_id.data
+            transaction.tax_type = tax_type
+            transaction.tax_calculation_method = tax_calculation_method
+            if amounts_changed or tax_changed:
+                base_amount = sum(Decimal(item['quantity'] or 0) * Decimal(item['unit_price'] or 0) for item in form.items.data)
+                subtotal, tax, total_amount = calculate_tax_and_total(base_amount, form.tax_type.data, form.tax_calculation_method.data)
+                transaction.subtotal, transaction.tax, transaction.total_amount = subtotal, tax, -total_amount
+
             db.session.commit()
             flash('支出紀錄已成功更新！', 'success')
             return redirect(url_for('petty_cash.transaction_detail', transaction_id=transaction.id))
@@ -211,8 +285,7 @@ def edit_transaction(transaction_id):
         if transaction.tax_calculation_method:
             form.tax_calculation_method.data = transaction.tax_calculation_method.name
         # 載入頁面時，將現有的分類填入表單
-        if transaction.category:
-            form.category_id.data = transaction.category
+        form.category_id.data = transaction.category_id
 
     return render_template('edit_transaction.html', form=form, transaction_id=transaction_id)
 
@@ -308,77 +381,103 @@ def delete_transaction(transaction_id):
 def accounting_operations():
     """顯示會計作業頁面"""
     form = MonthEndSettlementForm()
+    range_form = SettleRangeForm()
     today = date.today()
     first_day_of_month = today.replace(day=1)
     last_month_date = first_day_of_month - timedelta(days=1)
     form.year.data = str(last_month_date.year)
     form.month.data = str(last_month_date.month)
-    return render_template('accounting_operations.html', form=form)
+    range_form.end_year.data = str(last_month_date.year)
+    range_form.end_month.data = str(last_month_date.month)
+
+    # 最近的結轉檢查點：批次結轉預設從最後一個已結轉月份的下個月開始
+    recent_closes = PeriodClose.query.options(joinedload(PeriodClose.closed_by)).order_by(
+        PeriodClose.year.desc(), PeriodClose.month.desc()
+    ).limit(12).all()
+    next_open = Period.month(recent_closes[0].year, recent_closes[0].month).end if recent_closes else last_month_date
+    range_form.start_year.data = str(next_open.year)
+    range_form.start_month.data = str(next_open.month)
+    return render_template('accounting_operations.html', form=form, range_form=range_form, recent_closes=recent_closes)
+
+
+def _flash_form_errors(form):
+    for field, errors in form.errors.items():
+        for error in errors:
+            flash(f'欄位 "{getattr(form, field).label.text}" 發生錯誤: {error}', 'danger')
 
 
 @petty_cash_bp.route('/accounting/settle', methods=['POST'])
 @login_required
 def settle_month_end():
-    """處理月結作業的邏輯"""
+    """處理月結作業的邏輯：從前一個檢查點接續，只加總本月的交易"""
     form = MonthEndSettlementForm()
     if form.validate_on_submit():
-        year = int(form.year.data)
-        month = int(form.month.data)
-
-        _, last_day = calendar.monthrange(year, month)
-        end_date = date(year, month, last_day)
-
-        total_income = db.session.query(func.sum(Transaction.total_amount)).filter(
-            Transaction.transaction_type == TransactionType.INCOME,
-            Transaction.transaction_date <= end_date
-        ).scalar() or Decimal('0.0')
+        try:
+            year, month = int(form.year.data), int(form.month.data)
+            checkpoint = close_month(year, month, current_user)
+            db.session.commit()
+        except IntegrityError:
+            # 兩位主管同時結轉同一個月份：period_closes 的 (year, month) 唯一限制擋下後到的一方
+            db.session.rollback()
+            flash(f'錯誤：{year}年{month}月的結轉紀錄已存在，無法重複執行。', 'danger')
+            return redirect(url_for('petty_cash.accounting_operations'))
+        except (ValueError, TypeError) as e:
+            db.session.rollback()
+            message = str(e) if isinstance(e, PeriodCloseError) else '年份或月份格式錯誤。'
+            flash(f'錯誤：{message}', 'danger')
+            return redirect(url_for('petty_cash.accounting_operations'))
 
-        total_expenditure = db.session.query(func.sum(Transaction.total_amount)).filter(
-            Transaction.transaction_type == TransactionType.EXPENDITURE,
-            Transaction.transaction_date <= end_date
-        ).scalar() or Decimal('0.0')
+        next_month_date = checkpoint.settlement_transaction.transaction_date
+        flash(f'成功！{year}年{month}月餘額 ${checkpoint.closing_balance} 已成功結轉至 {next_month_date.strftime("%Y-%m-%d")}。', 'success')
+    else:
+        _flash_form_errors(form)
 
-        month_end_balance = total_income + total_expenditure
+    return redirect(url_for('petty_cash.accounting_operations'))
 
-        if month == 12:
-            next_month_date = date(year + 1, 1, 1)
-        else:
-            next_month_date = date(year, month + 1, 1)
 
-        existing_settlement = Transaction.query.filter_by(
-            transaction_date=next_month_date,
-            description=f"[{current_user.display_name}] 執行 {year}年{month}月 結餘結轉",
-        ).first()
+@petty_cash_bp.route('/accounting/settle_range', methods=['POST'])
+@login_required
+def settle_month_range():
+    """批次結轉：依序結轉多個尚未結轉的月份，只需一次彙總查詢"""
+    form = SettleRangeForm()
+    if not form.validate_on_submit():
+        _flash_form_errors(form)
+        return redirect(url_for('petty_cash.accounting_operations'))
 
-        if existing_settlement:
-            flash(f'錯誤：{year}年{month}月的結轉紀錄已存在，無法重複執行。', 'danger')
-            return redirect(url_for('petty_cash.accounting_operations'))
+    try:
+        first = Period.month(int(form.start_year.data), int(form.start_month.data))
+        last = Period.month(int(form.end_year.data), int(form.end_month.data))
+    except (ValueError, TypeError):
+        flash('錯誤：年份或月份格式錯誤。', 'danger')
+        return redirect(url_for('petty_cash.accounting_operations'))
+    if last.start < first.start:
+        flash('錯誤：結束月份不可早於起始月份。', 'danger')
+        return redirect(url_for('petty_cash.accounting_operations'))
 
-        if month_end_balance < 0:
-            flash(f'警告：{year}年{month}月結餘為負 (${month_end_balance})，無法進行結轉。請檢查帳目。', 'warning')
-            return redirect(url_for('petty_cash.accounting_operations'))
+    error = None
+    try:
+        closed = close_months(first, last, current_user)
+    except PeriodCloseError as e:
+        # 發生問題之前的月份仍然保留，從出錯的月份開始處理即可
+        closed, error = getattr(e, 'closed', []), e
 
-        settlement_transaction = Transaction(
-            transaction_type=TransactionType.INCOME,
-            application_date=date.today(),
-            transaction_date=next_month_date,
-            applicant_id=current_user.id,
-            description=f"[{current_user.display_name}] 執行 {year}年{month}月 結餘結轉",
-            total_amount=month_end_balance,
-            subtotal=month_end_balance,
-            tax=0,
-            tax_type=TaxType.TAX_EXEMPT,
-            status=ApprovalStatus.APPROVED
-        )
-        db.session.add(settlement_transaction)
+    try:
         db.session.commit()
-
-        flash(f'成功！{year}年{month}月餘額 ${month_end_balance} 已成功結轉至 {next_month_date.strftime("%Y-%m-%d")}。', 'success')
-    else:
-        for field, errors in form.errors.items():
-            for error in errors:
-                flash(f'欄位 "{getattr(form, field).label.text}" 發生錯誤: {error}', 'danger')
-
+    except IntegrityError:
+        # 其他主管同時結轉了其中的月份 (period_closes 的唯一限制)
+        db.session.rollback()
+        flash('錯誤：所選月份的結轉紀錄已存在，無法重複執行。', 'danger')
+        return redirect(url_for('petty_cash.accounting_operations'))
+    except Exception as e:
+        db.session.rollback()
+        flash(f'結轉失敗，錯誤：{e}', 'danger')
+        return redirect(url_for('petty_cash.accounting_operations'))
+
+    if closed:
+        flash(f'成功！已結轉 {closed[0].year}年{closed[0].month}月 至 {closed[-1].year}年{closed[-1].month}月，'
+              f'共 {len(closed)} 個月，期末餘額 ${closed[-1].closing_balance}。', 'success')
+    if error is not None:
+        flash(f'錯誤：{error}', 'danger')
     return redirect(url_for('petty_cash.accounting_operations'))
 
 @petty_cash_bp.route('/tools/cash_count')
@@ -386,7 +485,7 @@ def settle_month_end():
 def cash_count_tool():
     """顯示現金盤點工具頁面"""
     # --- 優化：直接呼叫輔助函式 ---
-    current_balance = _calculate_current_balance()
+    current_balance = get_current_balance()
     return render_template('cash_count_tool.html', system_balance=current_balance)
 
 @petty_cash_bp.route('/tools/cash_count/save', methods=['POST'])
@@ -429,9 +528,8 @@ def save_cash_count():
 @login_required
 def cash_count_history():
     """顯示現金盤點的歷史紀錄列表"""
-    page = request.args.get('page', 1, type=int)
-    sessions = CashCountSession.query.order_by(CashCountSession.count_date.desc()).paginate(
-        page=page, per_page=15, error_out=False
+    sessions = keyset_paginate_request(
+        _cash_count_history_query(), [CashCountSession.count_date, CashCountSession.id], per_page=15
     )
     return render_template('cash_count_history.html', sessions=sessions)
 
@@ -439,36 +537,145 @@ def cash_count_history():
 @login_required
 def cash_count_session_detail(session_id):
     """顯示單次現金盤點的詳情"""
-    session = CashCountSession.query.get_or_404(session_id)
+    versions = _cash_count_versions(session_id)
+    if versions is None:
+        abort(404)
+    page = ConditionalPage('cash_count_session_detail', session_id, *versions, last_modified=versions[0])
+    not_modified = page.not_modified()
+    if not_modified:
+        return not_modified
+
+    session = CashCountSession.query.options(joinedload(CashCountSession.user)).get_or_404(session_id)
     details_map = {detail.denomination: detail for detail in session.details}
     all_denominations = [1000, 500, 100, 50, 10, 5, 1]
     
-    return render_template(
+    return page.respond(render_template(
         'cash_count_session_detail.html', 
         session=session, 
         details_map=details_map,
         all_denominations=all_denominations
-    )
+    ))
 
 @petty_cash_bp.route('/approvals')
 @login_required
 @manager_required
 def approval_dashboard():
     """顯示待簽核儀表板"""
-    page = request.args.get('page', 1, type=int)
-    pending_transactions = Transaction.query.filter_by(
-        status=ApprovalStatus.PENDING
-    ).order_by(Transaction.application_date.asc()).paginate(
-        page=page, per_page=15, error_out=False
+    change_cursor = latest_cursor()
+    pending_transactions = keyset_paginate_request(
+        _pending_approval_query(), [Transaction.application_date, Transaction.id], per_page=15,
+        descending=False, with_total=True
     )
     rejection_form = RejectionForm()
+    bulk_form = BulkApprovalForm()
     
+    # 依申請日由舊到新排序，新送出的申請只會出現在最後一頁
+    change_feed = _change_feed_context('approvals', change_cursor, 'none' if pending_transactions.has_next else 'append')
+
     return render_template(
         'approval_dashboard.html', 
         transactions=pending_transactions,
-        rejection_form=rejection_form
+        rejection_form=rejection_form,
+        bulk_form=bulk_form,
+        change_feed=change_feed,
+        view='approvals'
     )
 
+
+@petty_cash_bp.route('/changes', methods=['GET'])
+@login_required
+def changes():
+    """
+    交易異動 (JSON)：?since=<游標> 只回傳游標之後的異動。
+    有異動時一併回傳受影響交易的列 HTML (view=index 或 approvals；已刪除或不屬於該列表時為 null)、
+    目前餘額與待簽核筆數；沒有異動時只查詢一次異動紀錄。
+    """
+    view = request.args.get('view', 'index')
+    if view not in ('index', 'approvals'):
+        return jsonify({'error': f'不支援的 view：{view}'}), 400
+    if view == 'approvals' and not current_user.is_manager():
+        return jsonify({'error': '您沒有權限存取此資料。'}), 403
+    try:
+        since = int(request.args.get('since', 0))
+        if since < 0:
+            raise ValueError(since)
+    except ValueError:
+        return jsonify({'error': '游標格式錯誤'}), 400
+
+    feed = changes_since(since)
+    payload = {
+        'cursor': feed.cursor,
+        'more': feed.more,
+        'reset': feed.reset,
+        'changes': [
+            {'id': change.id, 'transaction_id': change.transaction_id, 'action': change.action.name,
+             'status': change.status.name if change.status else None, 'changed_at': change.changed_at.isoformat()}
+            for change in feed.changes
+        ],
+    }
+    if feed.changes:
+        transaction_ids = list(dict.fromkeys(change.transaction_id for change in feed.changes))
+        transactions = {
+            transaction.id: transaction
+            for transaction in Transaction.query.options(*_TRANSACTION_ROW_OPTIONS).filter(Transaction.id.in_(transaction_ids))
+        }
+        rows = {}
+        for transaction_id in transaction_ids:
+            transaction = transactions.get(transaction_id)
+            if transaction is None or (view == 'approvals' and transaction.status != ApprovalStatus.PENDING):
+                rows[transaction_id] = None
+            else:
+                rows[transaction_id] = render_template(
+                    '_transaction_row.html', transaction=transaction, view=view,
+                    TransactionType=TransactionType, ApprovalStatus=ApprovalStatus
+                )
+        payload['rows'] = rows
+        payload['balance'] = '%.2f' % get_current_balance()
+        if current_user.is_manager():
+            payload['pending_count'] = db.session.query(func.count(Transaction.id)).filter(
+                Transaction.status == ApprovalStatus.PENDING
+            ).scalar()
+    return jsonify(payload)
+
+
+def _format_ids(ids, limit=20):
+    shown = ', '.join(str(transaction_id) for transaction_id in ids[:limit])
+    return shown + (f' 等 {len(ids)} 筆' if len(ids) > limit else '')
+
+
+@petty_cash_bp.route('/approvals/bulk', methods=['POST'])
+@login_required
+@manager_required
+def bulk_approval():
+    """批次核准/駁回勾選的待簽核交易 (單一 UPDATE)"""
+    form = BulkApprovalForm()
+    if not form.validate_on_submit():
+        _flash_form_errors(form)
+        return redirect(request.referrer or url_for('petty_cash.approval_dashboard'))
+
+    rejecting = form.action.data == 'reject'
+    if rejecting and not (form.rejection_reason.data or '').strip():
+        flash('批次駁回時請填寫駁回理由。', 'warning')
+        return redirect(request.referrer or url_for('petty_cash.approval_dashboard'))
+
+    status = ApprovalStatus.REJECTED if rejecting else ApprovalStatus.APPROVED
+    try:
+        result = bulk_set_status(form.transaction_ids.data, status, current_user.id,
+                                 rejection_reason=form.rejection_reason.data if rejecting else None)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'處理時發生錯誤：{e}', 'danger')
+        return redirect(request.referrer or url_for('petty_cash.approval_dashboard'))
+
+    verb = '駁回' if rejecting else '核准'
+    if result.changed:
+        flash(f'已{verb} {len(result.changed)} 筆交易 (ID: {_format_ids(result.changed)})。', 'success')
+    if result.skipped:
+        flash(f'{len(result.skipped)} 筆交易已不是待簽核狀態 (可能已由其他主管處理)，已略過 (ID: {_format_ids(result.skipped)})。', 'warning')
+    # 處理過的交易已離開待簽核清單，回到第一頁重新分頁
+    return redirect(url_for('petty_cash.approval_dashboard'))
+
 @petty_cash_bp.route('/transaction/<int:transaction_id>/submit', methods=['POST'])
 @login_required
 def submit_for_approval(transaction_id):
@@ -578,6 +785,63 @@ def delete_cash_count_session(session_id):
     return redirect(url_for('petty_cash.cash_count_history'))
 
 
+@petty_cash_bp.route('/export', methods=['GET'])
+@login_required
+@manager_required
+def export_transactions():
+    """
+    串流匯出交易與明細：?format=csv|jsonl，期間參數與費用報表相同
+    (未指定期間時匯出全部)，另可加上 ?status=APPROVED、?category=<分類ID>。
+    """
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        flash(f'不支援的匯出格式：{fmt}', 'danger')
+        return redirect(url_for('petty_cash.report_expense_by_category'))
+    try:
+        filters = parse_filters(request.args, fiscal_start_month=current_app.config['FISCAL_YEAR_START_MONTH'])
+    except (ValueError, TypeError, KeyError) as e:
+        flash(f'匯出條件格式錯誤：{e}', 'danger')
+        return redirect(url_for('petty_cash.report_expense_by_category'))
+
+    period = filters['period']
+    suffix = f'{period.start:%Y%m%d}-{period.end_inclusive:%Y%m%d}' if period else 'all'
+    return Response(
+        stream_with_context(generate_export(fmt, export_query(**filters))),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename=transactions_{suffix}.{fmt}'},
+    )
+
+
+# 匯入結果頁面最多列出的錯誤筆數
+IMPORT_ERROR_DISPLAY_LIMIT = 200
+
+@petty_cash_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+@manager_required
+def import_transactions():
+    """上傳 CSV/XLSX 批次匯入支出單"""
+    form = ImportForm()
+    result = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            result = import_expenditures(upload.stream, upload.filename, current_user.id)
+        except ImportFileError as e:
+            flash(f'匯入失敗：{e}', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'匯入中斷，錯誤：{e}', 'danger')
+        else:
+            flash(f'匯入完成：新增 {result.transactions} 張支出單、{result.items} 筆明細。', 'success')
+            if result.errors:
+                flash(f'有 {len(result.errors)} 張支出單未通過驗證，已略過。', 'warning')
+    else:
+        _flash_form_errors(form)
+
+    return render_template('import_transactions.html', form=form, result=result, columns=COLUMNS,
+                           required_columns=REQUIRED_COLUMNS, error_limit=IMPORT_ERROR_DISPLAY_LIMIT)
+
+
 @petty_cash_bp.route('/categories')
 @login_required
 @manager_required
@@ -611,7 +875,8 @@ def delete_category(category_id):
     """刪除費用分類"""
     category_to_delete = db.session.get(Category, category_id)
     if category_to_delete:
-        if category_to_delete.items:
+        in_use = db.session.query(Transaction.id).filter_by(category_id=category_id).first()
+        if in_use:
             flash('錯誤：無法刪除此分類，因為已有支出項目正在使用它。', 'danger')
         else:
             db.session.delete(category_to_delete)
@@ -622,48 +887,60 @@ def delete_category(category_id):
     return redirect(url_for('petty_cash.category_management'))
 
 # 報表用 #
+
+REPORT_COMPARE_OPTIONS = {
+    '': '不比較',
+    'monthly': '逐月並列',
+    'yoy': '與去年同期比較',
+}
+
+def _report_columns():
+    """
+    解析報表的期間參數，回傳 (主要期間, 比較方式, 並列的期間清單)。
+    ?compare=monthly 將主要期間逐月拆開並列，?compare=yoy 則並列去年同期與本期。
+    """
+    compare = request.args.get('compare', '')
+    try:
+        period = Period.from_args(request.args, fiscal_start_month=current_app.config['FISCAL_YEAR_START_MONTH'])
+    except (ValueError, TypeError, KeyError):
+        period = Period.month(date.today().year, date.today().month)
+        flash('日期參數格式錯誤，已顯示當前月份報表。', 'warning')
+
+    if compare == 'yoy':
+        return period, compare, [period.shift_years(-1), period]
+    if compare == 'monthly' and period.is_month_aligned:
+        return period, compare, period.split_months()
+    return period, '', [period]
+
 @petty_cash_bp.route('/reports/expense_by_category', methods=['GET'])
 @login_required
 @manager_required
 def report_expense_by_category():
     """費用分類報表頁面"""
-    try:
-        year = int(request.args.get('year', date.today().year))
-        month = int(request.args.get('month', date.today().month))
-    except (ValueError, TypeError):
-        year = date.today().year
-        month = date.today().month
-        flash('日期參數格式錯誤，已顯示當前月份報表。', 'warning')
+    period, compare, columns = _report_columns()
+    page = ConditionalPage(
+        'report_expense_by_category', sorted(request.args.items(multi=True)), period, *_report_versions()
+    )
+    not_modified = page.not_modified()
+    if not_modified:
+        return not_modified
 
-    # --- ▼▼▼ 修改點 4：修改報表查詢邏輯 ▼▼▼ ---
-    # 現在直接從 Transaction 查詢，不再需要經過 TransactionItem
-    report_data_query = db.session.query(
-        Category.name,
-        func.sum(Transaction.total_amount).label('total_spent')
-    ).join(Transaction.category).filter(
-        Transaction.transaction_type == TransactionType.EXPENDITURE,
-        Transaction.status == ApprovalStatus.APPROVED,
-        extract('year', Transaction.transaction_date) == year,
-        extract('month', Transaction.transaction_date) == month
-    ).group_by(Category.name).order_by(
-        func.sum(Transaction.total_amount).desc()
-    ).all()
-
-    # 報表金額應為正數
-    total_expense = -sum(item.total_spent for item in report_data_query)
-    
-    chart_labels = [item[0] for item in report_data_query]
-    chart_values = [float(-item[1]) for item in report_data_query]
+    # 所有並列期間只需一次查詢；整月期間直接讀取每月分類彙總表
+    results = category_totals_by_period(columns, ApprovalStatus.APPROVED, TransactionType.EXPENDITURE)
+    # 主要期間的金額：比較去年同期時取本期，其餘為各欄合計；報表金額應為正數
+    report_data = [(name, -(amounts[-1] if compare == 'yoy' else sum(amounts))) for name, amounts in results]
+    report_data = [(name, amount) for name, amount in report_data if amount]
+
+    total_expense = sum(amount for _, amount in report_data)
 
     chart_data = {
-        'labels': json.dumps(chart_labels, ensure_ascii=False),
-        'values': json.dumps(chart_values)
+        'labels': json.dumps([name for name, _ in report_data], ensure_ascii=False),
+        'values': json.dumps([float(amount) for _, amount in report_data])
     }
 
     table_data = []
     if total_expense > 0:
-        for category_name, total_spent in report_data_query:
-            amount = -total_spent
+        for category_name, amount in report_data:
             percentage = (amount / total_expense * 100)
             table_data.append({
                 'category': category_name,
@@ -671,11 +948,39 @@ def report_expense_by_category():
                 'percentage': f"{percentage:.2f}%"
             })
 
-    return render_template(
+    comparison = None
+    if len(columns) > 1:
+        comparison = {
+            'headers': [column.label for column in columns],
+            'rows': [(name, [-amount for amount in amounts]) for name, amounts in results],
+            'totals': [-sum(amounts[index] for _, amounts in results) for index in range(len(columns))],
+        }
+
+    return page.respond(render_template(
         'report_expense_by_category.html',
-        year=year,
-        month=month,
+        period=period,
+        compare=compare,
+        period_kinds=PERIOD_KINDS,
+        compare_options=REPORT_COMPARE_OPTIONS,
         total_expense=total_expense,
         table_data=table_data,
-        chart_data=chart_data
-    )
\ No newline at end of file
+        chart_data=chart_data,
+        comparison=comparison
+    ))
+
+@petty_cash_bp.route('/reports/expense_by_category.json', methods=['GET'])
+@login_required
+@manager_required
+def report_expense_by_category_data():
+    """費用分類報表資料 (JSON)，參數與報表頁面相同，金額為正數"""
+    _, _, columns = _report_columns()
+    results = category_totals_by_period(columns, ApprovalStatus.APPROVED, TransactionType.EXPENDITURE)
+    return jsonify({
+        'periods': [
+            {'label': column.label, 'start': column.start.isoformat(), 'end': column.end_inclusive.isoformat()}
+            for column in columns
+        ],
+        'categories': [
+            {'name': name, 'amounts': [str(-amount) for amount in amounts]} for name, amounts in results
+        ],
+    })
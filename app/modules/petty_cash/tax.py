@@ -0,0 +1,32 @@
+"""
+稅額計算
+
+新增、編輯支出單與批次匯入共用，依稅別與計稅方式由未稅或含稅金額算出未稅額、稅額與總金額。
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from .models import TaxType, TaxCalculationMethod
+
+# 營業稅稅率
+TAX_RATE = Decimal('0.05')
+
+
+def calculate_tax_and_total(base_amount, tax_type_str, tax_calc_method_str):
+    """根據稅別和計稅方式計算稅後金額，回傳 (未稅額, 稅額, 總金額)"""
+    subtotal, tax, total_amount = Decimal('0.0'), Decimal('0.0'), Decimal('0.0')
+
+    if tax_type_str == TaxType.TAXABLE.name:
+        if tax_calc_method_str == TaxCalculationMethod.INCLUSIVE.name:
+            total_amount = base_amount
+            # 內含稅的未稅額由總金額反算
+            subtotal = (total_amount / (1 + TAX_RATE)).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+            tax = total_amount - subtotal
+        else: # 稅外加；沒有選擇計稅方式時也視為稅外加
+            subtotal = base_amount
+            tax = (subtotal * TAX_RATE).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+            total_amount = subtotal + tax
+    else: # 免稅或零稅率
+        subtotal = base_amount
+        tax = Decimal('0.0')
+        total_amount = base_amount
+
+    return subtotal, tax, total_amount
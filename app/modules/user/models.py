@@ -1,16 +1,15 @@
 import enum
-from app import db, login_manager, bcrypt  # 1. bcrypt 已在這裡，很好！
+from flask import current_app
+from app import db, login_manager
+from app.cache import TTLCache, bump_version
+from . import passwords
 from flask_login import UserMixin
-# from werkzeug.security import generate_password_hash, check_password_hash  # 2. 我們不再需要 werkzeug 了，可以刪除
+from sqlalchemy import event, inspect
 
 class UserRole(enum.Enum):
     USER = '一般使用者'
     MANAGER = '主管'
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -19,23 +18,87 @@ class User(UserMixin, db.Model):
     display_name = db.Column(db.String(100), nullable=False, comment='顯示用姓名 (例如: 施宏岳)')
 
     email = db.Column(db.String(120), index=True, unique=True, nullable=False)
-    # 3. 將長度設為 60，這是 bcrypt 雜湊值的標準長度
+    # bcrypt 雜湊值的標準長度為 60
     password_hash = db.Column(db.String(60), nullable=False) 
     role = db.Column(db.Enum(UserRole), nullable=False, default=UserRole.USER, server_default=UserRole.USER.name)
 
-    # --- ▼▼▼ 4. 修改點：將密碼設定函式改用 bcrypt ▼▼▼ ---
     def set_password(self, password):
-        """使用 bcrypt 來加密密碼"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        """使用 bcrypt 來加密密碼 (成本依 BCRYPT_LOG_ROUNDS 設定)"""
+        self.password_hash = passwords.hash_password(password)
 
-    # --- ▼▼▼ 5. 修改點：將密碼檢查函式改用 bcrypt ▼▼▼ ---
     def check_password(self, password):
         """使用 bcrypt 來驗證密碼"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return passwords.check_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """密碼雜湊的成本低於目前設定時為 True (登入成功時重新雜湊)"""
+        return passwords.needs_rehash(self.password_hash)
+
+    def is_manager(self):
+        """檢查使用者角色是否為主管"""
+        return self.role == UserRole.MANAGER
+
+    def __repr__(self):
+        return f'<User {self.display_name}>'
+
+
+class UserSnapshot(UserMixin):
+    """
+    current_user 使用的唯讀使用者資料 (不屬於任何 session，不會觸發查詢)。
+    只包含權限判斷與頁面顯示需要的欄位；需要 email 等其他欄位時請另外查詢 User。
+    """
+    FIELDS = ('id', 'account_id', 'display_name', 'role')
+
+    def __init__(self, user):
+        for name in self.FIELDS:
+            object.__setattr__(self, name, getattr(user, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserSnapshot 為唯讀資料，請修改 User 物件')
 
     def is_manager(self):
         """檢查使用者角色是否為主管"""
         return self.role == UserRole.MANAGER
 
     def __repr__(self):
-        return f'<User {self.display_name}>'
\ No newline at end of file
+        return f'<UserSnapshot {self.display_name}>'
+
+
+# 頁面上顯示的使用者資料 (姓名、角色) 的版本號，明細頁的 ETag 以此判斷姓名是否改過
+USER_VERSION = 'users'
+
+
+@event.listens_for(User, 'after_update')
+def _bump_user_version(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in UserSnapshot.FIELDS):
+        bump_version(USER_VERSION, connection)
+
+
+def _user_cache():
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault('user_cache', TTLCache(
+            maxsize=current_app.config['USER_CACHE_SIZE'], ttl=current_app.config['USER_CACHE_TTL']
+        ))
+    return cache
+
+
+def invalidate_user(user_id):
+    """新增或修改使用者後呼叫；其他 worker 的快取在 USER_CACHE_TTL 秒內到期"""
+    _user_cache().pop(int(user_id))
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    """每個已登入的請求都會呼叫；快取命中時不查詢資料庫"""
+    user_id = int(user_id)
+    cache = _user_cache()
+    snapshot = cache.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user)
+        cache.set(user_id, snapshot)
+    return snapshot
@@ -0,0 +1,48 @@
+"""
+密碼雜湊
+
+bcrypt 的成本 (log rounds) 由 BCRYPT_LOG_ROUNDS 設定，每加 1 計算時間加倍；測試環境使用最低的 4。
+以舊成本儲存的雜湊會在登入成功時以目前的成本重新計算 (needs_rehash)。
+
+bcrypt 計算期間會釋放 GIL，同一個 worker 的其他執行緒仍可繼續處理請求，但每次雜湊都會佔滿一顆 CPU。
+早上大量登入時，為了不讓雜湊把 CPU 全部佔走，每個行程同時進行的雜湊數以
+PASSWORD_HASH_CONCURRENCY 限制，超過的登入請求排隊等候，其他頁面不受影響。
+"""
+import threading
+from flask import current_app
+from app import bcrypt
+
+
+def _hash_slots():
+    slots = current_app.extensions.get('password_hash_slots')
+    if slots is None:
+        slots = current_app.extensions.setdefault(
+            'password_hash_slots', threading.BoundedSemaphore(current_app.config['PASSWORD_HASH_CONCURRENCY'])
+        )
+    return slots
+
+
+def hash_password(password, rounds=None):
+    """以目前設定的成本 (或指定的 rounds) 產生雜湊字串"""
+    rounds = rounds or current_app.config['BCRYPT_LOG_ROUNDS']
+    with _hash_slots():
+        return bcrypt.generate_password_hash(password, rounds).decode('utf-8')
+
+
+def check_password(password_hash, password):
+    with _hash_slots():
+        return bcrypt.check_password_hash(password_hash, password)
+
+
+def hash_rounds(password_hash):
+    """雜湊字串中記錄的成本 ($2b$12$... 的 12)；格式不符時回傳 None"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    """只往上調整：成本低於 BCRYPT_LOG_ROUNDS 時為 True；設定值較低 (例如測試設定) 時不會把既有的雜湊降級"""
+    rounds = hash_rounds(password_hash)
+    return rounds is not None and rounds < current_app.config['BCRYPT_LOG_ROUNDS']
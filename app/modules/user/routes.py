@@ -1,7 +1,8 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, current_user, login_required
-from app import db, bcrypt
-from .models import User, UserRole
+from app import db
+from .models import User, UserRole, invalidate_user
+from .passwords import hash_password
 # 1. 導入我們需要的所有表單
 from .forms import LoginForm, AddUserForm, EditUserForm
 from functools import wraps
@@ -33,6 +34,13 @@ def login():
         user = User.query.filter_by(account_id=form.account_id.data).first()
         # 3. 修正 login_user 的一個小筆誤 (remember_me -> remember)
         if user and user.check_password(form.password.data):
+            if user.password_needs_rehash():
+                # 以舊成本儲存的密碼，趁知道明文時以目前的成本重新雜湊；失敗時不影響登入
+                try:
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
             login_user(user, remember=form.remember.data)
             next_page = request.args.get('next')
             flash('登入成功！', 'success')
@@ -73,7 +81,7 @@ def add_user():
     form = AddUserForm()
     if form.validate_on_submit():
         try:
-            hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+            hashed_password = hash_password(form.password.data)
             new_user = User(
                 account_id=form.account_id.data,
                 display_name=form.display_name.data,
@@ -84,6 +92,7 @@ def add_user():
             )
             db.session.add(new_user)
             db.session.commit()
+            invalidate_user(new_user.id)
             flash(f'已成功建立新使用者：{form.display_name.data}！', 'success')
             return redirect(url_for('user.user_list'))
         except Exception as e:
@@ -115,6 +124,7 @@ def edit_user(user_id):
             user_to_edit.email = form.email.data
             user_to_edit.role = UserRole[form.role.data]
             db.session.commit()
+            invalidate_user(user_to_edit.id)
             flash('使用者資訊已成功更新！', 'success')
             return redirect(url_for('user.user_list'))
         except Exception as e:
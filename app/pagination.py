@@ -0,0 +1,130 @@
+"""
+Keyset (seek) 分頁
+
+.paginate() 每一頁都要 COUNT(*) 再 OFFSET n，越後面的頁面越慢。
+這裡改以上一頁最後一筆資料的排序鍵作為游標，用
+WHERE (排序鍵) < (游標值) ORDER BY ... LIMIT n 直接從索引定位，任何一頁的成本都相同。
+游標以 base64 編碼後放在查詢字串 (?cursor=...) 中，對使用者而言是不透明的字串。
+需要總筆數時只在第一頁 COUNT 一次，之後放在游標中帶到下一頁，翻頁時不再重新計算。
+"""
+import base64
+import json
+from datetime import date, datetime
+from flask import request
+from sqlalchemy import tuple_
+
+NEXT = 'n'
+PREV = 'p'
+
+
+class InvalidCursor(ValueError):
+    """游標格式錯誤或已無法解析"""
+
+
+def _dump_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, raw):
+    python_type = column.type.python_type
+    if raw is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(raw)
+    if python_type is date:
+        return date.fromisoformat(raw)
+    return python_type(raw)
+
+
+def encode_cursor(direction, values, total=None):
+    data = [direction, [_dump_value(v) for v in values]]
+    if total is not None:
+        data.append(total)
+    payload = json.dumps(data, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """回傳 (方向, 排序鍵的值, 第一頁時的總筆數或 None)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, raw_values, *rest = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        total = rest[0] if rest else None
+        if direction not in (NEXT, PREV) or len(raw_values) != len(columns) or len(rest) > 1:
+            raise InvalidCursor(cursor)
+        if total is not None and (not isinstance(total, int) or isinstance(total, bool) or total < 0):
+            raise InvalidCursor(cursor)
+        return direction, [_load_value(column, raw) for column, raw in zip(columns, raw_values)], total
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+class KeysetPage:
+    """一頁 keyset 分頁結果，介面與樣板中使用的 Pagination 物件相近"""
+
+    def __init__(self, items, columns, has_next, has_prev, total=None):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self._columns = columns
+
+    def _cursor_for(self, direction, item):
+        return encode_cursor(direction, [getattr(item, column.key) for column in self._columns], self.total)
+
+    @property
+    def next_cursor(self):
+        if not self.has_next or not self.items:
+            return None
+        return self._cursor_for(NEXT, self.items[-1])
+
+    @property
+    def prev_cursor(self):
+        if not self.has_prev or not self.items:
+            return None
+        return self._cursor_for(PREV, self.items[0])
+
+
+def keyset_paginate(query, columns, per_page, cursor=None, descending=True, with_total=False):
+    """
+    以 keyset 方式分頁。
+
+    columns 為排序鍵 (最後一個必須是唯一值，例如主鍵)，所有欄位同一個排序方向；
+    query 原有的 ORDER BY 會被取代。with_total=True 時只在第一頁 (沒有游標) 執行一次 COUNT，
+    之後的頁面沿用游標中帶著的數字，因此是第一頁當下的筆數，翻頁期間的新增或刪除不會反映，僅供參考。
+    """
+    direction, values, total = NEXT, None, None
+    if cursor:
+        direction, values, total = decode_cursor(cursor, columns)
+
+    if not with_total:
+        total = None
+    elif total is None:
+        total = query.order_by(None).count()
+
+    # 往前翻頁時反轉排序方向，取回後再倒序回來
+    scan_descending = descending if direction == NEXT else not descending
+    page_query = query.order_by(None)
+    if values is not None:
+        key, bound = tuple_(*columns), tuple_(*values)
+        page_query = page_query.filter(key < bound if scan_descending else key > bound)
+    order_by = [column.desc() if scan_descending else column.asc() for column in columns]
+    rows = page_query.order_by(*order_by).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == NEXT:
+        return KeysetPage(rows, columns, has_next=has_more, has_prev=values is not None, total=total)
+    rows.reverse()
+    return KeysetPage(rows, columns, has_next=True, has_prev=has_more, total=total)
+
+
+def keyset_paginate_request(query, columns, per_page, descending=True, with_total=False):
+    """從 request 的 ?cursor= 取得游標並分頁；游標無效時回到第一頁"""
+    cursor = request.args.get('cursor')
+    try:
+        return keyset_paginate(query, columns, per_page, cursor, descending, with_total)
+    except InvalidCursor:
+        return keyset_paginate(query, columns, per_page, None, descending, with_total)
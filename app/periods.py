@@ -0,0 +1,142 @@
+"""
+報表期間
+
+所有期間都表示成半開區間 [start, end)，查詢時編譯成
+date_column >= start AND date_column < end，可以直接使用日期索引，
+不必再對每一列做 extract(year/month)。
+"""
+from datetime import date
+from sqlalchemy import and_
+
+PERIOD_KINDS = {
+    'month': '月',
+    'quarter': '季',
+    'vat': '營業稅期 (雙月)',
+    'fiscal': '會計年度',
+    'range': '自訂區間',
+}
+
+
+def _add_months(day, months):
+    index = day.year * 12 + (day.month - 1) + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _shift_years(day, years):
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:  # 2 月 29 日
+        return day.replace(year=day.year + years, day=28)
+
+
+class Period:
+    """一段報表期間，start 含、end 不含"""
+
+    def __init__(self, start, end, label):
+        if end <= start:
+            raise ValueError('期間結束日必須晚於開始日')
+        self.start = start
+        self.end = end
+        self.label = label
+
+    def __repr__(self):
+        return f'<Period {self.label} [{self.start}, {self.end})>'
+
+    def __eq__(self, other):
+        return isinstance(other, Period) and (self.start, self.end) == (other.start, other.end)
+
+    def __hash__(self):
+        return hash((self.start, self.end))
+
+    # --- 建構 ---
+
+    @classmethod
+    def month(cls, year, month):
+        start = date(year, month, 1)
+        return cls(start, _add_months(start, 1), f'{year}年{month}月')
+
+    @classmethod
+    def quarter(cls, year, quarter):
+        if not 1 <= quarter <= 4:
+            raise ValueError('季別必須介於 1 到 4')
+        start = date(year, (quarter - 1) * 3 + 1, 1)
+        return cls(start, _add_months(start, 3), f'{year}年Q{quarter}')
+
+    @classmethod
+    def vat_period(cls, year, number):
+        """營業稅申報期：每兩個月一期，第 1 期為 1-2 月，第 6 期為 11-12 月"""
+        if not 1 <= number <= 6:
+            raise ValueError('營業稅期別必須介於 1 到 6')
+        start = date(year, number * 2 - 1, 1)
+        return cls(start, _add_months(start, 2), f'{year}年{start.month}-{start.month + 1}月')
+
+    @classmethod
+    def fiscal_year(cls, year, start_month=1):
+        """會計年度；start_month 不是 1 月時，以開始的那一年命名"""
+        start = date(year, start_month, 1)
+        label = f'{year}年度' if start_month == 1 else f'{year}年度 ({year}/{start_month} 起)'
+        return cls(start, _add_months(start, 12), label)
+
+    @classmethod
+    def between(cls, start, end_inclusive):
+        """自訂區間，結束日含當天"""
+        end = date.fromordinal(end_inclusive.toordinal() + 1)
+        return cls(start, end, f'{start:%Y-%m-%d} ~ {end_inclusive:%Y-%m-%d}')
+
+    @classmethod
+    def from_args(cls, args, today=None, fiscal_start_month=1):
+        """
+        從查詢字串建立期間：?period=month|quarter|vat|fiscal|range
+        搭配 year、month、quarter、vat、start、end 參數，缺少的參數以今天補上。
+        格式錯誤時丟出 ValueError。
+        """
+        today = today or date.today()
+        kind = args.get('period', 'month')
+        year = int(args.get('year', today.year))
+        if kind == 'month':
+            return cls.month(year, int(args.get('month', today.month)))
+        if kind == 'quarter':
+            return cls.quarter(year, int(args.get('quarter', (today.month - 1) // 3 + 1)))
+        if kind == 'vat':
+            return cls.vat_period(year, int(args.get('vat', (today.month + 1) // 2)))
+        if kind == 'fiscal':
+            return cls.fiscal_year(year, fiscal_start_month)
+        if kind == 'range':
+            return cls.between(date.fromisoformat(args['start']), date.fromisoformat(args['end']))
+        raise ValueError(f'不支援的期間類型：{kind}')
+
+    # --- 衍生期間 ---
+
+    def shift_years(self, years):
+        """往前/後平移整數年 (例如去年同期)"""
+        start, end = _shift_years(self.start, years), _shift_years(self.end, years)
+        if not self.is_month_aligned:
+            return Period.between(start, date.fromordinal(end.toordinal() - 1))
+        return Period(start, end, self.label.replace(str(self.start.year), str(start.year)))
+
+    def split_months(self):
+        """切成逐月的期間；只適用於月初到月初的期間"""
+        if not self.is_month_aligned:
+            raise ValueError('只有以整月為單位的期間可以逐月拆分')
+        periods, current = [], self.start
+        while current < self.end:
+            periods.append(Period.month(current.year, current.month))
+            current = _add_months(current, 1)
+        return periods
+
+    # --- 查詢 ---
+
+    @property
+    def is_month_aligned(self):
+        return self.start.day == 1 and self.end.day == 1
+
+    @property
+    def end_inclusive(self):
+        return date.fromordinal(self.end.toordinal() - 1)
+
+    def predicate(self, column):
+        """可使用索引的區間條件"""
+        return and_(column >= self.start, column < self.end)
+
+    def contains(self, day):
+        return self.start <= day < self.end
@@ -0,0 +1,151 @@
+"""
+worker 冷啟動
+
+部署或 worker 因 max_requests 重啟後，第一個請求要等待 import、create_app() 與模板編譯。
+
+- 模板編譯結果 (bytecode) 存放在 JINJA_BYTECODE_CACHE_DIR (預設 instance/jinja_cache，不納入版本控制)，
+  新的 worker 直接載入，不必重新編譯；模板內容改變時 Jinja 以原始碼的雜湊判斷，自動重新編譯
+- TEMPLATE_WARMUP 開啟時在 create_app() 內預先載入所有模板，第一個請求不必等待
+
+    flask startup profile   在新的子行程中量測 import、create_app()、模板預熱與第一個請求的時間，並列出最慢的 import
+    flask startup check     冷啟動時間超過 STARTUP_BUDGET_MS 時以非零狀態結束 (部署前檢查)
+"""
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+startup_cli = AppGroup('startup', help='worker 冷啟動時間')
+
+# 子行程：量測各階段的毫秒數並以 JSON 輸出到 stdout (import 明細由 -X importtime 輸出到 stderr)
+_COLD_START_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1] or None)
+created = time.perf_counter()
+client = app.test_client()
+status = client.get(sys.argv[2]).status_code
+first = time.perf_counter()
+client.get(sys.argv[2])
+second = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (first - created) * 1000,
+    'warm_request_ms': (second - first) * 1000,
+    'total_ms': (first - started) * 1000,
+    'status': status,
+}))
+'''
+# 第一個請求：不需登入、不查詢資料庫，但會渲染 base.html
+PROBE_PATH = '/user/login'
+
+_IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def init_template_cache(app):
+    """在 jinja_env 建立前設定 bytecode 快取目錄；JINJA_BYTECODE_CACHE_DIR 為空字串時不使用"""
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if directory is None:
+        directory = app.config['JINJA_BYTECODE_CACHE_DIR'] = os.path.join(app.instance_path, 'jinja_cache')
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(directory)}
+
+
+def warm_templates(app):
+    """載入 (並編譯) 所有 .html 模板，回傳模板數"""
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def measure_cold_start(config_name='', path=PROBE_PATH):
+    """在新的 Python 子行程中量測一次冷啟動，回傳 (各階段毫秒數 dict, -X importtime 的輸出)"""
+    project_root = os.path.dirname(current_app.root_path)
+    env = dict(os.environ)
+    # 子行程與 web worker 相同，不是由 flask 指令啟動
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _COLD_START_PROBE, config_name, path],
+        cwd=project_root, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else '子行程執行失敗')
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_output, limit=15, max_depth=1):
+    """-X importtime 輸出中累計時間最長的模組 [(毫秒, 模組名)]；max_depth 為巢狀深度 (0 為最外層)"""
+    entries = []
+    for line in importtime_output.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match and len(match.group(3)) // 2 <= max_depth:
+            entries.append((int(match.group(2)) / 1000, match.group(4)))
+    return sorted(entries, reverse=True)[:limit]
+
+
+def _clear_bytecode_cache():
+    directory = current_app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if directory and os.path.isdir(directory):
+        shutil.rmtree(directory)
+
+
+def _echo_run(label, timings):
+    click.echo(
+        f'{label:14} import {timings["import_ms"]:>7.1f}ms  create_app {timings["create_app_ms"]:>6.1f}ms  '
+        f'第一個請求 {timings["first_request_ms"]:>6.1f}ms  (之後 {timings["warm_request_ms"]:.1f}ms)  '
+        f'合計 {timings["total_ms"]:>7.1f}ms  HTTP {timings["status"]}'
+    )
+
+
+@startup_cli.command('profile')
+@click.option('--imports', 'import_limit', default=15, show_default=True, help='列出最慢的 import 數')
+def profile_command(import_limit):
+    """量測冷啟動各階段時間 (bytecode 快取清空與已建立各一次) 與最慢的 import"""
+    started = time.perf_counter()
+    _clear_bytecode_cache()
+    try:
+        cold, _ = measure_cold_start()
+        cached, importtime = measure_cold_start()
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        raise click.ClickException(f'量測失敗：{e}')
+    config = current_app.config
+    click.echo(f'模板預熱 {"開啟" if config["TEMPLATE_WARMUP"] else "關閉"}、'
+               f'bytecode 快取 {config["JINJA_BYTECODE_CACHE_DIR"] or "關閉"}')
+    _echo_run('無 bytecode 快取', cold)
+    _echo_run('有 bytecode 快取', cached)
+    click.echo('最慢的 import (累計)：')
+    for elapsed_ms, module in slowest_imports(importtime, import_limit):
+        click.echo(f'  {elapsed_ms:>8.1f}ms  {module}')
+    click.echo(f'耗時 {time.perf_counter() - started:.1f} 秒。')
+
+
+@startup_cli.command('check')
+@click.option('--runs', default=3, show_default=True, help='量測次數，取中位數')
+@click.option('--budget-ms', type=float, help='冷啟動 (import + create_app + 第一個請求) 上限，預設為 STARTUP_BUDGET_MS')
+def check_command(runs, budget_ms):
+    """冷啟動時間超過預算時以非零狀態結束"""
+    budget_ms = budget_ms or current_app.config['STARTUP_BUDGET_MS']
+    try:
+        totals = [measure_cold_start()[0]['total_ms'] for _ in range(runs)]
+    except (RuntimeError, subprocess.TimeoutExpired) as e:
+        raise click.ClickException(f'量測失敗：{e}')
+    median = statistics.median(totals)
+    over = median > budget_ms
+    click.echo(f'[{"超出預算" if over else "OK"}] 冷啟動中位數 {median:.1f}ms / 預算 {budget_ms:.0f}ms '
+               f'({", ".join(f"{total:.0f}" for total in totals)})')
+    if over:
+        raise SystemExit(1)
@@ -0,0 +1,96 @@
+// 交易異動輪詢：以 changes?since=<游標> 取回較新的異動，就地更新列、待簽核筆數與餘額
+document.addEventListener("DOMContentLoaded", function () {
+    const feed = document.getElementById("changeFeed");
+    const tbody = document.querySelector("[data-change-rows]");
+    if (!feed || !tbody) return;
+
+    const url = feed.dataset.url;
+    const insert = feed.dataset.insert; // prepend / append / none：新的列要插入的位置
+    const interval = (parseFloat(feed.dataset.interval) || 15) * 1000;
+    let cursor = feed.dataset.cursor || "0";
+    let timer = null;
+    let inFlight = false;
+
+    function showNotice() {
+        const notice = document.querySelector("[data-change-notice]");
+        if (notice) notice.classList.remove("d-none");
+    }
+
+    function toRow(html) {
+        const template = document.createElement("template");
+        template.innerHTML = html.trim();
+        return template.content.firstElementChild;
+    }
+
+    function applyRows(rows) {
+        Object.entries(rows).forEach(([id, html]) => {
+            const existing = tbody.querySelector(`tr[data-transaction-id="${id}"]`);
+            if (html === null) {
+                // 已刪除，或已不屬於這個列表 (例如簽核儀表板上已核准的申請)
+                if (existing) existing.remove();
+                return;
+            }
+            const row = toRow(html);
+            if (existing) {
+                // 保留勾選狀態
+                const checked = existing.querySelector(".bulk-select:checked");
+                existing.replaceWith(row);
+                if (checked) row.querySelector(".bulk-select").checked = true;
+            } else if (insert === "prepend") {
+                tbody.prepend(row);
+            } else if (insert === "append") {
+                tbody.append(row);
+            }
+        });
+        const empty = tbody.querySelector("[data-change-empty]");
+        if (empty) empty.classList.toggle("d-none", tbody.querySelector("tr[data-transaction-id]") !== null);
+    }
+
+    function applySummary(data) {
+        const pending = document.querySelector("[data-change-pending]");
+        if (pending && data.pending_count !== undefined) pending.textContent = data.pending_count;
+        const balance = document.querySelector("[data-change-balance]");
+        if (balance && data.balance !== undefined) {
+            balance.textContent = "$ " + data.balance;
+            const positive = parseFloat(data.balance) >= 0;
+            balance.classList.toggle("text-success", positive);
+            balance.classList.toggle("text-danger", !positive);
+        }
+    }
+
+    async function poll() {
+        timer = null;
+        if (document.hidden) return; // 分頁在背景時不輪詢，回到前景時再繼續
+        inFlight = true;
+        try {
+            const response = await fetch(`${url}&since=${encodeURIComponent(cursor)}`, {
+                headers: { Accept: "application/json" },
+                credentials: "same-origin",
+            });
+            if (!response.ok) throw new Error(response.status);
+            const data = await response.json();
+            cursor = String(data.cursor);
+            if (data.reset) {
+                showNotice();
+            } else if (data.changes.length) {
+                applyRows(data.rows || {});
+                applySummary(data);
+                document.dispatchEvent(new CustomEvent("changefeed:updated", { detail: data }));
+            }
+            if (data.more) {
+                timer = setTimeout(poll, 0);
+                return;
+            }
+        } catch (error) {
+            // 連線失敗時等下一輪再試
+        } finally {
+            inFlight = false;
+        }
+        timer = setTimeout(poll, interval);
+    }
+
+    document.addEventListener("visibilitychange", function () {
+        if (!document.hidden && timer === null && !inFlight) poll();
+    });
+    timer = setTimeout(poll, interval);
+});
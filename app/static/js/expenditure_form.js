@@ -58,7 +58,12 @@ document.addEventListener("DOMContentLoaded", function () {
     // --- 事件處理函式 ---
     function addNewItem() {
         if (!itemTemplate) return;
-        let index = itemsContainer.children.length;
+        // 以現有最大索引加一，避免刪除中間的列後與既有明細 (含隱藏的明細 ID) 撞號
+        let index = 0;
+        itemsContainer.querySelectorAll('[name^="items-"]').forEach((input) => {
+            const match = input.name.match(/^items-(\d+)-/);
+            if (match) index = Math.max(index, parseInt(match[1], 10) + 1);
+        });
         let newRowHtml = itemTemplate.innerHTML.replace(/__prefix__/g, index);
         itemsContainer.insertAdjacentHTML("beforeend", newRowHtml);
     }
@@ -3,4 +3,5 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
+    # 僅供開發使用；正式環境請執行 python serve.py
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+正式環境啟動程式
+
+run.py 是 Werkzeug 開發伺服器 (單一程序、debug 模式)，不可用於正式環境。
+這裡以多程序 + 多執行緒的 WSGI 伺服器提供 create_app()：
+
+- Linux / macOS：gunicorn，多個 worker 程序分散到各個 CPU 核心。
+  送出 SIGHUP 給主程序 (kill -HUP <pid>) 即可平順重新載入：先啟動載入新程式碼的 worker，
+  舊 worker 處理完手上的請求後才結束；SIGTERM 則等待處理中的請求後關閉。
+- Windows：gunicorn 無法執行，改用 waitress (單一程序、多執行緒)。
+
+設定 (環境變數)：
+    BIND                  監聽位址，預設 0.0.0.0:8000
+    WEB_WORKERS           worker 程序數，預設 CPU 核心數 x 2 + 1
+    WEB_THREADS           每個 worker 的執行緒數，預設 4
+    WEB_TIMEOUT           單一請求逾時秒數，超過即重啟該 worker，預設 60
+    WEB_GRACEFUL_TIMEOUT  重新載入/關閉時等待處理中請求的秒數，預設 30
+    WEB_KEEPALIVE         keep-alive 連線閒置秒數，預設 5
+    WEB_MAX_REQUESTS      worker 處理多少請求後自動重啟 (避免記憶體緩慢增長)，0 表示不限，預設 1000
+
+用法：python serve.py
+健康檢查：GET /healthz (存活)、GET /readyz (含資料庫連線)
+"""
+import multiprocessing
+import os
+import sys
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def server_options():
+    return {
+        'bind': os.environ.get('BIND', '0.0.0.0:8000'),
+        'workers': _env_int('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1),
+        'threads': _env_int('WEB_THREADS', 4),
+        'timeout': _env_int('WEB_TIMEOUT', 60),
+        'graceful_timeout': _env_int('WEB_GRACEFUL_TIMEOUT', 30),
+        'keepalive': _env_int('WEB_KEEPALIVE', 5),
+        'max_requests': _env_int('WEB_MAX_REQUESTS', 1000),
+    }
+
+
+def serve_gunicorn(options):
+    from gunicorn.app.base import BaseApplication
+
+    class PettyCashApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+            self.cfg.set('worker_class', 'gthread')
+            # 避免所有 worker 同時達到 max_requests 一起重啟
+            self.cfg.set('max_requests_jitter', max(options['max_requests'] // 10, 0))
+            self.cfg.set('accesslog', '-')
+            # 不預先載入：每個 worker 自行 create_app()，SIGHUP 重新載入時才會讀到新的程式碼，
+            # 也不會讓 fork 出來的 worker 共用同一個資料庫連線
+            self.cfg.set('preload_app', False)
+
+        def load(self):
+            from app import create_app
+            return create_app()
+
+    PettyCashApplication().run()
+
+
+def serve_waitress(options):
+    from waitress import serve
+    from app import create_app
+
+    # waitress 只有單一程序，以 worker 數 x 執行緒數維持相同的同時處理量；
+    # 它沒有單一請求逾時，channel_timeout 為連線閒置多久後關閉
+    serve(
+        create_app(),
+        listen=options['bind'],
+        threads=options['threads'] * max(options['workers'], 1),
+        channel_timeout=options['timeout'],
+    )
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('APP_ENV', 'production')
+    options = server_options()
+    try:
+        if sys.platform == 'win32':
+            serve_waitress(options)
+        else:
+            serve_gunicorn(options)
+    except ImportError as e:
+        sys.exit(f'找不到 WSGI 伺服器套件 ({e.name})，請先執行 pip install -r requirements.txt')